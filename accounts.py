@@ -0,0 +1,80 @@
+"""
+Several HDU accounts served by one process.
+
+The config may list account profiles under "accounts", each with its own
+cookies. One process then keeps a VodClient (and so a cookie jar) per
+account, while the connection pool, the download pool and the index of
+local files are shared, so limits such as max_concurrent_downloads hold
+for all accounts together. Files describing one account's view of the
+server (catalog, watch state) are kept per account.
+"""
+
+import os
+
+from vod_api import safe_name
+
+
+def parse_cookies(cookies):
+    """Cookie dict from a dict or a raw "name=value; ..." header string."""
+    if not isinstance(cookies, str):
+        return cookies or {}
+    cookie_dict = {}
+    for item in cookies.split(";"):
+        if "=" in item:
+            k, v = item.split("=", 1)
+            cookie_dict[k.strip()] = v.strip()
+    return cookie_dict
+
+
+def load_profiles(config, cookies, headers):
+    """
+    [(name, cookies, headers)] of the accounts in config.
+
+    Without an "accounts" list the top-level cookies form the only account,
+    which has no name. Profiles fall back to the top-level headers.
+    """
+    entries = config.get("accounts")
+    if not entries:
+        return [(None, cookies, headers)]
+    if not isinstance(entries, list):
+        raise ValueError("'accounts' must be a list of account profiles")
+    profiles = []
+    names = set()
+    for entry in entries:
+        name = entry.get("name") if isinstance(entry, dict) else None
+        if not name or not isinstance(name, str):
+            raise ValueError("Every entry of 'accounts' needs a 'name'")
+        if safe_name(name) in names:
+            raise ValueError(f"Duplicate account name {name!r}")
+        names.add(safe_name(name))
+        profiles.append(
+            (
+                name,
+                parse_cookies(entry.get("cookies", {})),
+                entry.get("headers", headers),
+            )
+        )
+    return profiles
+
+
+def account_file(filename, name):
+    """Per-account variant of a state file name, e.g. .catalog.alice.json."""
+    if not name:
+        return filename
+    base, ext = os.path.splitext(filename)
+    return f"{base}.{safe_name(name)}{ext}"
+
+
+class Account:
+    """One login: its API client and the name its state files go under."""
+
+    def __init__(self, name, api):
+        self.name = name
+        self.api = api
+
+    @property
+    def label(self):
+        return self.name or "default"
+
+    def path(self, directory, filename):
+        return os.path.join(directory, account_file(filename, self.name))
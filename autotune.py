@@ -0,0 +1,241 @@
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+TUNING_FILENAME = ".aria2_tuning.json"
+
+# Connection counts tried by the probe, one measurement window each
+CANDIDATE_CONNECTIONS = [1, 2, 4, 8, 16]
+PROBE_SECONDS = 2.0
+
+# The fewest connections reaching this share of the best throughput win;
+# extra connections for a few percent only add load on the server.
+GOOD_ENOUGH_RATIO = 0.9
+
+MIB = 1024**2
+MAX_MIN_SPLIT_MIB = 1024
+
+# Re-probe a host after this many consecutive downloads slower than
+# DEGRADED_RATIO times the probed throughput, or once the result is old.
+DEGRADED_RATIO = 0.5
+DEGRADED_RUNS = 3
+MAX_AGE_DAYS = 30
+
+# A host whose probe failed (e.g. no range requests) keeps aria2's
+# defaults for this long before it is probed again
+FAILED_PROBE_RETRY_HOURS = 12
+
+# Downloads that moved fewer bytes than this say little about throughput
+MIN_SAMPLE_BYTES = 8 * MIB
+
+# aria2 spellings of the flags the tuning replaces
+TUNED_FLAGS = {
+    "-x": "--max-connection-per-server",
+    "-s": "--split",
+    "-k": "--min-split-size",
+}
+
+
+def url_host(url):
+    return urlparse(url).netloc
+
+
+def strip_flags(args, flags):
+    """Remove short/long aria2 flags (and their values) from an argument list."""
+    long_flags = set(flags.values())
+    result = []
+    skip_value = False
+    for arg in args:
+        if skip_value:
+            skip_value = False
+            continue
+        if arg in flags or arg in long_flags:
+            skip_value = True
+            continue
+        if any(arg.startswith(f"{flag}=") for flag in long_flags):
+            continue
+        if any(arg.startswith(flag) and arg[2:].isalnum() for flag in flags):
+            continue
+        result.append(arg)
+    return result
+
+
+async def _remote_size(client, url):
+    response = await client.get(url, headers={"Range": "bytes=0-0"})
+    total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+    if response.status_code != 206 or not total.isdigit():
+        raise httpx.HTTPError("server does not support range requests")
+    return int(total)
+
+
+async def measure(client, url, size, connections, seconds=PROBE_SECONDS):
+    """Bytes per second of `connections` parallel range requests on one file."""
+    received = 0
+    deadline = time.monotonic() + seconds
+
+    async def pull(offset):
+        nonlocal received
+        headers = {"Range": f"bytes={offset}-"}
+        async with client.stream("GET", url, headers=headers) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+                if time.monotonic() >= deadline:
+                    break
+
+    # Spread the readers over the file like aria2 splits it
+    step = size // connections
+    started = time.monotonic()
+    tasks = [asyncio.ensure_future(pull(i * step)) for i in range(connections)]
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=seconds + 10)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+    return received / max(time.monotonic() - started, 1e-3)
+
+
+def choose_parameters(size, results):
+    """
+    Pick aria2 parameters from {connections: bytes_per_second}.
+
+    Pieces are sized so that every connection gets a few of them; larger
+    pieces mean fewer range requests against a throttling server.
+    """
+    best = max(results.values())
+    connections = min(
+        n for n, speed in results.items() if speed >= best * GOOD_ENOUGH_RATIO
+    )
+    min_split_mib = size // (connections * 4 * MIB)
+    min_split_mib = max(1, min(min_split_mib, MAX_MIN_SPLIT_MIB))
+    return {
+        "connections": connections,
+        "split": connections,
+        "min_split_size": f"{min_split_mib}M",
+        "throughput": results[connections],
+    }
+
+
+async def probe(url, candidates=CANDIDATE_CONNECTIONS, progress=None):
+    """Measure throughput of url at each candidate connection count."""
+    limits = httpx.Limits(max_connections=max(candidates))
+    async with httpx.AsyncClient(
+        verify=False, follow_redirects=True, limits=limits, timeout=15
+    ) as client:
+        size = await _remote_size(client, url)
+        results = {}
+        for connections in candidates:
+            if progress:
+                progress(f"Probing {url_host(url)} with {connections} connections...")
+            results[connections] = await measure(client, url, size, connections)
+    params = choose_parameters(size, results)
+    params["results"] = {str(n): int(speed) for n, speed in results.items()}
+    return params
+
+
+class TuningStore:
+    """
+    Probed aria2 parameters per download host, kept in a small JSON file.
+
+    Downloads report their throughput back; a host that is repeatedly much
+    slower than it was when probed is marked for another probe. A failed
+    probe is stored too, so the host is not probed before every batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hosts = {}
+
+    @classmethod
+    def load(cls, path):
+        store = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                store.hosts = json.load(f).get("hosts", {})
+        except (OSError, ValueError):
+            pass
+        return store
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"hosts": self.hosts}, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def needs_probe(self, host):
+        entry = self.hosts.get(host)
+        if entry is None:
+            return True
+        age = time.time() - entry.get("probed_at", 0)
+        if entry.get("failed"):
+            return age > FAILED_PROBE_RETRY_HOURS * 3600
+        if entry.get("slow_runs", 0) >= DEGRADED_RUNS:
+            return True
+        return age > MAX_AGE_DAYS * 86400
+
+    def set(self, host, params):
+        self.hosts[host] = {**params, "probed_at": time.time(), "slow_runs": 0}
+        self.save()
+
+    def set_failed(self, host, error):
+        """Remember a failed probe; the host uses the default flags meanwhile."""
+        self.hosts[host] = {"failed": True, "error": error, "probed_at": time.time()}
+        self.save()
+
+    def aria2_args(self, host):
+        """Tuned aria2 flags for host, or an empty list if it has no tuning."""
+        entry = self.hosts.get(host)
+        if entry is None or entry.get("failed"):
+            return []
+        return [
+            f"--max-connection-per-server={entry['connections']}",
+            f"--split={entry['split']}",
+            f"--min-split-size={entry['min_split_size']}",
+        ]
+
+    def record_throughput(self, host, bytes_moved, seconds):
+        """Count downloads that ran well below the probed throughput."""
+        entry = self.hosts.get(host)
+        if entry is None or entry.get("failed"):
+            return
+        if bytes_moved < MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        slow = bytes_moved / seconds < entry["throughput"] * DEGRADED_RATIO
+        slow_runs = entry.get("slow_runs", 0) + 1 if slow else 0
+        if slow_runs != entry.get("slow_runs", 0):
+            entry["slow_runs"] = slow_runs
+            self.save()
+
+
+async def ensure_tuned(store, url, notify=None, progress=None):
+    """Probe url's host if it has no usable tuning yet; errors are reported."""
+    host = url_host(url)
+    if store is None or not store.needs_probe(host):
+        return
+    try:
+        params = await probe(url, progress=progress)
+    except (httpx.HTTPError, OSError) as e:
+        store.set_failed(host, str(e))
+        if notify:
+            notify(
+                f"aria2 autotune probe failed: {e}; using the default flags "
+                f"for {FAILED_PROBE_RETRY_HOURS} hours",
+                severity="warning",
+            )
+        return
+    store.set(host, params)
+    if notify:
+        notify(
+            f"Tuned {host}: {params['connections']} connections, "
+            f"{params['min_split_size']} pieces "
+            f"({params['throughput'] / MIB:.1f} MiB/s)"
+        )
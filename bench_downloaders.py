@@ -0,0 +1,455 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from downloader import DownloaderManager
+from mp4clip import make_box
+
+# Repeating body pattern of the synthetic files
+PATTERN = bytes(range(256)) * 4096
+WRITE_CHUNK = 64 * 1024
+
+SYNTHETIC_PATH_RE = re.compile(r"^/synthetic/(\d+)/[\w.-]+\.mp4$")
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+SCENARIOS = {
+    # name: (file count, default file size)
+    "single": (1, 256 * 1024**2),
+    "batch": (50, 8 * 1024**2),
+}
+
+# In-process engine concurrency for batches
+INPROCESS_CONCURRENCY = 8
+
+
+def synthetic_prefix(size):
+    """ftyp box plus a 64-bit mdat header covering the rest of the file."""
+    ftyp = make_box("ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2mp41")
+    mdat = struct.pack(">I4sQ", 1, b"mdat", size - len(ftyp))
+    return ftyp + mdat
+
+
+def synthetic_bytes(size, start, end):
+    """Bytes [start, end) of a synthetic MP4 of the given size."""
+    prefix = synthetic_prefix(size)
+    out = bytearray()
+    if start < len(prefix):
+        out += prefix[start : min(end, len(prefix))]
+        start = len(prefix)
+    while start < end:
+        offset = start % len(PATTERN)
+        take = min(end - start, len(PATTERN) - offset)
+        out += PATTERN[offset : offset + take]
+        start += take
+    return bytes(out)
+
+
+class SyntheticServer:
+    """
+    HTTP/1.1 server for /synthetic/<size>/<name>.mp4 files generated on the fly.
+
+    rate_limit caps each connection in bytes per second, latency delays each
+    response, and ranges=False makes the server ignore Range headers.
+    """
+
+    def __init__(
+        self, host="127.0.0.1", port=0, rate_limit=None, latency=0.0, ranges=True
+    ):
+        self.host = host
+        self.port = port
+        self.rate_limit = rate_limit
+        self.latency = latency
+        self.ranges = ranges
+        self.loop = None
+        self.server = None
+        self._ready = threading.Event()
+
+    def url(self, size, name):
+        return f"http://{self.host}:{self.port}/synthetic/{size}/{name}.mp4"
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, method, target, headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (
+            ConnectionError,
+            ValueError,
+            asyncio.IncompleteReadError,
+            asyncio.CancelledError,
+        ):
+            # Cancelled when the server is stopped with clients still attached
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, method, target, headers, keep_alive):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        match = SYNTHETIC_PATH_RE.match(target.split("?", 1)[0])
+        if method not in ("GET", "HEAD") or not match:
+            writer.write(
+                b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n"
+                + f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+            )
+            await writer.drain()
+            return
+
+        size = int(match.group(1))
+        start, end = 0, size
+        status = "200 OK"
+        extra = "Accept-Ranges: bytes\r\n" if self.ranges else ""
+        range_match = RANGE_RE.match(headers.get("range", ""))
+        if self.ranges and range_match and any(range_match.groups()):
+            first, last = range_match.groups()
+            if first:
+                start = int(first)
+                end = min(int(last) + 1, size) if last else size
+            else:
+                start = max(size - int(last), 0)
+            if start >= size:
+                writer.write(
+                    f"HTTP/1.1 416 Range Not Satisfiable\r\n"
+                    f"Content-Range: bytes */{size}\r\nContent-Length: 0\r\n\r\n".encode()
+                )
+                await writer.drain()
+                return
+            status = "206 Partial Content"
+            extra += f"Content-Range: bytes {start}-{end - 1}/{size}\r\n"
+
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: video/mp4\r\n"
+                f"Content-Length: {end - start}\r\n"
+                f"{extra}"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            ).encode("latin-1")
+        )
+        if method == "HEAD":
+            await writer.drain()
+            return
+
+        started = time.monotonic()
+        sent = 0
+        position = start
+        while position < end:
+            chunk_end = min(position + WRITE_CHUNK, end)
+            writer.write(synthetic_bytes(size, position, chunk_end))
+            sent += chunk_end - position
+            position = chunk_end
+            await writer.drain()
+            if self.rate_limit:
+                ahead = sent / self.rate_limit - (time.monotonic() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle_connection, self.host, self.port)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+        return self
+
+    async def _close(self):
+        self.server.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        if self.loop:
+            asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(10)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def _run_process(argv):
+    """Run argv to completion; returns (returncode, cpu_seconds, max_rss_kib)."""
+    process = subprocess.Popen(
+        argv,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if not hasattr(os, "wait4"):
+        return process.wait(), None, None
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+def _write_list_file(directory, items):
+    list_file = os.path.join(directory, "urls.txt")
+    with open(list_file, "w", encoding="utf-8") as f:
+        for url, filename in items:
+            f.write(f"{url}\n  out={filename}\n")
+    return list_file
+
+
+def aria2c_command(manager, items, destination_dir, work_dir):
+    if len(items) == 1:
+        url, filename = items[0]
+        return manager.build_command("aria2c", url, destination_dir, filename)
+    list_file = _write_list_file(work_dir, items)
+    return ["aria2c", "-i", list_file, "-d", destination_dir] + (
+        manager._aria2_args_with_defaults()
+    )
+
+
+def wget_command(manager, items, destination_dir, work_dir):
+    if len(items) == 1:
+        url, filename = items[0]
+        return manager.build_command("wget", url, destination_dir, filename)
+    list_file = os.path.join(work_dir, "urls.txt")
+    with open(list_file, "w", encoding="utf-8") as f:
+        f.writelines(f"{url}\n" for url, _ in items)
+    return ["wget", "-q", "-c", "--tries=5", "-i", list_file, "-P", destination_dir]
+
+
+def curl_command(manager, items, destination_dir, work_dir):
+    if len(items) == 1:
+        url, filename = items[0]
+        return manager.build_command("curl", url, destination_dir, filename)
+    argv = ["curl", "-L", "-f", "-s", "--retry", "5", "-Z", "--parallel-max", "16"]
+    for url, filename in items:
+        argv += ["-o", os.path.join(destination_dir, filename), url]
+    return argv
+
+
+async def _inprocess_download(items, destination_dir):
+    semaphore = asyncio.Semaphore(INPROCESS_CONCURRENCY)
+
+    async def fetch(client, url, filename):
+        async with semaphore:
+            async with client.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(os.path.join(destination_dir, filename), "wb") as f:
+                    async for chunk in response.aiter_raw():
+                        f.write(chunk)
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        await asyncio.gather(*(fetch(client, url, name) for url, name in items))
+
+
+def run_inprocess(items, destination_dir):
+    """Reference in-process engine (httpx); CPU is measured on this process."""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    before = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+    try:
+        asyncio.run(_inprocess_download(items, destination_dir))
+        returncode = 0
+    except httpx.HTTPError:
+        returncode = 1
+    if not resource:
+        return returncode, None, None
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return returncode, cpu, after.ru_maxrss
+
+
+# name: (executable or None for in-process, command builder)
+BACKENDS = {
+    "aria2c": ("aria2c", aria2c_command),
+    "wget": ("wget", wget_command),
+    "curl": ("curl", curl_command),
+    "inprocess": (None, None),
+}
+
+
+def available_backends(names=None):
+    result = []
+    for name in names or list(BACKENDS) + ["fdm"]:
+        if name == "fdm":
+            # FDM is a GUI download manager without a blocking CLI mode
+            print("Skipping fdm: it cannot be driven headlessly", file=sys.stderr)
+            continue
+        executable, _ = BACKENDS[name]
+        if executable and not shutil.which(executable):
+            print(f"Skipping {name}: not installed", file=sys.stderr)
+            continue
+        result.append(name)
+    return result
+
+
+def run_case(server, manager, backend, scenario, file_size):
+    count = SCENARIOS[scenario][0]
+    items = [
+        (server.url(file_size, f"{scenario}_{i:03d}"), f"{scenario}_{i:03d}.mp4")
+        for i in range(count)
+    ]
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    destination_dir = os.path.join(work_dir, "out")
+    os.makedirs(destination_dir)
+    try:
+        started = time.monotonic()
+        if backend == "inprocess":
+            returncode, cpu, max_rss = run_inprocess(items, destination_dir)
+        else:
+            argv = BACKENDS[backend][1](manager, items, destination_dir, work_dir)
+            returncode, cpu, max_rss = _run_process(argv)
+        wall = time.monotonic() - started
+
+        complete = sum(
+            1
+            for _, filename in items
+            if os.path.exists(os.path.join(destination_dir, filename))
+            and os.path.getsize(os.path.join(destination_dir, filename)) == file_size
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total = file_size * count
+    return {
+        "backend": backend,
+        "scenario": scenario,
+        "files": count,
+        "file_size": file_size,
+        "bytes": total,
+        "wall_seconds": round(wall, 3),
+        "throughput_bytes_per_second": int(total / wall) if wall else None,
+        "cpu_seconds": round(cpu, 3) if cpu is not None else None,
+        "max_rss_kib": max_rss,
+        "returncode": returncode,
+        "complete_files": complete,
+        "ok": returncode == 0 and complete == count,
+    }
+
+
+def format_row(result):
+    speed = result["throughput_bytes_per_second"] or 0
+    cpu = result["cpu_seconds"]
+    rss = result["max_rss_kib"]
+    return (
+        f"{result['backend']:<10} {result['scenario']:<7} "
+        f"{result['wall_seconds']:>8.2f}s {speed / 1024**2:>9.1f} MiB/s "
+        f"{'-' if cpu is None else f'{cpu:.2f}s':>8} "
+        f"{'-' if rss is None else f'{rss / 1024:.0f} MiB':>9} "
+        f"{'ok' if result['ok'] else 'FAILED'}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark download backends against a local synthetic video server"
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(BACKENDS) + ["fdm"],
+        help="Backends to run (default: all installed)",
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--single-size-mib",
+        type=int,
+        default=SCENARIOS["single"][1] // 1024**2,
+        help="File size of the single-file scenario",
+    )
+    parser.add_argument(
+        "--batch-size-mib",
+        type=int,
+        default=SCENARIOS["batch"][1] // 1024**2,
+        help="File size of each file in the batch scenario",
+    )
+    parser.add_argument(
+        "--rate-limit-kib",
+        type=int,
+        default=None,
+        help="Per-connection server rate limit in KiB/s (default: unlimited)",
+    )
+    parser.add_argument(
+        "--latency-ms", type=int, default=0, help="Delay before every response"
+    )
+    parser.add_argument(
+        "--no-ranges", action="store_true", help="Serve without Range support"
+    )
+    parser.add_argument(
+        "--aria2-args",
+        nargs=argparse.REMAINDER,
+        default=None,
+        help="aria2c arguments to benchmark instead of the defaults (must be last)",
+    )
+    parser.add_argument(
+        "--output", help="Write results as JSON to this file ('-' for stdout)"
+    )
+    args = parser.parse_args()
+
+    server = SyntheticServer(
+        rate_limit=args.rate_limit_kib * 1024 if args.rate_limit_kib else None,
+        latency=args.latency_ms / 1000,
+        ranges=not args.no_ranges,
+    ).start()
+    manager = DownloaderManager(aria2_args=args.aria2_args)
+    sizes = {
+        "single": args.single_size_mib * 1024**2,
+        "batch": args.batch_size_mib * 1024**2,
+    }
+
+    results = []
+    print(
+        f"{'backend':<10} {'case':<7} {'wall':>9} {'throughput':>15} "
+        f"{'cpu':>8} {'max rss':>9}",
+        file=sys.stderr,
+    )
+    for backend in available_backends(args.backends):
+        for scenario in args.scenarios:
+            result = run_case(server, manager, backend, scenario, sizes[scenario])
+            results.append(result)
+            print(format_row(result), file=sys.stderr)
+    server.stop()
+
+    report = {
+        "platform": platform.platform(),
+        "server": {
+            "rate_limit_bytes_per_second": server.rate_limit,
+            "latency_seconds": server.latency,
+            "ranges": server.ranges,
+        },
+        "aria2_args": manager._aria2_args_with_defaults(),
+        "results": results,
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
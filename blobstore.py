@@ -0,0 +1,188 @@
+import hashlib
+import os
+import time
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Files touched more recently than this may still be written by a downloader
+SETTLE_SECONDS = 600
+
+# Suffixes of files that are still being downloaded
+PARTIAL_SUFFIXES = (".part", ".aria2", ".tmp", ".dedupe")
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=20)
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    hasher = new_hasher()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class HashingWriter:
+    """File wrapper that feeds every written block into a hasher."""
+
+    def __init__(self, fileobj, hasher):
+        self.fileobj = fileobj
+        self.hasher = hasher
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self.fileobj.write(data)
+
+
+def _is_partial(path):
+    if path.endswith(PARTIAL_SUFFIXES):
+        return True
+    # aria2 keeps a control file next to the download until it completes
+    return os.path.exists(f"{path}.aria2")
+
+
+class BlobStore:
+    """
+    Content-addressed store of downloaded files.
+
+    Each distinct file is kept once as `<root>/<xx>/<digest>`; the
+    human-readable paths under the download directory are hardlinks to it.
+    The store must live on the same filesystem as the download directory.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def ingest(self, path, digest=None):
+        """
+        Link path into the store, replacing it with a hardlink to an
+        existing blob when the content is already stored.
+
+        Returns the digest, or None if the file could not be linked.
+        """
+        if digest is None:
+            digest = hash_file(path)
+        blob = self.blob_path(digest)
+        try:
+            if os.path.exists(blob):
+                if os.path.samefile(blob, path):
+                    return digest
+                temp_path = f"{path}.dedupe"
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                os.link(blob, temp_path)
+                os.replace(temp_path, path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.link(path, blob)
+        except OSError:
+            # Cross-device or no hardlink support; leave the file as is
+            return None
+        return digest
+
+    def _blobs(self):
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.is_file(follow_symlinks=False):
+                    yield entry
+
+    def prune(self):
+        """
+        Delete blobs no download links to any more (a file that was
+        replaced by a rewritten copy). Returns (blobs_removed, bytes_freed).
+        """
+        removed = 0
+        freed = 0
+        for entry in self._blobs():
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_nlink > 1:
+                continue
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            removed += 1
+            freed += stat.st_size
+        return removed, freed
+
+    def dedupe(self, directory, notify=None):
+        """
+        Collapse duplicate files under directory into shared blobs.
+
+        Only files whose size matches another file or a stored blob are
+        hashed. Returns (files_linked, bytes_saved).
+        """
+        store_root = os.path.abspath(self.root)
+        blob_inodes = set()
+        blob_sizes = set()
+        for entry in self._blobs():
+            stat = entry.stat()
+            blob_inodes.add((stat.st_dev, stat.st_ino))
+            blob_sizes.add(stat.st_size)
+
+        by_size = {}
+        now = time.time()
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [
+                d
+                for d in dirnames
+                if os.path.abspath(os.path.join(dirpath, d)) != store_root
+            ]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if _is_partial(path):
+                    continue
+                try:
+                    stat = os.stat(path, follow_symlinks=False)
+                except OSError:
+                    continue
+                if not os.path.isfile(path) or os.path.islink(path):
+                    continue
+                if (stat.st_dev, stat.st_ino) in blob_inodes:
+                    continue
+                if stat.st_size == 0 or now - stat.st_mtime < SETTLE_SECONDS:
+                    continue
+                by_size.setdefault(stat.st_size, []).append(path)
+
+        linked = 0
+        saved = 0
+        # (dev, inode) -> links left of a file that copies were moved off
+        remaining_links = {}
+        for size, paths in by_size.items():
+            if len(paths) < 2 and size not in blob_sizes:
+                continue
+            for path in paths:
+                try:
+                    digest = hash_file(path)
+                    before = os.stat(path)
+                except OSError:
+                    continue
+                if not self.ingest(path, digest):
+                    continue
+                try:
+                    after = os.stat(path)
+                except OSError:
+                    continue
+                # Paths that were already hardlinks of the blob free nothing
+                if (after.st_dev, after.st_ino) == (before.st_dev, before.st_ino):
+                    continue
+                linked += 1
+                old = (before.st_dev, before.st_ino)
+                remaining_links[old] = remaining_links.get(old, before.st_nlink) - 1
+                # The old data is only freed with its last link
+                if remaining_links[old] == 0:
+                    saved += size
+                if notify:
+                    notify(f"Linked duplicate: {path}")
+        return linked, saved
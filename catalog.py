@@ -0,0 +1,153 @@
+import json
+import os
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+CATALOG_FILENAME = ".catalog.json"
+
+# Records of classes that began longer ago than this are treated as final;
+# newer ones (future slots, videos still processing) are re-fetched on sync.
+SETTLE_DAYS = 3
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class Catalog:
+    """
+    On-disk copy of the curriculum records, keyed by record id.
+
+    `high_water_mark` is the newest courBeginTime that was already settled at
+    the last sync; a delta sync only needs records at or after it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self.high_water_mark = None
+
+    @classmethod
+    def load(cls, path):
+        catalog = cls(path)
+        if not os.path.exists(path):
+            return catalog
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return catalog
+        catalog.records = {str(r.get("id")): r for r in data.get("records", [])}
+        catalog.high_water_mark = data.get("high_water_mark")
+        return catalog
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "high_water_mark": self.high_water_mark,
+                    "records": list(self.records.values()),
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(temp_path, self.path)
+
+    def _update_mark(self, now=None):
+        now = now or datetime.now()
+        settled_before = (now - timedelta(days=SETTLE_DAYS)).strftime(TIME_FORMAT)
+        settled = [
+            begin
+            for begin in (r.get("courBeginTime", "") for r in self.records.values())
+            if begin and begin < settled_before
+        ]
+        self.high_water_mark = max(settled) if settled else None
+
+    def replace_all(self, records):
+        self.records = {str(r.get("id")): r for r in records}
+        self._update_mark()
+
+    def apply_delta(self, records):
+        """
+        Merge records fetched since the high-water mark.
+
+        Records at or after the mark that were not returned again are treated
+        as deleted. Returns a list of (old_record, new_record) pairs for every
+        change; either side is None for insertions and deletions.
+        """
+        mark = self.high_water_mark or ""
+        fetched = {str(r.get("id")): r for r in records}
+        changes = []
+
+        for record_id, old in list(self.records.items()):
+            if old.get("courBeginTime", "") >= mark and record_id not in fetched:
+                del self.records[record_id]
+                changes.append((old, None))
+
+        for record_id, new in fetched.items():
+            old = self.records.get(record_id)
+            if old != new:
+                self.records[record_id] = new
+                changes.append((old, new))
+
+        self._update_mark()
+        return changes
+
+
+class CourseIndex:
+    """
+    Records grouped by course and sorted by courBeginTime.
+
+    A date range is answered by bisecting each course's begin times, so
+    changing the range never walks or refetches the records.
+    """
+
+    def __init__(self, records=()):
+        self.times = defaultdict(list)
+        self.records = defaultdict(list)
+        for record in sorted(records, key=lambda r: r.get("courBeginTime") or ""):
+            if record.get("courBeginTime"):
+                course = record.get("subjName", "Unknown Course")
+                self.times[course].append(record["courBeginTime"])
+                self.records[course].append(record)
+
+    def __len__(self):
+        return sum(len(records) for records in self.records.values())
+
+    def courses(self):
+        return list(self.records)
+
+    def add(self, record):
+        begin_time = record.get("courBeginTime")
+        if not begin_time:
+            return
+        course = record.get("subjName", "Unknown Course")
+        index = bisect_right(self.times[course], begin_time)
+        self.times[course].insert(index, begin_time)
+        self.records[course].insert(index, record)
+
+    def remove(self, record):
+        course = record.get("subjName", "Unknown Course")
+        record_id = str(record.get("id"))
+        records = self.records.get(course, [])
+        for index, candidate in enumerate(records):
+            if str(candidate.get("id")) == record_id:
+                del records[index]
+                del self.times[course][index]
+                break
+        if not records:
+            self.records.pop(course, None)
+            self.times.pop(course, None)
+
+    def in_range(self, course, start_date, end_date):
+        """Records of course whose begin date lies in [start_date, end_date]."""
+        times = self.times.get(course)
+        if not times:
+            return []
+        # "~" sorts after the time part, so the whole end day is included
+        low = bisect_left(times, start_date)
+        high = bisect_right(times, f"{end_date}~")
+        return self.records[course][low:high]
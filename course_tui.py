@@ -3,34 +3,101 @@ import shutil
 import subprocess
 import uuid
 import json
+import math
+import time
 import argparse
 import sys
 import os
 import asyncio
-from downloader import DownloaderManager
+from downloader import DownloaderManager, DownloadPool
+from vod_api import (
+    VOD_URL_TTL_SECONDS,
+    SharedTransport,
+    VodClient,
+    angle_suffix,
+    angle_wanted,
+    filter_downloadable_records,
+    filter_records_by_date,
+    safe_name,
+)
+from mp4clip import Mp4Error, download_clip
+from blobstore import BlobStore, new_hasher
+from catalog import CATALOG_FILENAME, Catalog, CourseIndex
+from download_queue import (
+    ACTIVE,
+    DONE,
+    EXPIRED,
+    FAILED,
+    PENDING,
+    QUEUE_DIRNAME,
+    DownloadQueue,
+    make_entry,
+    reconcile,
+)
+from host_selector import HostSelector
+from http_cache import CACHE_DIRNAME, HttpCache
+from accounts import Account, load_profiles, parse_cookies
+from playlist import PLAYLIST_DIRNAME, write_playlists
+from slides import PPT_MODES, SlideExtractor
+from faststart import FastStartPool, remux_library
+from local_library import (
+    LocalIndex,
+    angle_index,
+    find_local_videos,
+    is_complete,
+    local_video,
+    offline_records,
+    size_matches,
+    video_filename,
+)
+from autotune import TUNING_FILENAME, TuningStore, ensure_tuned, probe, url_host
+from watcher import (
+    DEFAULT_PROCESSING_DELAY_MINUTES,
+    WATCH_QUEUE_DIRNAME,
+    CourseWatcher,
+    run_watchers,
+)
+import tracing
+from tracing import traced
+from virtual_table import LazyRows, VirtualTable
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from textual.app import App, ComposeResult
 from textual.screen import Screen
 from textual.containers import Container, Horizontal, Vertical
-from textual.widgets import Header, Footer, DataTable, Static, ListView, ListItem, Label
+from textual.widgets import (
+    Header,
+    Footer,
+    Static,
+    ListView,
+    ListItem,
+    Label,
+    Input,
+)
 from textual.binding import Binding
+from textual.worker import Worker, WorkerState
 import webbrowser
 from collections import defaultdict
+from pathlib import Path
+from bisect import bisect_left
 
-# Endpoints
-CURRICULUM_API_URL = (
-    "https://course.hdu.edu.cn/jy-application-vod-he-hdu/v1/myself/curriculum"
-)
-DETAIL_API_URL = (
-    "https://course.hdu.edu.cn/jy-application-vod-he-hdu/v1/course_vod_urls"
-)
-SUBJECT_VOD_LIST_API_URL = (
-    "https://course.hdu.edu.cn/jy-application-vod-he-hdu/v1/subject_vod_list"
-)
+# Delay before redrawing the recordings table after the sidebar cursor moves,
+# so holding j/k only renders the course the cursor settles on.
+HIGHLIGHT_DEBOUNCE_SECONDS = 0.08
+
+COURSE_COLUMNS = ("Time", "Classroom", "Teacher", "Play Count", "Local", "ID")
+ALL_COLUMNS = ("Time", "Course", "Classroom", "Teacher", "Play Count", "Local", "ID")
+
+# How often byte counts of running downloads are journaled; each write is
+# an fsync, so not on every progress line
+PROGRESS_JOURNAL_SECONDS = 30
+
+# table_course_name of the view listing every course's recordings
+ALL_RECORDINGS = object()
 
 
 def load_config(config_path):
-    """Load configuration from a JSON file."""
+    """Load configuration from a JSON file; settings are read by name."""
     if not os.path.exists(config_path):
         print(f"Error: Configuration file '{config_path}' not found.")
         print("Please create a JSON file with 'cookies' and 'headers' fields.")
@@ -40,18 +107,16 @@ def load_config(config_path):
         with open(config_path, "r", encoding="utf-8") as f:
             config = json.load(f)
 
-        cookies = config.get("cookies", {})
-
         # Support raw cookie string (Simpler for users)
-        if isinstance(cookies, str):
-            cookie_dict = {}
-            for item in cookies.split(";"):
-                if "=" in item:
-                    k, v = item.split("=", 1)
-                    cookie_dict[k.strip()] = v.strip()
-            cookies = cookie_dict
+        cookies = parse_cookies(config.get("cookies", {}))
 
         headers = config.get("headers", {})
+
+        # Several accounts in one process: [{"name", "cookies", "headers"}]
+        accounts = load_profiles(config, cookies, headers)
+        if not cookies and config.get("accounts"):
+            cookies, headers = accounts[0][1], accounts[0][2]
+
         downloader = config.get("downloader", None)
         if isinstance(downloader, str) and downloader.lower() in {"aria2", "aria2c"}:
             downloader = "aria2c"
@@ -65,12 +130,16 @@ def load_config(config_path):
         start_date = config.get("start_date", None)
         end_date = config.get("end_date", None)
 
-        # Fallback to days_back/days_forward if explicit dates not set
+        # Fallback to days_back/days_forward if explicit dates not set. These
+        # stay set (None for an explicit date) so watch mode can move the
+        # window along with the clock.
         now = datetime.now()
+        days_back = None
         if not start_date:
             days_back = config.get("days_back", 150)
             start_date = (now - timedelta(days=days_back)).strftime("%Y-%m-%d")
 
+        days_forward = None
         if not end_date:
             days_forward = config.get("days_forward", 30)
             end_date = (now + timedelta(days=days_forward)).strftime("%Y-%m-%d")
@@ -80,6 +149,52 @@ def load_config(config_path):
 
         download_dir = os.path.expanduser(config.get("download_dir", "Downloads"))
 
+        # Content-addressed store for deduplicating downloads. It must be on
+        # the same filesystem as download_dir; set to false to disable.
+        blob_store = config.get("blob_store", os.path.join(download_dir, ".store"))
+        if blob_store:
+            blob_store = os.path.expanduser(blob_store)
+        else:
+            blob_store = None
+
+        # Revalidation cache for API responses; set to false to disable
+        http_cache = config.get(
+            "http_cache", os.path.join(download_dir, CACHE_DIRNAME)
+        )
+        if http_cache:
+            http_cache = os.path.expanduser(http_cache)
+        else:
+            http_cache = None
+
+        # Base URL for the VOD API, e.g. a shared vod_proxy.py instance
+        api_base = config.get("api_base", None)
+
+        # Groups of equivalent video hosts; URLs are moved to the fastest one.
+        # A flat list of hosts is treated as a single group.
+        video_mirrors = config.get("video_mirrors", [])
+        if video_mirrors and all(isinstance(m, str) for m in video_mirrors):
+            video_mirrors = [video_mirrors]
+
+        # Minutes after a class ends before watch mode first looks for its video
+        watch_delay_minutes = config.get(
+            "watch_delay_minutes", DEFAULT_PROCESSING_DELAY_MINUTES
+        )
+
+        # Downloader processes run at the same time by the background pool
+        max_concurrent_downloads = config.get("max_concurrent_downloads", 3)
+
+        # Probe each download host once and tune aria2's -x/-s/-k for it
+        aria2_autotune = config.get("aria2_autotune", True)
+
+        # "slides" or "pdf" keeps only the slides of the PPT angle
+        ppt_mode = config.get("ppt_mode", "video")
+        if ppt_mode not in PPT_MODES:
+            print(f"Warning: 'ppt_mode' must be one of {', '.join(PPT_MODES)}. Ignoring.")
+            ppt_mode = "video"
+
+        # Rewrite finished downloads with the moov box first for instant seeking
+        faststart = config.get("faststart", True)
+
         # Validate download_angles
         if download_angles is not None:
             if isinstance(download_angles, str):
@@ -88,20 +203,32 @@ def load_config(config_path):
                 print("Warning: 'download_angles' must be a list of strings. Ignoring.")
                 download_angles = None
 
-        if not cookies or not headers:
+        if not all(c and h for _, c, h in accounts):
             print(
                 f"Warning: 'cookies' or 'headers' missing or empty in '{config_path}'."
             )
 
-        return (
-            cookies,
-            headers,
-            downloader,
-            download_angles,
-            start_date,
-            end_date,
-            aria2_args,
-            download_dir,
+        return SimpleNamespace(
+            cookies=cookies,
+            headers=headers,
+            downloader=downloader,
+            download_angles=download_angles,
+            start_date=start_date,
+            end_date=end_date,
+            days_back=days_back,
+            days_forward=days_forward,
+            aria2_args=aria2_args,
+            download_dir=download_dir,
+            blob_store=blob_store,
+            watch_delay_minutes=watch_delay_minutes,
+            api_base=api_base,
+            max_concurrent_downloads=max_concurrent_downloads,
+            aria2_autotune=aria2_autotune,
+            video_mirrors=video_mirrors,
+            ppt_mode=ppt_mode,
+            faststart=faststart,
+            http_cache=http_cache,
+            accounts=accounts,
         )
     except json.JSONDecodeError as e:
         print(f"Error: Failed to parse JSON configuration: {e}")
@@ -111,26 +238,26 @@ def load_config(config_path):
         sys.exit(1)
 
 
-def angle_label(angle_index):
-    angle_map = {0: "Teacher", 1: "Student", 2: "PPT"}
-    if isinstance(angle_index, int):
-        return angle_map.get(angle_index, f"Angle{angle_index + 1}")
-    return "Angle"
-
-
-def angle_suffix(video_item, default_index=None):
-    angle_index = video_item.get("_angle_index")
-    if angle_index is None:
-        angle_index = default_index
-    return angle_label(angle_index)
+def parse_timestamp(text):
+    """Parse 'HH:MM:SS', 'MM:SS' or plain seconds into seconds."""
+    parts = text.strip().split(":")
+    if not parts or len(parts) > 3 or not all(p.strip() for p in parts):
+        raise ValueError(f"Invalid time: {text!r}")
+    seconds = 0.0
+    for part in parts:
+        value = float(part)
+        # float() also takes "inf", "nan" and overflowing exponents
+        if not math.isfinite(value) or value < 0:
+            raise ValueError(f"Invalid time: {text!r}")
+        seconds = seconds * 60 + value
+    if not math.isfinite(seconds):
+        raise ValueError(f"Invalid time: {text!r}")
+    return seconds
 
 
-def is_downloadable_record(record):
-    return record.get("vodDeleteStatus", 0) == 0
-
-
-def filter_downloadable_records(records):
-    return [r for r in records if is_downloadable_record(r)]
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
 
 
 class AngleSelectionModal(Screen):
@@ -146,7 +273,7 @@ class AngleSelectionModal(Screen):
             ListView(
                 *[
                     ListItem(
-                        Label(angle_label(i)),
+                        Label(angle_suffix(v, i)),
                         id=f"angle-{i}",
                     )
                     for i, v in enumerate(self.video_list)
@@ -174,6 +301,119 @@ class AngleSelectionModal(Screen):
         self.dismiss(None)
 
 
+class AccountSelectModal(Screen):
+    BINDINGS = [("escape", "cancel", "Cancel")]
+
+    def __init__(self, accounts, current):
+        super().__init__()
+        self.accounts = accounts
+        self.current = current
+
+    def compose(self) -> ComposeResult:
+        yield Container(
+            Label("Switch Account:", id="modal-title"),
+            ListView(
+                *[
+                    ListItem(
+                        Label(
+                            f"{account.label} (current)"
+                            if account is self.current
+                            else account.label
+                        ),
+                        id=f"account-{i}",
+                    )
+                    for i, account in enumerate(self.accounts)
+                ],
+                id="account-list",
+            ),
+            id="modal-dialog",
+        )
+
+    def on_list_view_selected(self, event: ListView.Selected) -> None:
+        if not event.item or not event.item.id:
+            return
+        index = int(event.item.id.split("-")[1])
+        self.dismiss(self.accounts[index])
+
+    def action_cancel(self):
+        self.dismiss(None)
+
+
+class ClipRangeModal(Screen):
+    BINDINGS = [("escape", "cancel", "Cancel")]
+
+    def compose(self) -> ComposeResult:
+        yield Container(
+            Label("Clip Range (HH:MM:SS):", id="modal-title"),
+            Input(placeholder="Start, e.g. 0:30:00", id="clip-start"),
+            Input(placeholder="End, e.g. 0:50:00", id="clip-end"),
+            id="modal-dialog",
+        )
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input.id == "clip-start":
+            self.query_one("#clip-end", Input).focus()
+            return
+
+        start_text = self.query_one("#clip-start", Input).value
+        end_text = self.query_one("#clip-end", Input).value
+        try:
+            start = parse_timestamp(start_text)
+            end = parse_timestamp(end_text)
+        except ValueError as e:
+            self.app.notify(str(e), severity="error")
+            return
+
+        if end <= start:
+            self.app.notify("End time must be after start time", severity="error")
+            return
+
+        self.dismiss((start, end))
+
+    def action_cancel(self):
+        self.dismiss(None)
+
+
+class DateRangeModal(Screen):
+    BINDINGS = [("escape", "cancel", "Cancel")]
+
+    def __init__(self, start_date, end_date):
+        super().__init__()
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def compose(self) -> ComposeResult:
+        yield Container(
+            Label("Date Range (YYYY-MM-DD):", id="modal-title"),
+            Input(value=self.start_date, placeholder="Start date", id="range-start"),
+            Input(value=self.end_date, placeholder="End date", id="range-end"),
+            id="modal-dialog",
+        )
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input.id == "range-start":
+            self.query_one("#range-end", Input).focus()
+            return
+
+        start_text = self.query_one("#range-start", Input).value.strip()
+        end_text = self.query_one("#range-end", Input).value.strip()
+        try:
+            for text in (start_text, end_text):
+                datetime.strptime(text, "%Y-%m-%d")
+        except ValueError:
+            self.app.notify("Dates must look like 2025-03-01", severity="error")
+            return
+
+        if end_text < start_text:
+            self.app.notify("End date must not be before start date", severity="error")
+            return
+
+        self.dismiss((start_text, end_text))
+
+    def action_cancel(self):
+        self.dismiss(None)
+
+
 class CourseApp(App):
     CSS = """
     #main-container {
@@ -193,7 +433,7 @@ class CourseApp(App):
     #course-list {
         height: 100%;
     }
-    DataTable {
+    VirtualTable {
         height: 100%;
         border: solid green;
     }
@@ -205,7 +445,7 @@ class CourseApp(App):
     }
 
     /* Modal Styling */
-    AngleSelectionModal {
+    AngleSelectionModal, AccountSelectModal, ClipRangeModal, DateRangeModal {
         align: center middle;
     }
     #modal-dialog {
@@ -225,13 +465,20 @@ class CourseApp(App):
     BINDINGS = [
         ("q", "quit", "Quit"),
         ("r", "refresh", "Refresh List"),
+        ("R", "full_refresh", "Full Refresh"),
         ("v", "play_vlc", "Play in VLC"),
         ("d", "download", "Download Video"),
+        ("c", "clip", "Clip Download"),
+        ("f", "date_range", "Date Range"),
+        ("p", "play_course", "Play Course"),
         ("b", "browser", "Open in Browser"),
+        ("a", "all_recordings", "All Recordings"),
+        ("u", "switch_account", "Switch Account"),
         ("h", "focus_sidebar", "Focus Courses"),
         ("l", "focus_content", "Focus Recordings"),
         ("j", "cursor_down", "Down"),
         ("k", "cursor_up", "Up"),
+        ("escape", "cancel_batch", "Cancel Batch"),
     ]
 
     def __init__(
@@ -244,23 +491,92 @@ class CourseApp(App):
         end_date=None,
         aria2_args=None,
         download_dir="Downloads",
+        blob_store=None,
+        api_base=None,
+        max_concurrent_downloads=3,
+        aria2_autotune=True,
+        video_mirrors=None,
+        offline=False,
+        ppt_mode="video",
+        faststart=True,
+        http_cache=None,
+        accounts=None,
     ):
         super().__init__()
-        self.cookies = cookies
-        self.headers = headers
+        self.offline = offline
+        self.ppt_mode = ppt_mode
+        self.slide_extractor = SlideExtractor()
+        self._warned_no_ffmpeg = False
         self.preferred_downloader = downloader
         self.download_angles = download_angles
         self.start_date = start_date
         self.end_date = end_date
         self.aria2_args = aria2_args
         self.download_dir = download_dir
+        self.blob_store = BlobStore(blob_store) if blob_store else None
+        self.faststart_pool = FastStartPool() if faststart else None
+        self.host_selector = HostSelector(video_mirrors) if video_mirrors else None
+        # One connection pool and response cache for every account; each
+        # account keeps its own cookies and catalog
+        self.transport = SharedTransport()
+        shared_cache = HttpCache(http_cache) if http_cache else None
+        self.accounts = [
+            Account(
+                name,
+                VodClient(
+                    account_cookies,
+                    account_headers,
+                    api_base=api_base,
+                    host_selector=self.host_selector,
+                    http_cache=shared_cache,
+                    transport=self.transport,
+                ),
+            )
+            for name, account_cookies, account_headers in (
+                accounts or [(None, cookies, headers)]
+            )
+        ]
+        self.account = self.accounts[0]
+        self.api = self.account.api
+        self.catalog = Catalog.load(self.account.path(download_dir, CATALOG_FILENAME))
+        self.download_queue = DownloadQueue(os.path.join(download_dir, QUEUE_DIRNAME))
+        # Written by a --watch process; read here to judge its files
+        self.watch_queue = DownloadQueue(
+            os.path.join(download_dir, QUEUE_DIRNAME, WATCH_QUEUE_DIRNAME),
+            compact=False,
+        )
         self.course_data = defaultdict(list)
         self.current_course_name = None
         self.course_id_map = {}
+        self.course_item_ids = {}
+        # Every loaded record, sorted per course, for instant date filtering
+        self.course_index = CourseIndex()
+        self.local_index = LocalIndex(download_dir, on_change=self._local_index_changed)
+        # record id -> (fetched_at, video_list) for playlist building
+        self.vod_list_cache = {}
         self.current_video_list = []
+        # Table rows per course, rebuilt only when course_data changes
+        self.row_cache = {}
+        self.table_course_name = None
+        # Show every recording in the date range instead of one course
+        self.show_all = False
+        # Bumped per full load; page callbacks of a superseded load stop
+        self.load_generation = 0
+        self._highlight_timer = None
+        self.tuning = (
+            TuningStore.load(os.path.join(download_dir, TUNING_FILENAME))
+            if aria2_autotune
+            else None
+        )
         self.downloader_manager = DownloaderManager(
-            preferred_downloader=downloader, aria2_args=aria2_args
+            preferred_downloader=downloader, aria2_args=aria2_args, tuning=self.tuning
         )
+        self.download_pool = DownloadPool(
+            self.downloader_manager,
+            max_concurrent=max_concurrent_downloads,
+            on_event=self.on_download_event,
+        )
+        self._progress_journaled_at = 0.0
 
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
@@ -269,14 +585,278 @@ class CourseApp(App):
                 yield Label("Courses", id="courses-header")
                 yield ListView(id="course-list")
             with Vertical(id="content"):
-                yield DataTable(cursor_type="row")
+                yield VirtualTable(*COURSE_COLUMNS)
         yield Static("Ready", id="status_bar")
         yield Footer()
 
     async def on_mount(self) -> None:
-        table = self.query_one(DataTable)
-        table.add_columns("Time", "Classroom", "Teacher", "Play Count", "ID")
-        await self.load_courses()
+        self.local_index.start()
+        self.update_sub_title()
+        if not self.offline:
+            self.run_worker(
+                self.resume_queue(), group="resume-queue", exit_on_error=False
+            )
+        self.start_load_courses()
+
+    def update_sub_title(self):
+        parts = []
+        if len(self.accounts) > 1:
+            parts.append(self.account.label)
+        if self.offline:
+            parts.append("Offline")
+        self.sub_title = " - ".join(parts)
+
+    def start_load_courses(self, full=False):
+        if self.offline:
+            loader = self.load_offline_courses()
+        else:
+            loader = self.load_courses() if full else self.sync_courses()
+        # A refresh supersedes any curriculum load still in flight
+        self.run_worker(
+            loader,
+            group="load-courses",
+            exclusive=True,
+            exit_on_error=False,
+        )
+
+    def start_video_lookup(self, course_id, action):
+        # A newer lookup for the same recording supersedes the older one
+        self.run_worker(
+            self.load_video_urls(course_id, action=action),
+            group=f"video-urls-{course_id}",
+            exclusive=True,
+            exit_on_error=False,
+        )
+
+    def start_batch_download(self, course_name):
+        if self.offline:
+            self.notify("Downloads are unavailable in offline mode", severity="warning")
+            return
+        self.run_worker(
+            self.download_all_course_videos(course_name),
+            group=f"batch-{course_name}",
+            exclusive=True,
+            exit_on_error=False,
+        )
+
+    def action_cancel_batch(self):
+        batches = [
+            worker
+            for worker in self.workers
+            if worker.group.startswith("batch-") and worker.is_running
+        ]
+        if not batches:
+            return
+        for worker in batches:
+            worker.cancel()
+        self.query_one("#status_bar", Static).update("Batch cancelled")
+        self.notify("Batch cancelled", severity="warning")
+
+    async def action_quit(self):
+        # Do not leave downloader processes running behind the closed UI
+        self.local_index.stop()
+        await self.download_pool.shutdown()
+        await self.transport.close()
+        self.slide_extractor.terminate()
+        if self.faststart_pool:
+            self.faststart_pool.terminate()
+        self.exit()
+
+    def on_download_event(self, event):
+        """Track progress of pooled downloads in the queue and status bar."""
+        if event.kind == "progress":
+            jobs = self.download_pool.active_jobs()
+            done = sum(job.bytes_done for job in jobs)
+            speed = sum(job.speed or 0 for job in jobs)
+            self.query_one("#status_bar", Static).update(
+                f"Downloading {len(jobs)} files: {done / 1024**2:.1f} MiB "
+                f"at {speed / 1024**2:.1f} MiB/s"
+            )
+            now = time.monotonic()
+            if now - self._progress_journaled_at >= PROGRESS_JOURNAL_SECONDS:
+                self._progress_journaled_at = now
+                self.download_queue.update_entries(
+                    [
+                        (
+                            job.key,
+                            {
+                                "bytes_done": job.bytes_done,
+                                "total_bytes": job.total_bytes,
+                            },
+                        )
+                        for job in jobs
+                    ]
+                )
+            return
+        if event.kind != "finished":
+            return
+
+        entry = self.download_queue.entries.get(event.key)
+        if event.returncode == 0:
+            self.download_queue.update(
+                event.key,
+                state=DONE,
+                bytes_done=event.bytes_done,
+                total_bytes=event.total_bytes,
+            )
+            if entry:
+                self.run_worker(
+                    self.finish_download(entry),
+                    group="post-download",
+                    exit_on_error=False,
+                )
+        else:
+            # Retried on the next start; reconcile resolves a dead URL again
+            self.download_queue.update(
+                event.key, state=PENDING, bytes_done=event.bytes_done
+            )
+            name = os.path.basename(entry["path"]) if entry else event.key
+            self.notify(
+                f"Download failed ({name}, exit code {event.returncode})",
+                severity="error",
+            )
+            if entry and self.host_selector:
+                # Steer this and later attempts away from the host that failed
+                self.host_selector.report_failure(url_host(entry["url"]))
+                self.run_worker(
+                    self.retry_on_mirror(entry),
+                    group="mirror-retry",
+                    exit_on_error=False,
+                )
+        if not self.download_pool.active_jobs():
+            self.query_one("#status_bar", Static).update("Downloads finished")
+
+    async def retry_on_mirror(self, entry):
+        """Resubmit a failed download on the next-best mirror, if there is one."""
+        failed_host = url_host(entry["url"])
+        url = await self.host_selector.choose(entry["url"])
+        if url_host(url) == failed_host:
+            return
+        self.download_queue.update(entry["key"], url=url)
+        self.notify(
+            f"Retrying {os.path.basename(entry['path'])} from {url_host(url)}"
+        )
+        self._start_downloads([self.download_queue.entries[entry["key"]]])
+
+    @traced("post_download")
+    async def finish_download(self, entry):
+        """Fast-start remux, then link the file into the blob store."""
+        path = entry["path"]
+        digest = None
+        if self.faststart_pool and path.endswith(".mp4"):
+            try:
+                result = await self.faststart_pool.remux(
+                    path, hash_output=self.blob_store is not None
+                )
+                digest = result["digest"]
+                if result["moved"]:
+                    self.download_queue.record_size(path, os.path.getsize(path))
+            except Exception as e:
+                self.notify(
+                    f"Could not remux {os.path.basename(path)} for fast start: {e}",
+                    severity="warning",
+                )
+        if self.blob_store:
+            await asyncio.to_thread(self.blob_store.ingest, path, digest)
+        self.on_local_change(safe_name(entry["course"] or ""))
+
+    @traced("autotune")
+    async def tune_for(self, url):
+        """Probe the download host before aria2 starts, if not tuned yet."""
+        if self.download_pool.tool != "aria2c":
+            return
+        status_bar = self.query_one("#status_bar", Static)
+        await ensure_tuned(
+            self.tuning, url, notify=self.notify, progress=status_bar.update
+        )
+
+    def slide_mode(self, angle):
+        """ppt_mode for a video of this angle, or None to keep the video."""
+        if angle != "PPT" or self.ppt_mode == "video":
+            return None
+        if not self.slide_extractor.available:
+            if not self._warned_no_ffmpeg:
+                self._warned_no_ffmpeg = True
+                self.notify(
+                    "ffmpeg not found; downloading the PPT angle as video",
+                    severity="warning",
+                )
+            return None
+        return self.ppt_mode
+
+    async def extract_slides(self, entry):
+        # A PPT video already on disk is read locally instead of streamed
+        video_path = entry["path"]
+        complete = is_complete(
+            video_path, self._unfinished_paths() - {video_path}, self._expected_sizes()
+        )
+        source = video_path if complete else entry["url"]
+        try:
+            result = await self.slide_extractor.extract(
+                source, video_path, entry["slides"]
+            )
+        except Exception as e:
+            self.download_queue.update(entry["key"], state=FAILED)
+            self.notify(
+                f"Slide extraction of {os.path.basename(video_path)} failed: {e}",
+                severity="error",
+            )
+            return
+        self.download_queue.update(entry["key"], state=DONE)
+        self.notify(
+            f"Kept {result['slides']} slides of {os.path.basename(video_path)} "
+            f"({result['bytes'] / 1024**2:.1f} MiB)"
+        )
+
+    def _start_downloads(self, entries):
+        """Start queued entries in the pool, or hand them to download_batch."""
+        slide_entries = [e for e in entries if e.get("slides")]
+        entries = [e for e in entries if not e.get("slides")]
+        for entry in slide_entries:
+            self.run_worker(
+                self.extract_slides(entry),
+                group=f"slides-{entry['key']}",
+                exclusive=True,
+                exit_on_error=False,
+            )
+        if slide_entries:
+            self.download_queue.update_many(
+                [e["key"] for e in slide_entries], state=ACTIVE
+            )
+
+        if self.download_pool.available:
+            for entry in entries:
+                self.download_pool.submit(
+                    entry["key"],
+                    entry["url"],
+                    os.path.dirname(entry["path"]),
+                    os.path.basename(entry["path"]),
+                )
+            self.download_queue.update_many([e["key"] for e in entries], state=ACTIVE)
+            return
+
+        by_dir = defaultdict(list)
+        for entry in entries:
+            by_dir[os.path.dirname(entry["path"])].append(entry)
+
+        for destination_dir, dir_entries in by_dir.items():
+            list_file = self.download_queue.write_list_file(
+                dir_entries, safe_name(os.path.basename(destination_dir))
+            )
+            self.downloader_manager.download_batch(
+                download_list_file=list_file,
+                destination_dir=destination_dir,
+                notify_callback=self.notify,
+            )
+            self.download_queue.update_many(
+                [e["key"] for e in dir_entries], state=ACTIVE
+            )
+
+    def on_worker_state_changed(self, event: Worker.StateChanged) -> None:
+        if event.state == WorkerState.ERROR:
+            error = event.worker.error
+            self.query_one("#status_bar", Static).update(f"Error: {error}")
+            self.notify(f"Error: {error}", severity="error")
 
     async def on_list_view_highlighted(self, event: ListView.Highlighted) -> None:
         """Handle course highlight (cursor move) in the left sidebar."""
@@ -289,134 +869,202 @@ class CourseApp(App):
             # Update only if changed to avoid unnecessary redraws
             if self.current_course_name != course_name:
                 self.current_course_name = course_name
-                self.update_recordings_table(course_name)
+                self.show_all = False
+                if self._highlight_timer is not None:
+                    self._highlight_timer.stop()
+                self._highlight_timer = self.set_timer(
+                    HIGHLIGHT_DEBOUNCE_SECONDS, self.flush_table_update
+                )
+
+    def flush_table_update(self):
+        """Render the highlighted course now if a debounced update is pending."""
+        if self._highlight_timer is not None:
+            self._highlight_timer.stop()
+            self._highlight_timer = None
+        shown = ALL_RECORDINGS if self.show_all else self.current_course_name
+        if shown != self.table_course_name:
+            self.update_recordings_table(shown)
 
     async def on_list_view_selected(self, event: ListView.Selected) -> None:
         """Handle course selection (Enter) from the left sidebar."""
         # Ranger-style: Enter on a directory (course) moves focus into it (video list)
-        self.query_one(DataTable).focus()
+        self.flush_table_update()
+        self.query_one(VirtualTable).focus()
 
-    async def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
+    def on_virtual_table_row_selected(self, event: VirtualTable.RowSelected) -> None:
         """Handle recording selection (Enter key) from the right table."""
-        course_id = event.row_key.value
-        await self.load_video_urls(course_id, action="browser")
+        self.start_video_lookup(event.key, "browser")
+
+    def action_all_recordings(self):
+        """Toggle the table between the highlighted course and all courses."""
+        self.show_all = not self.show_all
+        self.flush_table_update()
+        self.query_one(VirtualTable).focus()
 
-    async def action_play_vlc(self):
+    def action_play_vlc(self):
         """Play selected video in VLC."""
-        if self.query_one(DataTable).cursor_row is not None:
-            row_key = (
-                self.query_one(DataTable)
-                .coordinate_to_cell_key(self.query_one(DataTable).cursor_coordinate)
-                .row_key.value
-            )
-            await self.load_video_urls(row_key, action="vlc")
+        row_key = self.query_one(VirtualTable).cursor_key
+        if row_key is not None:
+            self.start_video_lookup(row_key, "vlc")
         else:
             self.notify("No recording selected", severity="warning")
 
-    async def action_download(self):
+    def action_download(self):
         """Download selected video or batch download depending on focus."""
         focused = self.focused
 
         # If Course List (sidebar) is focused, download ALL videos for that course
         if isinstance(focused, ListView) and self.current_course_name:
-            await self.download_all_course_videos(self.current_course_name)
+            self.start_batch_download(self.current_course_name)
 
         # If Data Table (content) is focused, download just the selected video
-        elif isinstance(focused, DataTable) and focused.cursor_row is not None:
-            row_key = focused.coordinate_to_cell_key(
-                focused.cursor_coordinate
-            ).row_key.value
-            await self.load_video_urls(row_key, action="download")
+        elif isinstance(focused, VirtualTable) and focused.cursor_key is not None:
+            self.start_video_lookup(focused.cursor_key, "download")
         else:
             self.notify("No selection to download", severity="warning")
 
-    async def action_browser(self):
-        """Open selected video in browser."""
-        if self.query_one(DataTable).cursor_row is not None:
-            row_key = (
-                self.query_one(DataTable)
-                .coordinate_to_cell_key(self.query_one(DataTable).cursor_coordinate)
-                .row_key.value
-            )
-            await self.load_video_urls(row_key, action="browser")
+    def action_clip(self):
+        """Download a time range of the selected video."""
+        row_key = self.query_one(VirtualTable).cursor_key
+        if row_key is not None:
+            self.start_video_lookup(row_key, "clip")
         else:
             self.notify("No recording selected", severity="warning")
 
-    def _angle_suffix(self, video_item):
-        return angle_suffix(video_item)
+    def action_play_course(self):
+        """Play every recording of the current course as one VLC playlist."""
+        course_name = self.current_course_name
+        if not course_name or not self.course_data.get(course_name):
+            self.notify("No course selected", severity="warning")
+            return
 
-    async def fetch_video_url(self, course_id, batch_mode=False, file_prefix=""):
-        params = {"courseId": course_id}
-        try:
-            async with httpx.AsyncClient(
-                cookies=self.cookies, headers=self.headers, verify=False
-            ) as client:
-                response = await client.get(DETAIL_API_URL, params=params)
-                response.raise_for_status()
-                data = response.json()
-                video_list = data.get("data", {}).get("courseVodViewList", [])
+        def start(choice):
+            if not choice:
+                return
+            self.run_worker(
+                self.play_course(course_name, angle_suffix(choice)),
+                group="play-course",
+                exclusive=True,
+                exit_on_error=False,
+            )
 
-                if not video_list:
-                    return []
+        angles = [{"_angle_index": i} for i in range(3)]
+        self.push_screen(AngleSelectionModal(angles), start)
+
+    async def cached_vod_list(self, record_id):
+        """fetch_vod_list with a short-lived cache; stale entries are refetched."""
+        cached = self.vod_list_cache.get(record_id)
+        if cached and time.monotonic() - cached[0] < VOD_URL_TTL_SECONDS:
+            return cached[1]
+        video_list = await self.api.fetch_vod_list(record_id)
+        self.vod_list_cache[record_id] = (time.monotonic(), video_list)
+        return video_list
+
+    @traced("play_course", "course_name", "angle")
+    async def play_course(self, course_name, angle):
+        recordings = sorted(
+            filter_downloadable_records(self.course_data.get(course_name, [])),
+            key=lambda r: r.get("courBeginTime", ""),
+        )
+        status_bar = self.query_one("#status_bar", Static)
+        status_bar.update(f"Resolving {len(recordings)} recordings ({angle})...")
+        # A cut-off local file would stop the playlist; its URL is used instead
+        unfinished = self._unfinished_paths()
+        expected_sizes = self._expected_sizes()
+
+        def local_path(record):
+            for video in self._indexed_local_videos(
+                record, unfinished, expected_sizes
+            ):
+                if angle_suffix(video) == angle:
+                    return video["url"]
+            return None
 
-                results = []
+        semaphore = asyncio.Semaphore(6)
 
-                for i, v in enumerate(video_list):
-                    url = v.get("url")
-                    if not url:
-                        continue
+        async def resolve(record):
+            path = local_path(record)
+            if path or self.offline:
+                return path
+            async with semaphore:
+                try:
+                    video_list = await self.cached_vod_list(str(record.get("id")))
+                except Exception:
+                    return None
+            for video in video_list:
+                if video.get("url") and angle_suffix(video) == angle:
+                    return video["url"]
+            return None
 
-                    v["_angle_index"] = i
-                    suffix = self._angle_suffix(v)
+        locations = await asyncio.gather(*(resolve(r) for r in recordings))
+        entries = [
+            (f"{course_name} {r.get('courBeginTime', '')} {angle}", location)
+            for r, location in zip(recordings, locations)
+            if location
+        ]
+        if not entries:
+            status_bar.update(f"No {angle} videos found for {course_name}")
+            return
 
-                    if batch_mode and self.download_angles:
-                        if suffix.lower() not in [
-                            a.lower() for a in self.download_angles
-                        ]:
-                            continue
+        local_count = sum(1 for _, location in entries if "://" not in location)
+        m3u_path, xspf_path = await asyncio.to_thread(
+            write_playlists,
+            os.path.join(self.download_dir, PLAYLIST_DIRNAME),
+            f"{safe_name(course_name)}_{angle}",
+            entries,
+        )
+        status_bar.update(
+            f"Playlist of {len(entries)}/{len(recordings)} recordings "
+            f"({local_count} local): {xspf_path}"
+        )
+        if shutil.which("vlc"):
+            subprocess.Popen(["vlc", xspf_path])
+            self.notify("Launched VLC")
+        else:
+            self.notify(
+                f"VLC not found; playlist written to {m3u_path}", severity="warning"
+            )
 
-                    filename = f"{file_prefix}_{suffix}.mp4"
-                    results.append({"url": url, "filename": filename})
+    def action_browser(self):
+        """Open selected video in browser."""
+        row_key = self.query_one(VirtualTable).cursor_key
+        if row_key is not None:
+            self.start_video_lookup(row_key, "browser")
+        else:
+            self.notify("No recording selected", severity="warning")
 
-                return results
+    def _angle_suffix(self, video_item):
+        return angle_suffix(video_item)
 
+    @traced("fetch_video_url", "course_id")
+    async def fetch_video_url(
+        self, course_id, batch_mode=False, file_prefix="", api=None
+    ):
+        try:
+            video_list = await (api or self.api).fetch_vod_list(course_id)
         except Exception:
             return []
 
-    async def fetch_subject_vod_list(self, tecl_id):
-        all_records = []
-        page_index = 1
-        page_size = 1000
-        params_base = {
-            "page.pageSize": page_size,
-            "page.orders[0].asc": "true",
-            "page.orders[0].field": "courBeginTime",
-        }
+        results = []
+        for v in video_list:
+            url = v.get("url")
+            if not url:
+                continue
+
+            if batch_mode and not angle_wanted(v, self.download_angles):
+                continue
+
+            suffix = self._angle_suffix(v)
+            filename = f"{file_prefix}_{suffix}.mp4"
+            results.append({"url": url, "filename": filename, "angle": suffix})
 
-        async with httpx.AsyncClient(
-            cookies=self.cookies, headers=self.headers, verify=False
-        ) as client:
-            while True:
-                params = {
-                    **params_base,
-                    "page.pageIndex": page_index,
-                    "teclIds": str(tecl_id),
-                }
-                response = await client.get(SUBJECT_VOD_LIST_API_URL, params=params)
-                response.raise_for_status()
-                data = response.json()
-                records = data.get("data", {}).get("records", [])
-                if not records:
-                    break
-                all_records.extend(records)
-                if len(records) < page_size:
-                    break
-                page_index += 1
-
-        return all_records
+        return results
 
+    @traced("batch_download", "course_name")
     async def download_all_course_videos(self, course_name):
         """Concurrent download of all videos (filtered by angles) for the current course."""
+        # Switching accounts must not move a running batch to the other one
+        account = self.account
         recordings = self.course_data.get(course_name, [])
         if not recordings:
             self.notify("No recordings to download", severity="warning")
@@ -427,18 +1075,12 @@ class CourseApp(App):
         subj_id = base_record.get("subjId")
 
         if tecl_id and subj_id:
-            subject_records = await self.fetch_subject_vod_list(tecl_id)
+            subject_records = await account.api.fetch_subject_vod_list(tecl_id)
             recordings = [r for r in subject_records if r.get("subjId") == subj_id]
             if self.start_date and self.end_date:
-                filtered_records = []
-                for record in recordings:
-                    begin_time = record.get("courBeginTime", "")
-                    if not begin_time:
-                        continue
-                    rec_date = begin_time.split(" ")[0]
-                    if self.start_date <= rec_date <= self.end_date:
-                        filtered_records.append(record)
-                recordings = filtered_records
+                recordings = filter_records_by_date(
+                    recordings, self.start_date, self.end_date
+                )
 
         if not recordings:
             self.notify("No recordings to download", severity="warning")
@@ -465,24 +1107,43 @@ class CourseApp(App):
         async def fetch_with_limit(course_id, file_prefix):
             async with semaphore:
                 return await self.fetch_video_url(
-                    course_id, batch_mode=True, file_prefix=file_prefix
+                    course_id, batch_mode=True, file_prefix=file_prefix, api=account.api
                 )
 
         tasks = []
         for rec in eligible_recordings:
             course_id = str(rec.get("id"))
-            raw_time = rec.get("courBeginTime", "UnknownTime")
-            safe_time = "".join([c if c.isalnum() else "_" for c in raw_time])
+            safe_time = safe_name(rec.get("courBeginTime", "UnknownTime"))
             tasks.append(fetch_with_limit(course_id, safe_time))
 
-        results = await asyncio.gather(*tasks)
+        try:
+            results = await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            self.query_one("#status_bar", Static).update(
+                f"Batch for {course_name} cancelled"
+            )
+            raise
+
+        safe_course = safe_name(course_name)
+        destination_dir = os.path.join(self.download_dir, safe_course)
 
         all_downloads = []
         recordings_with_urls = 0
-        for item_list in results:
+        for rec, item_list in zip(eligible_recordings, results):
             if item_list:
                 recordings_with_urls += 1
-                all_downloads.extend(item_list)
+                for item in item_list:
+                    all_downloads.append(
+                        make_entry(
+                            rec.get("id"),
+                            item["angle"],
+                            item["url"],
+                            os.path.join(destination_dir, item["filename"]),
+                            course_name,
+                            slides=self.slide_mode(item["angle"]),
+                            account=account.name,
+                        )
+                    )
 
         if recordings_with_urls < len(eligible_recordings):
             self.notify(
@@ -495,71 +1156,229 @@ class CourseApp(App):
             self.notify("No videos found (check config angles?)", severity="warning")
             return
 
-        safe_name = "".join([c if c.isalnum() else "_" for c in course_name])
-        list_file = f"urls_{safe_name}.txt"
+        # Journal the work before any downloader starts so it survives a crash
+        queued = await asyncio.to_thread(self.download_queue.add, all_downloads)
+        if not queued:
+            self.notify(f"All {len(all_downloads)} files are already downloaded")
+            return
 
-        with open(list_file, "w", encoding="utf-8") as f:
-            for item in all_downloads:
-                url = item["url"]
-                filename = item["filename"]
-                f.write(f"{url}\n")
-                f.write(f"  out={filename}\n")
+        self.notify(f"Queued {len(queued)} files for {course_name}")
+        await self.tune_for(queued[0]["url"])
+        self._start_downloads(queued)
 
-        self.notify(f"Generated list ({len(all_downloads)} files): {list_file}")
+    @traced("resume_queue")
+    async def resume_queue(self):
+        """Restart downloads left unfinished by a previous session."""
+        entries = self.download_queue.unfinished()
+        if not entries:
+            return
+
+        status_bar = self.query_one("#status_bar", Static)
+        status_bar.update(f"Checking {len(entries)} unfinished downloads...")
+        resumable = await reconcile(self.download_queue, entries)
+
+        # Stored URLs carry expiring auth keys; resolve only the stale ones again
+        expired = [e for e in entries if e["state"] == EXPIRED]
+        semaphore = asyncio.Semaphore(6)
+
+        async def refresh_url(entry):
+            async with semaphore:
+                try:
+                    api = self._account_named(entry.get("account")).api
+                    video_list = await api.fetch_vod_list(entry["record_id"])
+                except Exception:
+                    return None
+            for v in video_list:
+                if v.get("url") and angle_suffix(v) == entry["angle"]:
+                    return v["url"]
+            return None
 
-        destination_dir = f"{self.download_dir}/{safe_name}"
-        self.downloader_manager.download_batch(
-            download_list_file=list_file,
-            destination_dir=destination_dir,
-            notify_callback=self.notify,
+        urls = await asyncio.gather(*(refresh_url(e) for e in expired))
+        updates = []
+        for entry, url in zip(expired, urls):
+            if url:
+                updates.append((entry["key"], {"url": url, "state": PENDING}))
+                resumable.append(entry)
+        self.download_queue.update_entries(updates)
+        if resumable:
+            await self.tune_for(resumable[0]["url"])
+            self._start_downloads(resumable)
+
+        unresolved = len(expired) - len(updates)
+        finished = len(entries) - len(resumable) - unresolved
+        status_bar.update(
+            f"Resumed {len(resumable)} downloads ({finished} already complete, "
+            f"{unresolved} could not be resolved)"
         )
 
+    def _unfinished_paths(self):
+        self.watch_queue.refresh()
+        return {
+            entry["path"]
+            for queue in (self.download_queue, self.watch_queue)
+            for entry in queue.unfinished()
+        }
+
+    def _expected_sizes(self):
+        """Journaled full sizes of downloaded videos, see local_library."""
+        return {
+            **self.watch_queue.expected_sizes(),
+            **self.download_queue.expected_sizes(),
+        }
+
+    def _indexed_local_videos(self, record, unfinished=None, expected_sizes=None):
+        """Complete files of a record; a size off from the journal is skipped."""
+        course_name = record.get("subjName", "Unknown Course")
+        begin_time = record.get("courBeginTime", "")
+        course_dir = os.path.join(self.download_dir, safe_name(course_name))
+        if unfinished is None:
+            unfinished = self._unfinished_paths()
+        if expected_sizes is None:
+            expected_sizes = self._expected_sizes()
+        videos = []
+        for label, size in self.local_index.angles(course_name, begin_time).items():
+            path = os.path.join(course_dir, video_filename(begin_time, label))
+            if path not in unfinished and size_matches(path, size, expected_sizes):
+                videos.append(local_video(path, label))
+        videos.sort(key=lambda v: (v["_angle_index"] is None, v["_angle_index"] or 0))
+        return videos
+
+    def _choose_video(self, video_list, action, course_id):
+        if len(video_list) > 1:
+            self.push_screen(
+                AngleSelectionModal(video_list),
+                lambda v: self.perform_video_action(v, action, course_id),
+            )
+        else:
+            self.perform_video_action(video_list[0], action, course_id)
+
+    @traced("load_video_urls", "course_id", "action")
     async def load_video_urls(self, course_id, action="browser"):
+        # Watching something already on disk needs no URL and is seekable at once
+        if action in ("browser", "vlc"):
+            record = self._record_by_id(course_id)
+            local_videos = []
+            if record and self.local_index.ready:
+                local_videos = self._indexed_local_videos(record)
+            elif record:
+                local_videos = await asyncio.to_thread(
+                    find_local_videos,
+                    self.download_dir,
+                    record,
+                    self._unfinished_paths(),
+                    self._expected_sizes(),
+                )
+            if local_videos:
+                self._choose_video(local_videos, action, course_id)
+                return
+
+        if self.offline:
+            if action in ("browser", "vlc"):
+                message = "This recording is not downloaded (offline mode)"
+            else:
+                message = "Downloads are unavailable in offline mode"
+            self.notify(message, severity="warning")
+            return
+
         self.query_one("#status_bar", Static).update(
             f"Fetching video URLs for course {course_id}..."
         )
-        params = {"courseId": course_id}
 
         try:
-            async with httpx.AsyncClient(
-                cookies=self.cookies, headers=self.headers, verify=False
-            ) as client:
-                response = await client.get(DETAIL_API_URL, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                video_list = data.get("data", {}).get("courseVodViewList", [])
-
-                if not video_list:
-                    self.notify(
-                        "No videos available for this course", severity="warning"
-                    )
-                    return
+            video_list = await self.api.fetch_vod_list(course_id)
 
-                for i, v in enumerate(video_list):
-                    v["_angle_index"] = i
+            if not video_list:
+                self.notify("No videos available for this course", severity="warning")
+                return
 
-                if len(video_list) > 1:
-                    self.push_screen(
-                        AngleSelectionModal(video_list),
-                        lambda v: self.perform_video_action(v, action, course_id),
-                    )
-                else:
-                    self.perform_video_action(video_list[0], action, course_id)
+            self._choose_video(video_list, action, course_id)
 
         except Exception as e:
             self.query_one("#status_bar", Static).update(f"Error fetching video: {e}")
             self.notify(f"Error: {e}", severity="error")
 
     def _record_by_id(self, course_id):
-        if not self.current_course_name:
-            return None
-        recordings = self.course_data.get(self.current_course_name, [])
-        for rec in recordings:
-            if str(rec.get("id")) == str(course_id):
-                return rec
+        """A loaded record by id, looked up in the current course first."""
+        courses = list(self.course_data)
+        if self.current_course_name in self.course_data:
+            courses.remove(self.current_course_name)
+            courses.insert(0, self.current_course_name)
+        for course in courses:
+            for rec in self.course_data[course]:
+                if str(rec.get("id")) == str(course_id):
+                    return rec
         return None
 
+    def _course_of(self, course_id):
+        """Course of a recording; the all-recordings view spans courses."""
+        record = self._record_by_id(course_id) if course_id is not None else None
+        if record:
+            return record.get("subjName", "Unknown Course")
+        return self.current_course_name
+
+    def _destination_dir(self, course_id=None):
+        course_name = self._course_of(course_id)
+        if course_name:
+            return os.path.join(self.download_dir, safe_name(course_name))
+        return self.download_dir
+
+    def _output_basename(self, course_id, target_video):
+        if course_id is None:
+            return None
+        record = self._record_by_id(course_id)
+        if not record:
+            return None
+        safe_time = safe_name(record.get("courBeginTime", "UnknownTime"))
+        suffix = self._angle_suffix(target_video)
+        return f"{safe_time}_{suffix}"
+
+    async def download_clip(self, video_url, output_path, start, end):
+        status_bar = self.query_one("#status_bar", Static)
+        name = os.path.basename(output_path)
+
+        def progress(done, total):
+            percent = done * 100 // total if total else 100
+            status_bar.update(
+                f"Clip {name}: {done // (1024 * 1024)}/{total // (1024 * 1024)} MiB ({percent}%)"
+            )
+
+        status_bar.update(f"Reading index for clip {name}...")
+        hasher = new_hasher() if self.blob_store else None
+        try:
+            info = await download_clip(
+                video_url, output_path, start, end, progress, hasher=hasher
+            )
+        except (Mp4Error, httpx.HTTPError, OSError) as e:
+            status_bar.update(f"Clip download failed: {e}")
+            self.notify(f"Clip download failed: {e}", severity="error")
+            return
+
+        if self.blob_store:
+            self.blob_store.ingest(output_path, hasher.hexdigest())
+
+        status_bar.update(
+            f"Saved clip {name} ({format_timestamp(info['start'])} +{format_timestamp(info['duration'])})"
+        )
+        self.notify(f"Clip saved: {output_path}")
+
+    def start_clip_download(self, target_video, course_id, clip_range):
+        if not clip_range:
+            self.notify("Selection cancelled", severity="information")
+            return
+
+        start, end = clip_range
+        basename = self._output_basename(course_id, target_video) or "clip"
+        output_filename = (
+            f"{basename}_clip_{format_timestamp(start).replace(':', '')}"
+            f"-{format_timestamp(end).replace(':', '')}.mp4"
+        )
+        output_path = os.path.join(self._destination_dir(course_id), output_filename)
+        self.run_worker(
+            self.download_clip(target_video.get("url"), output_path, start, end),
+            group="clip",
+            exit_on_error=False,
+        )
+
     def perform_video_action(self, target_video, action, course_id=None):
         if not target_video:
             self.notify("Selection cancelled", severity="information")
@@ -570,6 +1389,15 @@ class CourseApp(App):
             self.notify("No URL found in video record", severity="warning")
             return
 
+        if target_video.get("local"):
+            self.query_one("#status_bar", Static).update(
+                f"Playing local file: {video_url}"
+            )
+            if action == "browser":
+                webbrowser.open(Path(video_url).resolve().as_uri())
+                self.notify("Opened local file")
+                return
+
         if action == "browser":
             self.query_one("#status_bar", Static).update(
                 f"Opening in browser: {video_url}"
@@ -589,22 +1417,35 @@ class CourseApp(App):
             self.query_one("#status_bar", Static).update(
                 f"Starting download: {video_url}"
             )
-            if self.current_course_name:
-                safe_name = "".join(
-                    [c if c.isalnum() else "_" for c in self.current_course_name]
-                )
-                destination_dir = os.path.join(self.download_dir, safe_name)
-            else:
-                destination_dir = self.download_dir
+            destination_dir = self._destination_dir(course_id)
 
             output_filename = None
-            if course_id is not None:
-                record = self._record_by_id(course_id)
-                if record:
-                    raw_time = record.get("courBeginTime", "UnknownTime")
-                    safe_time = "".join([c if c.isalnum() else "_" for c in raw_time])
-                    suffix = self._angle_suffix(target_video)
-                    output_filename = f"{safe_time}_{suffix}.mp4"
+            basename = self._output_basename(course_id, target_video)
+            if basename:
+                output_filename = f"{basename}.mp4"
+
+            entry = None
+            if output_filename:
+                entry = make_entry(
+                    course_id,
+                    self._angle_suffix(target_video),
+                    video_url,
+                    os.path.join(destination_dir, output_filename),
+                    self._course_of(course_id),
+                    account=self.account.name,
+                )
+                if not self.download_queue.add([entry]):
+                    # Resuming into a finished file would write through its
+                    # hardlink into the shared blob
+                    self.query_one("#status_bar", Static).update(
+                        f"Already downloaded: {entry['path']}"
+                    )
+                    self.notify("Already downloaded", severity="information")
+                    return
+
+            if entry and self.download_pool.available:
+                self._start_downloads([entry])
+                return
 
             self.downloader_manager.download_video(
                 video_url=video_url,
@@ -612,39 +1453,134 @@ class CourseApp(App):
                 output_filename=output_filename,
                 notify_callback=self.notify,
             )
+            if entry:
+                self.download_queue.update(entry["key"], state=ACTIVE)
+
+        elif action == "clip":
+            self.push_screen(
+                ClipRangeModal(),
+                lambda clip_range: self.start_clip_download(
+                    target_video, course_id, clip_range
+                ),
+            )
 
-    def update_recordings_table(self, course_name):
-        """Update the right pane with recordings for the selected course."""
-        table = self.query_one(DataTable)
-        table.clear()
-
-        recordings = self.course_data.get(course_name, [])
+    def _local_index_changed(self, course_dir):
+        # Called from the index thread
+        try:
+            self.call_from_thread(self.on_local_change, course_dir)
+        except RuntimeError:
+            pass  # App is shutting down
+
+    def on_local_change(self, course_dir):
+        """Refresh the Local column after files of a course changed on disk."""
+        courses = [
+            course
+            for course in self.course_data
+            if course_dir is None or safe_name(course) == course_dir
+        ]
+        shown = ALL_RECORDINGS if self.show_all else self.current_course_name
+        # Keep the cursor where it is if the table already shows these rows
+        keep_cursor = self.table_course_name == shown
+        for course in courses:
+            self.invalidate_row_cache(course)
+
+        if courses and (shown is ALL_RECORDINGS or shown in courses):
+            self.update_recordings_table(shown, keep_cursor=keep_cursor)
+
+    def _local_status(self, course_name, record, unfinished, expected_sizes):
+        """Per-angle download state, e.g. 'T✓ P…' (✓ complete, … in progress)."""
+        begin_time = record.get("courBeginTime", "")
+        angles = self.local_index.angles(course_name, begin_time)
+        if not angles:
+            return ""
+        course_dir = os.path.join(self.download_dir, safe_name(course_name))
+        parts = []
+        for label in sorted(
+            angles, key=lambda a: (angle_index(a) is None, angle_index(a) or 0)
+        ):
+            path = os.path.join(course_dir, video_filename(begin_time, label))
+            complete = path not in unfinished and size_matches(
+                path, angles[label], expected_sizes
+            )
+            if label in ("Teacher", "Student", "PPT"):
+                short = label[0]
+            else:
+                short = f"A{label[5:]}"
+            parts.append(f"{short}{'✓' if complete else '…'}")
+        return " ".join(parts)
+
+    def _course_rows(self, course_name):
+        """
+        Return the table rows for a course (or ALL_RECORDINGS), sorted
+        newest first; the cells of a row are built when it is first drawn.
+        """
+        rows = self.row_cache.get(course_name)
+        if rows is not None:
+            return rows
+
+        if course_name is ALL_RECORDINGS:
+            recordings = [r for records in self.course_data.values() for r in records]
+        else:
+            recordings = self.course_data.get(course_name, [])
         visible_recordings = filter_downloadable_records(recordings)
         visible_recordings.sort(key=lambda x: x.get("courBeginTime", ""), reverse=True)
 
-        for rec in visible_recordings:
-            teacher = (
-                rec.get("teacNames", ["Unknown"])[0]
-                if rec.get("teacNames")
-                else "Unknown"
-            )
-            row_key = str(rec.get("id"))
-            table.add_row(
-                rec.get("courBeginTime", "Unknown"),
-                rec.get("clroName", "Unknown"),
-                teacher,
-                str(rec.get("courPlayCount", 0)),
-                row_key,
-                key=row_key,
-            )
+        unfinished = self._unfinished_paths()
+        expected_sizes = self._expected_sizes()
+        with_course = course_name is ALL_RECORDINGS
 
-        self.query_one("#status_bar", Static).update(
-            f"Showing {len(visible_recordings)} recordings for {course_name}"
+        def make_row(rec):
+            return self._record_row(rec, unfinished, expected_sizes, with_course)
+
+        rows = LazyRows(visible_recordings, make_row)
+        self.row_cache[course_name] = rows
+        return rows
+
+    def _record_row(self, rec, unfinished, expected_sizes, with_course=False):
+        course_name = rec.get("subjName", "Unknown Course")
+        teacher = (
+            rec.get("teacNames", ["Unknown"])[0] if rec.get("teacNames") else "Unknown"
         )
+        row = [
+            rec.get("courBeginTime", "Unknown"),
+            rec.get("clroName", "Unknown"),
+            teacher,
+            str(rec.get("courPlayCount", 0)),
+            self._local_status(course_name, rec, unfinished, expected_sizes),
+            str(rec.get("id")),
+        ]
+        if with_course:
+            row.insert(1, course_name)
+        return row
+
+    def invalidate_row_cache(self, course_name=None):
+        """Drop cached rows for one course, or all courses if none is given."""
+        if course_name is None:
+            self.row_cache.clear()
+            self.table_course_name = None
+        else:
+            self.row_cache.pop(course_name, None)
+            self.row_cache.pop(ALL_RECORDINGS, None)
+            if self.table_course_name in (course_name, ALL_RECORDINGS):
+                self.table_course_name = None
 
-    async def load_courses(self):
-        self.query_one("#status_bar", Static).update("Loading curriculum...")
+    def update_recordings_table(self, course_name, keep_cursor=False):
+        """Update the right pane with recordings for the selected course."""
+        rows = self._course_rows(course_name)
+        if course_name is ALL_RECORDINGS:
+            columns = ALL_COLUMNS
+            course_name_label = "all courses"
+        else:
+            columns = COURSE_COLUMNS
+            course_name_label = course_name
+        self.query_one(VirtualTable).set_rows(rows, columns, keep_cursor=keep_cursor)
+        self.table_course_name = course_name
 
+        self.query_one("#status_bar", Static).update(
+            f"Showing {len(rows)} recordings for {course_name_label}"
+        )
+
+    def _date_range(self):
         start_date = self.start_date
         end_date = self.end_date
 
@@ -653,152 +1589,365 @@ class CourseApp(App):
             start_date = (datetime.now() - timedelta(days=150)).strftime("%Y-%m-%d")
         if not end_date:
             end_date = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+        return start_date, end_date
+
+    def _course_label(self, course):
+        count = len(filter_downloadable_records(self.course_data.get(course, [])))
+        return f"{course} ({count})"
+
+    async def rebuild_course_list(self, records):
+        """Index records per course and rebuild the sidebar from scratch."""
+        self.course_index = CourseIndex(records)
+        await self.render_course_list()
+
+    async def render_course_list(self):
+        """Rebuild the sidebar from the course index for the current date range."""
+        start_date, end_date = self._date_range()
+
+        # Client-side filtering to ensure strict date range adherence
+        # (API might be loose or ignore params)
+        self.course_data.clear()
+        self.course_id_map.clear()
+        self.course_item_ids.clear()
+        self.invalidate_row_cache()
+        for course in self.course_index.courses():
+            recordings = self.course_index.in_range(course, start_date, end_date)
+            if recordings:
+                self.course_data[course] = list(recordings)
+
+        list_view = self.query_one("#course-list", ListView)
+        await list_view.clear()
+
+        sorted_courses = sorted(self.course_data.keys())
+        for index, course in enumerate(sorted_courses):
+            safe_id = f"course-{uuid.uuid4().hex}"
+            self.course_id_map[safe_id] = course
+            self.course_item_ids[course] = safe_id
+
+            list_view.append(ListItem(Label(self._course_label(course)), id=safe_id))
+
+        self.show_load_summary()
+
+        if sorted_courses:
+            list_view.index = 0
+            first_item = list_view.children[0]
+            if first_item and first_item.id in self.course_id_map:
+                self.current_course_name = self.course_id_map[first_item.id]
+                self.flush_table_update()
+
+    def show_load_summary(self):
+        start_date, end_date = self._date_range()
+        visible_total = sum(
+            len(filter_downloadable_records(records))
+            for records in self.course_data.values()
+        )
+        self.query_one("#status_bar", Static).update(
+            f"Loaded {visible_total} recordings (filtered from {len(self.course_index)}) "
+            f"across {len(self.course_data)} courses ({start_date} to {end_date})."
+        )
+
+    async def load_offline_courses(self):
+        """Show catalog records (and stray files) that are on disk."""
+        self.query_one("#status_bar", Static).update("Scanning downloaded files...")
+        records = await asyncio.to_thread(
+            offline_records,
+            self.download_dir,
+            list(self.catalog.records.values()),
+            self._unfinished_paths(),
+            self._expected_sizes(),
+        )
+        await self.rebuild_course_list(records)
+
+    @traced("load_courses")
+    async def load_courses(self):
+        self.query_one("#status_bar", Static).update("Loading curriculum...")
+
+        # With an empty sidebar, show courses page by page as they arrive;
+        # otherwise keep what is on screen until the full result is in.
+        streaming = not self.course_id_map
+        self.load_generation += 1
+        generation = self.load_generation
+        # The shielded fetch outlives a cancelled load, e.g. after switching
+        # accounts; its pages must not reach the other account's sidebar
+        account = self.account
+        streamed = 0
+        if streaming:
+            self.course_index = CourseIndex()
+            self.course_data.clear()
+
+        async def on_records(page, records):
+            nonlocal streamed
+            if generation != self.load_generation or account is not self.account:
+                return
+            streamed += len(records)
+            affected = self.apply_record_changes([(None, r) for r in records])
+            await self.refresh_course_items(affected)
 
         try:
-            all_records = []
-            page_index = 1
-            page_size = 500  # We use 500 to be safe, or 1000 if supported. User said 1000 is max.
-
-            async with httpx.AsyncClient(
-                cookies=self.cookies, headers=self.headers, verify=False
-            ) as client:
-                while True:
-                    self.query_one("#status_bar", Static).update(
-                        f"Loading curriculum (Page {page_index})..."
-                    )
+            status_bar = self.query_one("#status_bar", Static)
+            all_records = await self.api.fetch_curriculum(
+                on_page=lambda page: status_bar.update(
+                    f"Loading curriculum (Page {page})..."
+                ),
+                on_records=on_records if streaming else None,
+            )
 
-                    params = {
-                        "page.pageIndex": page_index,
-                        "page.pageSize": page_size,
-                    }
+            self.catalog.replace_all(all_records)
+            await asyncio.to_thread(self.catalog.save)
+            if streaming and streamed == len(all_records):
+                self.show_load_summary()
+            else:
+                # Joined a fetch started elsewhere, or nothing was streamed
+                await self.rebuild_course_list(all_records)
 
-                    response = await client.get(CURRICULUM_API_URL, params=params)
-                    response.raise_for_status()
-                    data = response.json()
+        except Exception as e:
+            self.query_one("#status_bar", Static).update(f"Error: {e}")
+            self.notify(f"Error loading courses: {e}", severity="error")
 
-                    new_records = data.get("data", {}).get("records", [])
-                    if not new_records:
-                        break
+    def apply_record_changes(self, changes):
+        """Patch the index and course_data with (old, new) record pairs.
+
+        Returns the courses whose visible recordings may have changed.
+        """
+        start_date, end_date = self._date_range()
+        affected = set()
+        for old, new in changes:
+            if old is not None:
+                self.course_index.remove(old)
+                affected.add(old.get("subjName", "Unknown Course"))
+            if new is not None:
+                self.course_index.add(new)
+                affected.add(new.get("subjName", "Unknown Course"))
+        for course in affected:
+            self.course_data[course] = list(
+                self.course_index.in_range(course, start_date, end_date)
+            )
+        return affected
+
+    async def refresh_course_items(self, courses):
+        """Update sidebar entries and the table for the given courses only."""
+        list_view = self.query_one("#course-list", ListView)
+        for course in sorted(courses):
+            self.invalidate_row_cache(course)
+            item_id = self.course_item_ids.get(course)
+
+            if not self.course_data.get(course):
+                self.course_data.pop(course, None)
+                if item_id:
+                    item = list_view.query_one(f"#{item_id}", ListItem)
+                    await list_view.pop(list(list_view.children).index(item))
+                    del self.course_item_ids[course]
+                    del self.course_id_map[item_id]
+                continue
+
+            label = self._course_label(course)
+            if item_id:
+                list_view.query_one(f"#{item_id}", ListItem).query_one(Label).update(
+                    label
+                )
+            else:
+                index = bisect_left(sorted(self.course_item_ids), course)
+                safe_id = f"course-{uuid.uuid4().hex}"
+                self.course_id_map[safe_id] = course
+                self.course_item_ids[course] = safe_id
+                await list_view.insert(index, [ListItem(Label(label), id=safe_id)])
+                # Keep the highlight on the same course
+                if list_view.index is not None and index <= list_view.index:
+                    list_view.index += 1
+
+        if list_view.index is None and self.course_item_ids:
+            # First courses of a streamed load; highlighting shows the table
+            list_view.index = 0
+
+        if self.show_all:
+            self.update_recordings_table(ALL_RECORDINGS, keep_cursor=True)
+        elif self.current_course_name in courses:
+            if self.current_course_name in self.course_data:
+                self.update_recordings_table(self.current_course_name)
+            else:
+                self.query_one(VirtualTable).clear()
+                self.table_course_name = None
+
+    @traced("sync_courses")
+    async def sync_courses(self):
+        """Fetch only records at or after the catalog's high-water mark."""
+        if not self.course_id_map and self.catalog.records:
+            # Show the last known catalog right away, then bring it up to date
+            await self.rebuild_course_list(list(self.catalog.records.values()))
+
+        mark = self.catalog.high_water_mark
+        if mark is None or not self.course_id_map:
+            await self.load_courses()
+            return
 
-                    all_records.extend(new_records)
+        status_bar = self.query_one("#status_bar", Static)
+        status_bar.update("Syncing curriculum...")
+        try:
+            records = await self.api.fetch_curriculum_since(
+                mark,
+                on_page=lambda page: status_bar.update(
+                    f"Syncing curriculum (Page {page})..."
+                ),
+            )
+        except Exception as e:
+            status_bar.update(f"Error: {e}")
+            self.notify(f"Error syncing courses: {e}", severity="error")
+            return
 
-                    # If we got fewer records than requested, we've reached the last page
-                    if len(new_records) < page_size:
-                        break
+        if records is None:
+            # Server ignored the requested ordering; a delta is not safe
+            await self.load_courses()
+            return
 
-                    page_index += 1
+        changes = self.catalog.apply_delta(records)
+        await asyncio.to_thread(self.catalog.save)
+        affected = self.apply_record_changes(changes)
+        await self.refresh_course_items(affected)
 
-            # Client-side filtering to ensure strict date range adherence
-            # (API might be loose or ignore params)
-            filtered_records = []
-            for record in all_records:
-                # courBeginTime format is typically "YYYY-MM-DD HH:MM:SS"
-                begin_time = record.get("courBeginTime", "")
-                if not begin_time:
-                    continue
+        status_bar.update(
+            f"Synced {len(records)} recent records: {len(changes)} changed across {len(affected)} courses."
+        )
 
-                # Compare string prefixes (YYYY-MM-DD)
-                # start_date/end_date are "YYYY-MM-DD"
-                # We simply check if the date part is within range
-                rec_date = begin_time.split(" ")[0]
-                if start_date <= rec_date <= end_date:
-                    filtered_records.append(record)
+    def action_refresh(self):
+        self.start_load_courses()
 
-            self.course_data.clear()
-            self.course_id_map.clear()
-            for record in filtered_records:
-                subj_name = record.get("subjName", "Unknown Course")
-                self.course_data[subj_name].append(record)
-
-            list_view = self.query_one("#course-list", ListView)
-            await list_view.clear()
-
-            sorted_courses = sorted(self.course_data.keys())
-            visible_total = 0
-            for index, course in enumerate(sorted_courses):
-                count = len(filter_downloadable_records(self.course_data[course]))
-                visible_total += count
-                safe_id = f"course-{uuid.uuid4().hex}"
-                self.course_id_map[safe_id] = course
+    def action_date_range(self):
+        start_date, end_date = self._date_range()
+        self.push_screen(DateRangeModal(start_date, end_date), self.set_date_range)
+
+    def set_date_range(self, date_range):
+        """Re-filter the loaded records; only an empty index needs the API."""
+        if not date_range:
+            return
+        self.start_date, self.end_date = date_range
+        if not len(self.course_index):
+            # Nothing loaded yet: the curriculum holds every date, fetch it
+            self.start_load_courses()
+            return
+        # The curriculum is fetched without date parameters, so the index
+        # already covers any range; re-slicing it is enough.
+        self.run_worker(
+            self.render_course_list(),
+            group="render-courses",
+            exclusive=True,
+            exit_on_error=False,
+        )
 
-                list_view.append(ListItem(Label(f"{course} ({count})"), id=safe_id))
+    def action_full_refresh(self):
+        self.start_load_courses(full=True)
 
-            self.query_one("#status_bar", Static).update(
-                f"Loaded {visible_total} recordings (filtered from {len(all_records)}) across {len(self.course_data)} courses."
-            )
+    def action_switch_account(self):
+        if len(self.accounts) < 2:
+            self.notify("Only one account is configured", severity="warning")
+            return
+        self.push_screen(
+            AccountSelectModal(self.accounts, self.account), self.set_account
+        )
 
-            if sorted_courses:
-                list_view.index = 0
-                first_item = list_view.children[0]
-                if first_item and first_item.id in self.course_id_map:
-                    course_name = self.course_id_map[first_item.id]
-                    self.current_course_name = course_name
-                    self.update_recordings_table(course_name)
+    def set_account(self, account):
+        if account is None or account is self.account:
+            return
+        # Replaces any curriculum load of the previous account
+        self.run_worker(
+            self.switch_account(account),
+            group="load-courses",
+            exclusive=True,
+            exit_on_error=False,
+        )
 
-        except Exception as e:
-            self.query_one("#status_bar", Static).update(f"Error: {e}")
-            self.notify(f"Error loading courses: {e}", severity="error")
+    async def switch_account(self, account):
+        """
+        Show the courses of another account. Downloads keep running: the
+        pool, queue and local index are shared by all accounts.
+        """
+        # Callbacks of loads started for the previous account stop here
+        self.load_generation += 1
+        self.account = account
+        self.api = account.api
+        self.update_sub_title()
+        self.catalog = await asyncio.to_thread(
+            Catalog.load, account.path(self.download_dir, CATALOG_FILENAME)
+        )
+        # Video URLs carry the auth keys of the account that fetched them
+        self.vod_list_cache.clear()
+        self.current_course_name = None
+        self.table_course_name = None
+        self.query_one(VirtualTable).clear()
+        await self.rebuild_course_list([])
+        if self.offline:
+            await self.load_offline_courses()
+        else:
+            await self.sync_courses()
 
-    async def action_refresh(self):
-        await self.load_courses()
+    def _account_named(self, name):
+        """Account of a queue entry; entries of removed accounts use the current."""
+        for account in self.accounts:
+            if account.name == name:
+                return account
+        return self.account
 
     def action_focus_sidebar(self):
         self.query_one("#course-list").focus()
 
     def action_focus_content(self):
-        self.query_one(DataTable).focus()
+        self.flush_table_update()
+        self.query_one(VirtualTable).focus()
 
     def action_cursor_down(self):
         focused = self.focused
         if isinstance(focused, ListView):
             focused.action_cursor_down()
-        elif isinstance(focused, DataTable):
+        elif isinstance(focused, VirtualTable):
             focused.action_cursor_down()
 
     def action_cursor_up(self):
         focused = self.focused
         if isinstance(focused, ListView):
             focused.action_cursor_up()
-        elif isinstance(focused, DataTable):
+        elif isinstance(focused, VirtualTable):
             focused.action_cursor_up()
 
     async def open_course_video(self, course_id):
         self.query_one("#status_bar", Static).update(
             f"Fetching video URL for course {course_id}..."
         )
-        params = {"courseId": course_id}
 
         try:
-            async with httpx.AsyncClient(
-                cookies=self.cookies, headers=self.headers, verify=False
-            ) as client:
-                response = await client.get(DETAIL_API_URL, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                video_list = data.get("data", {}).get("courseVodViewList", [])
-                if video_list:
-                    video_url = video_list[0].get("url")
-                    if video_url:
-                        self.query_one("#status_bar", Static).update(
-                            f"Opening video: {video_url}"
-                        )
-                        webbrowser.open(video_url)
-                        self.notify(f"Opened video in browser")
-                    else:
-                        self.notify(
-                            "No video URL found in response", severity="warning"
-                        )
-                else:
-                    self.notify(
-                        "No videos available for this course", severity="warning"
+            video_list = await self.api.fetch_vod_list(course_id)
+            if video_list:
+                video_url = video_list[0].get("url")
+                if video_url:
+                    self.query_one("#status_bar", Static).update(
+                        f"Opening video: {video_url}"
                     )
+                    webbrowser.open(video_url)
+                    self.notify(f"Opened video in browser")
+                else:
+                    self.notify("No video URL found in response", severity="warning")
+            else:
+                self.notify("No videos available for this course", severity="warning")
 
         except Exception as e:
             self.query_one("#status_bar", Static).update(f"Error fetching video: {e}")
             self.notify(f"Error: {e}", severity="error")
 
 
+async def find_probe_url(api):
+    """URL of a recent published recording, for the autotune probe."""
+    records = filter_downloadable_records(await api.fetch_curriculum())
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    past = sorted(
+        (r for r in records if r.get("courBeginTime", "") < now),
+        key=lambda r: r.get("courBeginTime", ""),
+        reverse=True,
+    )
+    for record in past[:10]:
+        for video in await api.fetch_vod_list(record.get("id")):
+            if video.get("url"):
+                return video["url"]
+    return None
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="HDU Course TUI")
     parser.add_argument(
@@ -806,27 +1955,182 @@ if __name__ == "__main__":
         default="config.json",
         help="Path to configuration file (default: config.json)",
     )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Hardlink duplicate files in download_dir into the blob store and exit",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run headless and download new recordings as they are published",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Browse and play downloaded recordings without contacting the API",
+    )
+    parser.add_argument(
+        "--faststart",
+        action="store_true",
+        help="Move the index of downloaded videos to the front and exit",
+    )
+    parser.add_argument(
+        "--autotune",
+        action="store_true",
+        help="Probe the video server now and save tuned aria2 parameters",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Record spans of loads, batches and downloads "
+        "(FILE.json: Chrome trace format, otherwise JSON lines)",
+    )
     args = parser.parse_args()
 
-    (
-        cookies,
-        headers,
-        downloader,
-        download_angles,
-        start_date,
-        end_date,
-        aria2_args,
-        download_dir,
-    ) = load_config(args.config)
+    if args.trace:
+        tracing.configure(args.trace)
+
+    config = load_config(args.config)
+
+    if args.dedupe:
+        if not config.blob_store:
+            print("Error: 'blob_store' is disabled in the configuration.")
+            sys.exit(1)
+        linked, saved = BlobStore(config.blob_store).dedupe(
+            config.download_dir, notify=print
+        )
+        print(f"Linked {linked} duplicate files, saved {saved / 1024**3:.2f} GiB.")
+        sys.exit(0)
+
+    if args.faststart:
+        store = BlobStore(config.blob_store) if config.blob_store else None
+        # Rewritten files change size; keep the journaled sizes in step
+        queues = [
+            DownloadQueue(os.path.join(config.download_dir, QUEUE_DIRNAME)),
+            DownloadQueue(
+                os.path.join(config.download_dir, QUEUE_DIRNAME, WATCH_QUEUE_DIRNAME)
+            ),
+        ]
+        rewritten, failed = remux_library(config.download_dir, store, queues=queues)
+        print(f"Rewrote {rewritten} videos for fast start.")
+        if store is not None:
+            # Blobs of the old layouts are no longer linked from anywhere
+            removed, freed = store.prune()
+            print(f"Removed {removed} stale blobs, freed {freed / 1024**3:.2f} GiB.")
+        sys.exit(1 if failed else 0)
+
+    tuning = (
+        TuningStore.load(os.path.join(config.download_dir, TUNING_FILENAME))
+        if config.aria2_autotune
+        else None
+    )
+
+    if args.autotune:
+        try:
+            url = asyncio.run(
+                find_probe_url(
+                    VodClient(
+                        config.cookies,
+                        config.headers,
+                        api_base=config.api_base,
+                        http_cache=(
+                            HttpCache(config.http_cache) if config.http_cache else None
+                        ),
+                    )
+                )
+            )
+        except Exception as e:
+            print(f"Error: failed to look up a recording to probe: {e}")
+            sys.exit(1)
+        if not url:
+            print("Error: no published recording found to probe.")
+            sys.exit(1)
+        params = asyncio.run(probe(url, progress=print))
+        for connections, speed in params["results"].items():
+            print(f"  {connections:>2} connections: {speed / 1024**2:.1f} MiB/s")
+        TuningStore.load(os.path.join(config.download_dir, TUNING_FILENAME)).set(
+            url_host(url), params
+        )
+        print(
+            f"Saved for {url_host(url)}: -x {params['connections']} "
+            f"-s {params['split']} -k {params['min_split_size']}"
+        )
+        sys.exit(0)
+
+    if args.watch:
+        # Every account's watcher shares these, so the limits hold for all
+        manager = DownloaderManager(
+            preferred_downloader=config.downloader,
+            aria2_args=config.aria2_args,
+            tuning=tuning,
+        )
+        download_pool = DownloadPool(
+            manager, max_concurrent=config.max_concurrent_downloads
+        )
+        slide_extractor = SlideExtractor()
+        faststart_pool = FastStartPool() if config.faststart else None
+        transport = SharedTransport()
+        shared_cache = HttpCache(config.http_cache) if config.http_cache else None
+        host_selector = (
+            HostSelector(config.video_mirrors) if config.video_mirrors else None
+        )
+        watch_queue = DownloadQueue(
+            os.path.join(config.download_dir, QUEUE_DIRNAME, WATCH_QUEUE_DIRNAME)
+        )
+        watchers = [
+            CourseWatcher(
+                api=VodClient(
+                    account_cookies,
+                    account_headers,
+                    api_base=config.api_base,
+                    host_selector=host_selector,
+                    http_cache=shared_cache,
+                    transport=transport,
+                ),
+                downloader_manager=manager,
+                download_dir=config.download_dir,
+                download_angles=config.download_angles,
+                start_date=config.start_date,
+                end_date=config.end_date,
+                days_back=config.days_back,
+                days_forward=config.days_forward,
+                processing_delay_minutes=config.watch_delay_minutes,
+                max_concurrent_downloads=config.max_concurrent_downloads,
+                ppt_mode=config.ppt_mode,
+                faststart=config.faststart,
+                account=name,
+                download_pool=download_pool,
+                slide_extractor=slide_extractor,
+                faststart_pool=faststart_pool,
+                download_queue=watch_queue,
+            )
+            for name, account_cookies, account_headers in config.accounts
+        ]
+        try:
+            asyncio.run(run_watchers(watchers))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
     app = CourseApp(
-        cookies=cookies,
-        headers=headers,
-        downloader=downloader,
-        download_angles=download_angles,
-        start_date=start_date,
-        end_date=end_date,
-        aria2_args=aria2_args,
-        download_dir=download_dir,
+        cookies=config.cookies,
+        headers=config.headers,
+        downloader=config.downloader,
+        download_angles=config.download_angles,
+        start_date=config.start_date,
+        end_date=config.end_date,
+        aria2_args=config.aria2_args,
+        download_dir=config.download_dir,
+        blob_store=config.blob_store,
+        api_base=config.api_base,
+        max_concurrent_downloads=config.max_concurrent_downloads,
+        aria2_autotune=config.aria2_autotune,
+        video_mirrors=config.video_mirrors,
+        offline=args.offline,
+        ppt_mode=config.ppt_mode,
+        faststart=config.faststart,
+        http_cache=config.http_cache,
+        accounts=config.accounts,
     )
     app.run()
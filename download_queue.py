@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import httpx
+
+from slides import slides_complete
+from tracing import span
+
+QUEUE_DIRNAME = ".queue"
+JOURNAL_FILENAME = "journal.jsonl"
+
+# Rewrite the journal on load once it holds this many superseded lines
+COMPACT_THRESHOLD = 1000
+
+PENDING = "pending"
+ACTIVE = "active"
+DONE = "done"
+# Terminal: work that failed in a way a retry will not fix (e.g. slide
+# extraction of a broken video). Failed downloads go back to PENDING.
+FAILED = "failed"
+EXPIRED = "expired"
+
+UNFINISHED_STATES = {PENDING, ACTIVE, EXPIRED}
+
+
+def entry_key(record_id, angle):
+    return f"{record_id}:{angle}"
+
+
+def make_entry(record_id, angle, url, path, course=None, slides=None, account=None):
+    """
+    slides: "slides"/"pdf" to keep only the slides of the video at path.
+    account: name of the account whose API resolves the URL again.
+    """
+    return {
+        "key": entry_key(record_id, angle),
+        "record_id": str(record_id),
+        "angle": angle,
+        "url": url,
+        "path": path,
+        "course": course,
+        "slides": slides,
+        "account": account,
+        "state": PENDING,
+        "bytes_done": 0,
+        "total_bytes": None,
+    }
+
+
+def output_exists(entry):
+    if entry.get("slides"):
+        return slides_complete(entry["path"], entry["slides"])
+    return os.path.exists(entry["path"])
+
+
+def local_size(path):
+    """Bytes on disk for a download target, including a .part file in progress."""
+    for candidate in (path, f"{path}.part"):
+        try:
+            return os.path.getsize(candidate)
+        except OSError:
+            continue
+    return 0
+
+
+class DownloadQueue:
+    """
+    Append-only journal of download work.
+
+    Every change is appended as one JSON line and fsynced before the work it
+    describes starts, so the queue can be replayed after a crash or reboot.
+
+    Methods may be called from worker threads (e.g. a large add via
+    asyncio.to_thread) while the event loop updates entries; a lock keeps
+    journal lines and the entries dict consistent.
+
+    A process that only reads a journal another process writes (the TUI
+    reading the watcher's) passes compact=False and calls refresh().
+    """
+
+    def __init__(self, directory, compact=True):
+        self.directory = directory
+        self.journal_path = os.path.join(directory, JOURNAL_FILENAME)
+        self.entries = {}
+        self._journal_lines = 0
+        self._loaded_stamp = None
+        self._lock = threading.RLock()
+        self._load()
+        if compact and self._journal_lines - len(self.entries) > COMPACT_THRESHOLD:
+            self.compact()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.journal_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load(self):
+        self._loaded_stamp = self._stamp()
+        if self._loaded_stamp is None:
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash; everything before it is intact
+                    continue
+                self._apply(event)
+                self._journal_lines += 1
+
+    def refresh(self):
+        """Re-read the journal if another process has written to it."""
+        with self._lock:
+            if self._stamp() == self._loaded_stamp:
+                return
+            self.entries = {}
+            self._journal_lines = 0
+            self._load()
+
+    def _apply(self, event):
+        key = event.get("key")
+        if event.get("op") == "add":
+            entry = dict(event)
+            entry.pop("op", None)
+            self.entries[key] = entry
+        elif key in self.entries:
+            entry = self.entries[key]
+            for field in ("state", "bytes_done", "total_bytes", "url", "updated"):
+                if field in event:
+                    entry[field] = event[field]
+
+    def _append(self, events):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            for event in events:
+                self._apply(event)
+            self._journal_lines += len(events)
+
+    def add(self, entries):
+        """Record new work; entries already done are left untouched."""
+        with span("queue_add", entries=len(entries)) as trace, self._lock:
+            events = []
+            for entry in entries:
+                existing = self.entries.get(entry["key"])
+                if (
+                    existing
+                    and existing["state"] == DONE
+                    and existing.get("slides") == entry.get("slides")
+                    and output_exists(existing)
+                ):
+                    continue
+                events.append({"op": "add", **entry, "updated": time.time()})
+            if events:
+                self._append(events)
+            trace.set(queued=len(events))
+            return [self.entries[e["key"]] for e in events]
+
+    def update(self, key, **fields):
+        self.update_entries([(key, fields)])
+
+    def update_many(self, keys, **fields):
+        self.update_entries([(key, fields) for key in keys])
+
+    def update_entries(self, updates):
+        """Journal a list of (key, fields) changes with a single fsync."""
+        now = time.time()
+        with self._lock:
+            events = [
+                {"op": "update", "key": key, **fields, "updated": now}
+                for key, fields in updates
+                if key in self.entries
+            ]
+            if events:
+                self._append(events)
+
+    def unfinished(self):
+        with self._lock:
+            return [
+                e for e in self.entries.values() if e["state"] in UNFINISHED_STATES
+            ]
+
+    def expected_sizes(self):
+        """{path: total_bytes} of the videos whose full size is known."""
+        with self._lock:
+            return {
+                e["path"]: e["total_bytes"]
+                for e in self.entries.values()
+                if e.get("total_bytes") and not e.get("slides")
+            }
+
+    def record_size(self, path, size):
+        """Journal the new size of a finished file rewritten in place (remux)."""
+        with self._lock:
+            self.update_entries(
+                [
+                    (e["key"], {"bytes_done": size, "total_bytes": size})
+                    for e in self.entries.values()
+                    if e["path"] == path and e["state"] == DONE and not e.get("slides")
+                ]
+            )
+
+    def compact(self):
+        """Rewrite the journal with one add line per entry."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{self.journal_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    line = json.dumps({"op": "add", **entry}, ensure_ascii=False)
+                    f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.journal_path)
+            self._journal_lines = len(self.entries)
+
+    def write_list_file(self, entries, name):
+        """Write an aria2-style input file (URL + out=) for entries."""
+        os.makedirs(self.directory, exist_ok=True)
+        list_file = os.path.join(self.directory, f"urls_{name}.txt")
+        with span("write_list_file", name=name, entries=len(entries)):
+            with open(list_file, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(f"{entry['url']}\n")
+                    f.write(f"  out={os.path.basename(entry['path'])}\n")
+        return list_file
+
+
+async def remote_size(client, url):
+    """Total size of url via a one-byte range request, or None if it failed."""
+    try:
+        async with client.stream("GET", url, headers={"Range": "bytes=0-0"}) as r:
+            if r.status_code == 206:
+                total = r.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+                return int(total) if total.isdigit() else None
+            if r.status_code == 200:
+                length = r.headers.get("Content-Length")
+                return int(length) if length and length.isdigit() else None
+    except httpx.HTTPError:
+        pass
+    return None
+
+
+async def reconcile(queue, entries, concurrency=6):
+    """
+    Compare unfinished entries with what is on disk.
+
+    Entries whose file is complete become done; entries whose URL no longer
+    answers become expired (their URL must be resolved again); the rest
+    keep their state with bytes_done refreshed. Returns the entries that
+    can be resumed with their stored URL.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(client, entry):
+        async with semaphore:
+            total = await remote_size(client, entry["url"])
+        return entry, total
+
+    async with httpx.AsyncClient(verify=False, follow_redirects=True) as client:
+        results = await asyncio.gather(*(check(client, e) for e in entries))
+
+    resumable = []
+    updates = []
+    for entry, total in results:
+        if entry.get("slides"):
+            # Slide extraction starts over; only its finished output counts
+            if output_exists(entry):
+                updates.append((entry["key"], {"state": DONE}))
+            elif total is None:
+                updates.append((entry["key"], {"state": EXPIRED}))
+            else:
+                resumable.append(entry)
+            continue
+        done_bytes = local_size(entry["path"])
+        control_file = os.path.exists(f"{entry['path']}.aria2")
+        if total is None:
+            if entry.get("total_bytes") and done_bytes == entry["total_bytes"]:
+                updates.append((entry["key"], {"state": DONE, "bytes_done": done_bytes}))
+            else:
+                updates.append(
+                    (entry["key"], {"state": EXPIRED, "bytes_done": done_bytes})
+                )
+            continue
+        fields = {"bytes_done": done_bytes, "total_bytes": total}
+        if done_bytes == total and not control_file:
+            fields["state"] = DONE
+        else:
+            resumable.append(entry)
+        updates.append((entry["key"], fields))
+    queue.update_entries(updates)
+    return resumable
@@ -1,14 +1,22 @@
+import asyncio
 import shutil
 import subprocess
 import os
 import platform
+import re
+import time
 from urllib.parse import urlparse
 
+from autotune import TUNED_FLAGS, strip_flags, url_host
+from tracing import span
+
 
 class DownloaderManager:
-    def __init__(self, preferred_downloader=None, aria2_args=None):
+    def __init__(self, preferred_downloader=None, aria2_args=None, tuning=None):
         self.preferred_downloader = preferred_downloader
         self.aria2_args = aria2_args or ["-j", "16", "-x", "16", "-s", "16", "-k", "1M"]
+        # Optional autotune.TuningStore with probed per-host parameters
+        self.tuning = tuning
         self.is_windows = platform.system() == "Windows"
 
         if self.is_windows:
@@ -51,8 +59,12 @@ class DownloaderManager:
 
         return False, None
 
-    def _aria2_args_with_defaults(self):
+    def _aria2_args_with_defaults(self, video_url=None):
         args = list(self.aria2_args)
+        if self.tuning and video_url:
+            tuned = self.tuning.aria2_args(url_host(video_url))
+            if tuned:
+                args = strip_flags(args, TUNED_FLAGS) + tuned
 
         def has_flag(flag_name):
             return any(
@@ -69,6 +81,55 @@ class DownloaderManager:
 
         return defaults + args
 
+    def select_cli_tool(self):
+        """Pick the CLI downloader for supervised jobs, honouring the preference."""
+        preferred = (self.preferred_downloader or "").lower()
+        if preferred == "fdm":
+            return None
+        if preferred in {"aria2c", "wget", "curl"} and shutil.which(preferred):
+            return preferred
+        for tool in ("aria2c", "wget", "curl"):
+            if shutil.which(tool):
+                return tool
+        return None
+
+    def build_command(self, tool, video_url, destination_dir, output_filename):
+        """Argument list for a non-interactive download with parseable progress."""
+        output_path = os.path.join(destination_dir, output_filename)
+        if tool == "aria2c":
+            return (
+                ["aria2c", "-d", destination_dir, "-o", output_filename, video_url]
+                + self._aria2_args_with_defaults(video_url)
+                + [
+                    "--summary-interval=1",
+                    "--console-log-level=warn",
+                    "--enable-color=false",
+                    "--show-console-readout=true",
+                ]
+            )
+        if tool == "wget":
+            return [
+                "wget",
+                "-c",
+                "--tries=5",
+                "--progress=dot:mega",
+                "-O",
+                output_path,
+                video_url,
+            ]
+        return [
+            "curl",
+            "-L",
+            "-f",
+            "--retry",
+            "5",
+            "-C",
+            "-",
+            "-o",
+            output_path,
+            video_url,
+        ]
+
     def download_video(
         self,
         video_url,
@@ -128,7 +189,7 @@ class DownloaderManager:
                                 else f'wget "{video_url}"'
                             )
                     elif preferred == "aria2c":
-                        final_args = self._aria2_args_with_defaults()
+                        final_args = self._aria2_args_with_defaults(video_url)
                         args_str = " ".join(final_args)
                         if output_filename:
                             if destination_dir:
@@ -191,7 +252,7 @@ class DownloaderManager:
                         )
                         return
                     if preferred == "aria2c":
-                        final_args = self._aria2_args_with_defaults()
+                        final_args = self._aria2_args_with_defaults(video_url)
                         if output_filename:
                             if destination_dir:
                                 subprocess.Popen(
@@ -271,7 +332,7 @@ class DownloaderManager:
                 )
         elif shutil.which("aria2c"):
             cli_tool = "aria2c"
-            final_args = self._aria2_args_with_defaults()
+            final_args = self._aria2_args_with_defaults(video_url)
             args_str = " ".join(final_args)
             if output_filename:
                 if destination_dir:
@@ -352,7 +413,7 @@ class DownloaderManager:
                 notify(f"Background download failed: {e}", severity="error")
         elif shutil.which("aria2c"):
             try:
-                final_args = self._aria2_args_with_defaults()
+                final_args = self._aria2_args_with_defaults(video_url)
                 if output_filename:
                     if destination_dir:
                         subprocess.Popen(
@@ -421,7 +482,9 @@ class DownloaderManager:
 
         # 1. Aria2c (Best for batch)
         if shutil.which("aria2c"):
-            final_args = self._aria2_args_with_defaults()
+            final_args = self._aria2_args_with_defaults(
+                _first_list_url(abs_list_file)
+            )
 
             args_str = " ".join(final_args)
             if self.is_windows:
@@ -478,3 +541,260 @@ class DownloaderManager:
         notify(
             "No suitable batch downloader found (aria2c, wget, curl)", severity="error"
         )
+
+
+def _first_list_url(list_file):
+    """First URL of an aria2 input file; batches are fetched from one host."""
+    try:
+        with open(list_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip() and not line[0].isspace():
+                    return line.strip()
+    except OSError:
+        pass
+    return None
+
+
+# Console readout of aria2c, e.g. "[#2089b0 400.0KiB/33.2MiB(1%) CN:16 DL:1.2MiB ETA:4m]"
+ARIA2_PROGRESS_RE = re.compile(
+    r"\[#\w+\s+([\d.]+[KMGT]?i?B)/([\d.]+[KMGT]?i?B)\((\d+)%\)"
+    r"(?:\s+CN:\d+)?(?:\s+DL:([\d.]+[KMGT]?i?B))?"
+)
+# wget --progress=dot:mega, e.g. " 12288K ........ ........  12% 1.20M 30s"
+WGET_PROGRESS_RE = re.compile(r"^\s*(\d+)K[\s.,]+(\d+)%\s+([\d.,]+[KMG]?)")
+WGET_LENGTH_RE = re.compile(r"^Length:\s+(\d+)")
+# curl progress meter, e.g. " 12  100M   12 12.3M    0     0  1234k      0 ..."
+CURL_PROGRESS_RE = re.compile(
+    r"^\s*(\d+)\s+([\d.]+[kMGT]?)\s+\d+\s+([\d.]+[kMGT]?)\s+\d+\s+\d+\s+([\d.]+[kMGT]?)"
+)
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(text):
+    """Parse sizes like '33.2MiB', '12.3M', '1234k' or '512B' into bytes."""
+    text = text.strip().replace(",", ".")
+    match = re.match(r"([\d.]+)\s*([kKMGT]?)", text)
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def parse_progress_line(tool, line, total_hint=None):
+    """Return (bytes_done, total_bytes, speed) parsed from one output line."""
+    if tool == "aria2c":
+        match = ARIA2_PROGRESS_RE.search(line)
+        if match:
+            speed = parse_size(match.group(4)) if match.group(4) else None
+            return parse_size(match.group(1)), parse_size(match.group(2)), speed
+    elif tool == "wget":
+        match = WGET_PROGRESS_RE.search(line)
+        if match:
+            done = int(match.group(1)) * 1024
+            total = total_hint
+            if total is None and int(match.group(2)):
+                total = done * 100 // int(match.group(2))
+            return done, total, parse_size(match.group(3))
+    elif tool == "curl":
+        match = CURL_PROGRESS_RE.search(line)
+        if match:
+            return (
+                parse_size(match.group(3)),
+                parse_size(match.group(2)),
+                parse_size(match.group(4)),
+            )
+    return None
+
+
+class DownloadEvent:
+    """Progress or completion report for one supervised download."""
+
+    def __init__(
+        self, key, kind, bytes_done=0, total_bytes=None, speed=None, returncode=None
+    ):
+        self.key = key
+        self.kind = kind  # "started", "progress" or "finished"
+        self.bytes_done = bytes_done
+        self.total_bytes = total_bytes
+        self.speed = speed
+        self.returncode = returncode
+
+
+class DownloadJob:
+    def __init__(self, key, tool, argv, output_path, url=None, on_event=None):
+        self.key = key
+        self.url = url
+        self.tool = tool
+        self.argv = argv
+        self.output_path = output_path
+        # Overrides the pool's on_event, for pools shared by several owners
+        self.on_event = on_event
+        self.process = None
+        self.task = None
+        self.bytes_done = 0
+        self.total_bytes = None
+        self.speed = None
+        self.returncode = None
+        # Bytes already on disk at the first progress line, for resumed files
+        self.initial_bytes = None
+        self.started_at = None
+
+
+class DownloadPool:
+    """
+    Runs downloader subprocesses with bounded concurrency.
+
+    Output of each process is parsed into DownloadEvent objects passed to
+    on_event. Processes are always waited for, so none are left as zombies,
+    and no terminal emulator is needed.
+    """
+
+    def __init__(self, manager, max_concurrent=3, on_event=None):
+        self.manager = manager
+        self.tool = manager.select_cli_tool()
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.on_event = on_event
+        self.jobs = {}
+
+    @property
+    def available(self):
+        return self.tool is not None
+
+    def active_jobs(self):
+        return [job for job in self.jobs.values() if job.returncode is None]
+
+    def submit(
+        self, key, video_url, destination_dir, output_filename, on_event=None
+    ):
+        """
+        Queue a download; a job already running for key is kept. on_event
+        receives the events of this job instead of the pool's on_event.
+        """
+        existing = self.jobs.get(key)
+        if existing is not None and existing.returncode is None:
+            return existing
+        os.makedirs(destination_dir, exist_ok=True)
+        argv = self.manager.build_command(
+            self.tool, video_url, destination_dir, output_filename
+        )
+        job = DownloadJob(
+            key,
+            self.tool,
+            argv,
+            os.path.join(destination_dir, output_filename),
+            url=video_url,
+            on_event=on_event,
+        )
+        self.jobs[key] = job
+        job.task = asyncio.ensure_future(self._run(job))
+        return job
+
+    def _emit(self, job, kind):
+        on_event = job.on_event or self.on_event
+        if on_event:
+            on_event(
+                DownloadEvent(
+                    job.key,
+                    kind,
+                    bytes_done=job.bytes_done,
+                    total_bytes=job.total_bytes,
+                    speed=job.speed,
+                    returncode=job.returncode,
+                )
+            )
+
+    async def _run(self, job):
+        with span("download", key=job.key, tool=job.tool) as trace:
+            with span("queued"):
+                await self.semaphore.acquire()
+            try:
+                await self._run_process(job)
+            finally:
+                self.semaphore.release()
+            trace.set(returncode=job.returncode, bytes=job.bytes_done)
+
+    async def _run_process(self, job):
+        try:
+            job.process = await asyncio.create_subprocess_exec(
+                *job.argv,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+        except OSError:
+            job.returncode = -1
+            self._emit(job, "finished")
+            return
+        job.started_at = time.monotonic()
+        self._emit(job, "started")
+
+        buffer = ""
+        try:
+            while True:
+                data = await job.process.stdout.read(4096)
+                if not data:
+                    break
+                buffer += data.decode("utf-8", errors="replace")
+                # Progress meters redraw with \r; treat it as a line break
+                *lines, buffer = re.split(r"[\r\n]", buffer)
+                for line in lines:
+                    self._parse_line(job, line)
+        finally:
+            job.returncode = await job.process.wait()
+        if job.returncode == 0:
+            self._report_throughput(job)
+        else:
+            # wget -O creates the file before the request fails
+            try:
+                if os.path.getsize(job.output_path) == 0:
+                    os.remove(job.output_path)
+            except OSError:
+                pass
+        self._emit(job, "finished")
+
+    def _report_throughput(self, job):
+        tuning = self.manager.tuning
+        if tuning is None or job.tool != "aria2c" or not job.url:
+            return
+        moved = job.bytes_done - (job.initial_bytes or 0)
+        tuning.record_throughput(
+            url_host(job.url), moved, time.monotonic() - job.started_at
+        )
+
+    def _parse_line(self, job, line):
+        if job.tool == "wget":
+            match = WGET_LENGTH_RE.search(line)
+            if match:
+                job.total_bytes = int(match.group(1))
+                return
+        parsed = parse_progress_line(job.tool, line, job.total_bytes)
+        if parsed is None:
+            return
+        job.bytes_done, total, job.speed = parsed
+        if job.initial_bytes is None:
+            job.initial_bytes = job.bytes_done
+        if total:
+            job.total_bytes = total
+        self._emit(job, "progress")
+
+    def cancel(self, key):
+        job = self.jobs.get(key)
+        if job and job.process and job.returncode is None:
+            job.process.terminate()
+
+    async def shutdown(self):
+        """Terminate running downloads and wait for them to exit."""
+        tasks = []
+        for job in self.active_jobs():
+            if job.process and job.returncode is None:
+                try:
+                    job.process.terminate()
+                except ProcessLookupError:
+                    pass
+            if job.task:
+                job.task.cancel()
+                tasks.append(job.task)
+        for job in self.jobs.values():
+            if job.process and job.returncode is None:
+                await job.process.wait()
+        await asyncio.gather(*tasks, return_exceptions=True)
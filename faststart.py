@@ -0,0 +1,221 @@
+"""
+Move the moov box of downloaded MP4s in front of the media data.
+
+Server recordings usually end with their moov box, so a player opening a
+local file (or one on a network share) has to seek to the tail before it
+can show the first frame. remux() rewrites such a file as
+ftyp, moov, mdat without touching the samples: the media data is copied
+as is and only the chunk offset tables are shifted by the size of the
+moved box. Files that already start with moov are left alone.
+"""
+
+import multiprocessing
+import os
+import struct
+
+from blobstore import HashingWriter, new_hasher
+from local_library import is_complete
+from mp4clip import (
+    CONTAINER_BOXES,
+    HEADER_PROBE_SIZE,
+    Mp4Error,
+    _full_box_body,
+    child_boxes,
+    make_box,
+    make_full_box,
+    read_box_header,
+)
+from process_pool import ProcessPool
+
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Remuxing is a sequential copy, so more processes than this only make
+# the files contend for the disk
+DEFAULT_WORKERS = 2
+
+
+def top_level_boxes(f, total_size):
+    """[(type, offset, size)] of the top-level boxes of an open file."""
+    boxes = []
+    offset = 0
+    while offset + 8 <= total_size:
+        f.seek(offset)
+        probe = f.read(HEADER_PROBE_SIZE)
+        size, box_type, _ = read_box_header(probe, 0, total_size - offset)
+        boxes.append((box_type, offset, size))
+        offset += size
+    if offset != total_size:
+        raise Mp4Error("File ends inside a box")
+    return boxes
+
+
+def shift_chunk_offsets(box, shift):
+    """
+    Rebuild box with every stco/co64 entry mapped through shift(); stco
+    tables whose new offsets no longer fit 32 bits become co64.
+    """
+    box_type = read_box_header(box, 0)[1]
+    if box_type in CONTAINER_BOXES:
+        children = [shift_chunk_offsets(child, shift) for _, child in child_boxes(box)]
+        return make_box(box_type, b"".join(children))
+    if box_type not in ("stco", "co64"):
+        return box
+
+    _, _, body = _full_box_body(box)
+    (entries,) = struct.unpack_from(">I", body, 0)
+    fmt = "I" if box_type == "stco" else "Q"
+    offsets = [shift(o) for o in struct.unpack_from(f">{entries}{fmt}", body, 4)]
+    if box_type == "stco" and offsets and max(offsets) > 0xFFFFFFFF:
+        box_type, fmt = "co64", "Q"
+    return make_full_box(
+        box_type, 0, 0, struct.pack(f">I{entries}{fmt}", entries, *offsets)
+    )
+
+
+def _copy_range(src, out, start, length):
+    src.seek(start)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK_SIZE, length))
+        if not chunk:
+            raise Mp4Error("File shrank while remuxing")
+        out.write(chunk)
+        length -= len(chunk)
+
+
+def remux(path, hash_output=False):
+    """
+    Rewrite path in place with its moov box first.
+
+    Returns a dict saying whether the file was rewritten, the size of the
+    moov box and, with hash_output, the blob store digest of the result
+    (None when the file was left alone).
+    """
+    with open(path, "rb") as src:
+        before = os.fstat(src.fileno())
+        boxes = top_level_boxes(src, before.st_size)
+        types = [box_type for box_type, _, _ in boxes]
+        if "moov" not in types:
+            raise Mp4Error("No moov box found")
+        if "moof" in types:
+            raise Mp4Error("Fragmented MP4 is not supported")
+        moov_index = types.index("moov")
+        mdat_index = types.index("mdat") if "mdat" in types else len(types)
+        _, moov_offset, moov_size = boxes[moov_index]
+        if moov_index < mdat_index:
+            return {"moved": False, "moov_bytes": moov_size, "digest": None}
+
+        src.seek(moov_offset)
+        moov = src.read(moov_size)
+        insert_at = boxes[mdat_index][1]
+        moov_end = moov_offset + moov_size
+
+        # The new moov can grow when stco tables turn into co64, which
+        # shifts the data again; repeat until its size settles
+        new_size = moov_size
+        for _ in range(4):
+
+            def shift(offset):
+                if offset >= moov_end:
+                    return offset + new_size - moov_size
+                if offset >= insert_at:
+                    return offset + new_size
+                return offset
+
+            new_moov = shift_chunk_offsets(moov, shift)
+            if len(new_moov) == new_size:
+                break
+            new_size = len(new_moov)
+        else:
+            raise Mp4Error("Could not lay out the new moov box")
+
+        hasher = new_hasher() if hash_output else None
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, "wb") as raw:
+                out = HashingWriter(raw, hasher) if hasher is not None else raw
+                _copy_range(src, out, 0, insert_at)
+                out.write(new_moov)
+                _copy_range(src, out, insert_at, moov_offset - insert_at)
+                _copy_range(src, out, moov_end, before.st_size - moov_end)
+            after = os.stat(path)
+            if (after.st_size, after.st_mtime_ns) != (
+                before.st_size,
+                before.st_mtime_ns,
+            ):
+                raise Mp4Error("File changed while remuxing")
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return {
+        "moved": True,
+        "moov_bytes": new_size,
+        "digest": hasher.hexdigest() if hasher is not None else None,
+    }
+
+
+class FastStartPool(ProcessPool):
+    """
+    Runs remux in a pool of processes, so a batch of finished downloads is
+    rewritten in parallel without blocking the event loop. Terminating it
+    leaves the originals of unfinished files untouched.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        super().__init__(max_workers)
+
+    async def remux(self, path, hash_output=False):
+        return await self.run(remux, path, hash_output)
+
+
+def find_videos(directory):
+    """Downloaded .mp4 files under directory, skipping hidden directories."""
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in sorted(files):
+            if name.endswith(".mp4"):
+                yield os.path.join(root, name)
+
+
+def remux_library(
+    directory, store=None, max_workers=DEFAULT_WORKERS, notify=print, queues=()
+):
+    """
+    Remux every complete video under directory in a process pool; files
+    that were rewritten are linked into store again and get their new size
+    in the download queues that journaled them. Returns (rewritten, failed).
+    """
+    unfinished = {e["path"] for queue in queues for e in queue.unfinished()}
+    expected_sizes = {}
+    for queue in queues:
+        expected_sizes.update(queue.expected_sizes())
+    videos = [
+        v
+        for v in find_videos(directory)
+        if is_complete(v, unfinished, expected_sizes)
+    ]
+    notify(f"Checking {len(videos)} videos ({max_workers} at a time)...")
+    rewritten = 0
+    failed = 0
+    with multiprocessing.Pool(max_workers) as pool:
+        results = [
+            (video, pool.apply_async(remux, (video, store is not None)))
+            for video in videos
+        ]
+        for video, result in results:
+            try:
+                summary = result.get()
+            except Exception as e:
+                failed += 1
+                notify(f"[ERROR] {video}: {e}")
+                continue
+            if not summary["moved"]:
+                continue
+            rewritten += 1
+            for queue in queues:
+                queue.record_size(video, os.path.getsize(video))
+            if store is not None:
+                store.ingest(video, summary["digest"])
+            notify(f"Moved the index to the front: {video}")
+    return rewritten, failed
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+# Size of the range request timed by the probe
+PROBE_BYTES = 64 * 1024
+PROBE_TIMEOUT = 5
+
+# Weight of the newest probe in a host's rolling score
+SCORE_ALPHA = 0.3
+
+# Scores older than this are refreshed before the next pick
+REPROBE_SECONDS = 600
+
+# A failing host is skipped for these many seconds after its 1st, 2nd, ...
+# consecutive failure
+FAILURE_BACKOFF_SECONDS = [30, 120, 600, 1800]
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _parse_mirror(entry):
+    """'host[:port]' or 'scheme://host[:port]' -> (scheme or None, netloc)."""
+    if "://" in entry:
+        parts = urlsplit(entry)
+        return parts.scheme, parts.netloc
+    return None, entry.strip("/")
+
+
+class HostStats:
+    def __init__(self):
+        self.score = None
+        self.probed_at = 0.0
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def healthy(self, now):
+        return now >= self.retry_at
+
+
+class HostSelector:
+    """
+    Pick the fastest of several equivalent video hosts.
+
+    mirror_groups lists hosts that serve the same paths, e.g.
+    [["vod1.example.edu", "vod2.example.edu:8080"]]. A URL on any host of a
+    group is probed on every host of the group (TCP connect time plus a small
+    range request) and rewritten to the host with the best rolling score.
+    Hosts that fail are skipped with backoff; if every host fails the URL is
+    returned unchanged.
+    """
+
+    def __init__(self, mirror_groups):
+        self.groups = {}
+        for group in mirror_groups:
+            mirrors = [_parse_mirror(entry) for entry in group]
+            for _, netloc in mirrors:
+                self.groups[netloc] = mirrors
+        self.stats = {}
+        self._locks = {}
+
+    def _stats(self, netloc):
+        stats = self.stats.get(netloc)
+        if stats is None:
+            stats = self.stats[netloc] = HostStats()
+        return stats
+
+    def candidates(self, url):
+        """The url rewritten onto every mirror of its host (itself included)."""
+        parts = urlsplit(url)
+        mirrors = self.groups.get(parts.netloc)
+        if not mirrors:
+            return [url]
+        return [
+            urlunsplit(parts._replace(scheme=scheme or parts.scheme, netloc=netloc))
+            for scheme, netloc in mirrors
+        ]
+
+    def record(self, netloc, seconds):
+        stats = self._stats(netloc)
+        if stats.score is None:
+            stats.score = seconds
+        else:
+            stats.score = SCORE_ALPHA * seconds + (1 - SCORE_ALPHA) * stats.score
+        stats.probed_at = time.monotonic()
+        stats.failures = 0
+        stats.retry_at = 0.0
+
+    def report_failure(self, netloc):
+        stats = self._stats(netloc)
+        backoff = FAILURE_BACKOFF_SECONDS[
+            min(stats.failures, len(FAILURE_BACKOFF_SECONDS) - 1)
+        ]
+        stats.failures += 1
+        stats.probed_at = time.monotonic()
+        stats.retry_at = stats.probed_at + backoff
+
+    async def _probe(self, client, url):
+        parts = urlsplit(url)
+        port = parts.port or DEFAULT_PORTS.get(parts.scheme, 80)
+        started = time.monotonic()
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, port), PROBE_TIMEOUT
+        )
+        writer.close()
+        connect_seconds = time.monotonic() - started
+
+        started = time.monotonic()
+        headers = {"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code not in (200, 206):
+                raise httpx.HTTPStatusError(
+                    f"probe returned {response.status_code}",
+                    request=response.request,
+                    response=response,
+                )
+            received = 0
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+                if received >= PROBE_BYTES:
+                    break
+        return connect_seconds + (time.monotonic() - started)
+
+    async def _probe_stale(self, urls):
+        now = time.monotonic()
+        stale = [
+            url
+            for url in urls
+            if self._stats(urlsplit(url).netloc).healthy(now)
+            and now - self._stats(urlsplit(url).netloc).probed_at > REPROBE_SECONDS
+        ]
+        if not stale:
+            return
+
+        async def probe_one(client, url):
+            netloc = urlsplit(url).netloc
+            try:
+                self.record(netloc, await self._probe(client, url))
+            except (httpx.HTTPError, OSError, asyncio.TimeoutError):
+                self.report_failure(netloc)
+
+        async with httpx.AsyncClient(
+            verify=False, follow_redirects=True, timeout=PROBE_TIMEOUT
+        ) as client:
+            await asyncio.gather(*(probe_one(client, url) for url in stale))
+
+    async def choose(self, url):
+        """Return url on the fastest healthy mirror, or url itself."""
+        urls = self.candidates(url)
+        if len(urls) == 1:
+            return url
+
+        # One probe round per group, however many URLs arrive at once
+        group_key = id(self.groups[urlsplit(url).netloc])
+        lock = self._locks.setdefault(group_key, asyncio.Lock())
+        async with lock:
+            await self._probe_stale(urls)
+
+        now = time.monotonic()
+        scored = []
+        for candidate in urls:
+            stats = self._stats(urlsplit(candidate).netloc)
+            if stats.score is not None and stats.healthy(now):
+                scored.append((stats.score, candidate))
+        if not scored:
+            return url
+        return min(scored)[1]
@@ -0,0 +1,175 @@
+"""
+Conditional-request cache for the VOD API client.
+
+CachingTransport sits under an httpx.AsyncClient. When a GET response
+carries an ETag or Last-Modified validator, its body is kept gzipped on
+disk and the next identical request asks the server with If-None-Match /
+If-Modified-Since; a 304 is answered from the stored body. Every response
+also gets an X-Content-Digest header, a hash of its body, so VodClient can
+skip parsing a body it has parsed before even when the server sends no
+validators.
+
+Entries are keyed by URL and Cookie header, so accounts never share them.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+
+import httpx
+
+CACHE_DIRNAME = ".http_cache"
+
+# Response header carrying the body hash
+DIGEST_HEADER = "X-Content-Digest"
+
+# Oldest entries are removed at startup beyond this total size
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Response headers replayed from the cache; content-encoding and length
+# describe the wire format, not the stored body
+STORED_HEADERS = ("content-type", "etag", "last-modified")
+
+
+def body_digest(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def stored_headers(headers):
+    return {name: headers[name] for name in STORED_HEADERS if name in headers}
+
+
+class HttpCache:
+    """On-disk store of validated responses, one gzip file per request."""
+
+    def __init__(self, root, max_bytes=MAX_CACHE_BYTES):
+        self.root = root
+        self.stats = {"revalidated": 0, "stored": 0, "uncached": 0}
+        self.prune(max_bytes)
+
+    @staticmethod
+    def key(request):
+        identity = request.headers.get("cookie", "")
+        text = f"{request.method} {request.url}\n{identity}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.gz")
+
+    def load(self, key):
+        """Return (meta, body) of a stored response, or None."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, EOFError, ValueError):
+            return None
+        if meta.get("digest") != body_digest(body):
+            return None
+        # Touch the entry so pruning keeps what is still in use
+        os.utime(path)
+        return meta, body
+
+    def store(self, key, headers, body, digest):
+        meta = {
+            "headers": stored_headers(headers),
+            "digest": digest,
+        }
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wb") as f:
+            f.write(json.dumps(meta).encode("utf-8") + b"\n")
+            f.write(body)
+        os.replace(temp_path, path)
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def prune(self, max_bytes):
+        """Delete the least recently used entries beyond max_bytes."""
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """httpx transport that revalidates GETs against an HttpCache."""
+
+    def __init__(self, cache, transport=None):
+        self.cache = cache
+        self.transport = transport or httpx.AsyncHTTPTransport(verify=False)
+
+    async def handle_async_request(self, request):
+        if request.method != "GET":
+            return await self.transport.handle_async_request(request)
+
+        key = self.cache.key(request)
+        stored = await asyncio.to_thread(self.cache.load, key)
+        if stored is not None:
+            meta, _ = stored
+            etag = meta["headers"].get("etag")
+            last_modified = meta["headers"].get("last-modified")
+            if etag:
+                request.headers["If-None-Match"] = etag
+            if last_modified:
+                request.headers["If-Modified-Since"] = last_modified
+
+        response = await self.transport.handle_async_request(request)
+
+        if response.status_code == 304 and stored is not None:
+            await response.aclose()
+            meta, body = stored
+            self.cache.stats["revalidated"] += 1
+            return self._response(request, meta["headers"], body, meta["digest"])
+
+        if response.status_code != 200:
+            return response
+
+        # aread() undoes any content-encoding, so the body is stored plain
+        body = await response.aread()
+        digest = body_digest(body)
+        headers = {name.lower(): value for name, value in response.headers.items()}
+        if "etag" in headers or "last-modified" in headers:
+            self.cache.stats["stored"] += 1
+            await asyncio.to_thread(self.cache.store, key, headers, body, digest)
+        else:
+            self.cache.stats["uncached"] += 1
+            if stored is not None:
+                await asyncio.to_thread(self.cache.remove, key)
+        return self._response(request, stored_headers(headers), body, digest)
+
+    @staticmethod
+    def _response(request, headers, body, digest):
+        return httpx.Response(
+            200,
+            headers={**headers, DIGEST_HEADER: digest},
+            content=body,
+            request=request,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
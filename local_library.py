@@ -0,0 +1,385 @@
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import struct
+import threading
+
+from vod_api import safe_name
+
+# <safe courBeginTime>_<angle>.mp4 as written by batch and single downloads
+VIDEO_NAME_RE = re.compile(
+    r"^(\d{4})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_([A-Za-z]+\d*)\.mp4$"
+)
+
+ANGLE_INDEXES = {"Teacher": 0, "Student": 1, "PPT": 2}
+
+# Files next to a video that mean it is still being written
+INCOMPLETE_SUFFIXES = (".aria2", ".part")
+
+# Directory mtime check interval when inotify is not available
+POLL_SECONDS = 10
+
+# Wait this long after an inotify event for the rest of its burst
+EVENT_SETTLE_SECONDS = 0.2
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+COURSE_DIR_EVENTS = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+ROOT_EVENTS = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def angle_index(label):
+    """Inverse of vod_api.angle_label ("PPT" -> 2, "Angle5" -> 4)."""
+    if label in ANGLE_INDEXES:
+        return ANGLE_INDEXES[label]
+    if label.startswith("Angle") and label[5:].isdigit():
+        return int(label[5:]) - 1
+    return None
+
+
+def video_filename(begin_time, label):
+    return f"{safe_name(begin_time)}_{label}.mp4"
+
+
+def size_matches(path, size, expected_sizes=None):
+    """
+    Whether a file of this size is whole. wget and curl write straight to
+    the final name, so only the size journaled for the download (see
+    DownloadQueue.expected_sizes) tells a cut-off file from a complete one.
+    """
+    if size <= 0:
+        return False
+    expected = expected_sizes.get(path) if expected_sizes else None
+    return expected is None or size == expected
+
+
+def is_complete(path, unfinished_paths=(), expected_sizes=None):
+    if path in unfinished_paths:
+        return False
+    if any(os.path.exists(path + suffix) for suffix in INCOMPLETE_SUFFIXES):
+        return False
+    try:
+        return size_matches(path, os.path.getsize(path), expected_sizes)
+    except OSError:
+        return False
+
+
+def local_video(path, label):
+    """A courseVodViewList-like item pointing at a file on disk."""
+    return {"url": path, "_angle_index": angle_index(label), "local": True}
+
+
+def find_local_videos(download_dir, record, unfinished_paths=(), expected_sizes=None):
+    """Complete downloaded files of a record, ordered by angle."""
+    course_dir = os.path.join(
+        download_dir, safe_name(record.get("subjName", "Unknown Course"))
+    )
+    prefix = f"{safe_name(record.get('courBeginTime', 'UnknownTime'))}_"
+    try:
+        names = os.listdir(course_dir)
+    except OSError:
+        return []
+
+    videos = []
+    for name in names:
+        match = VIDEO_NAME_RE.match(name)
+        if not match or not name.startswith(prefix):
+            continue
+        path = os.path.join(course_dir, name)
+        if is_complete(path, unfinished_paths, expected_sizes):
+            videos.append(local_video(path, match.group(7)))
+    videos.sort(key=lambda v: (v["_angle_index"] is None, v["_angle_index"] or 0))
+    return videos
+
+
+def scan_course_dir(path):
+    """
+    Map courBeginTime -> {angle label: size} for one course directory; the
+    size is 0 for files still being written.
+    """
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return {}
+    names = {entry.name for entry in entries}
+    sessions = {}
+    for entry in entries:
+        match = VIDEO_NAME_RE.match(entry.name)
+        if not match:
+            continue
+        size = 0
+        if not any(entry.name + suffix in names for suffix in INCOMPLETE_SUFFIXES):
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                continue
+        year, month, day, hour, minute, second, label = match.groups()
+        begin_time = f"{year}-{month}-{day} {hour}:{minute}:{second}"
+        sessions.setdefault(begin_time, {})[label] = size
+    return sessions
+
+
+def scan_library(download_dir, unfinished_paths=(), expected_sizes=None):
+    """Map course directory -> {courBeginTime: [angle labels]} of complete files."""
+    library = {}
+    try:
+        entries = list(os.scandir(download_dir))
+    except OSError:
+        return library
+    for entry in entries:
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        sessions = {}
+        for begin_time, angles in scan_course_dir(entry.path).items():
+            labels = []
+            for label, size in angles.items():
+                path = os.path.join(entry.path, video_filename(begin_time, label))
+                if path not in unfinished_paths and size_matches(
+                    path, size, expected_sizes
+                ):
+                    labels.append(label)
+            if labels:
+                sessions[begin_time] = labels
+        if sessions:
+            library[entry.name] = sessions
+    return library
+
+
+def offline_records(
+    download_dir, catalog_records, unfinished_paths=(), expected_sizes=None
+):
+    """
+    Records that can be played from disk.
+
+    Catalog records are kept when at least one of their files is on disk;
+    files without a catalog record (e.g. the catalog was deleted) get a
+    minimal record built from their directory and file name.
+    """
+    library = scan_library(download_dir, unfinished_paths, expected_sizes)
+    records = []
+    seen = set()
+    for record in catalog_records:
+        course_dir = safe_name(record.get("subjName", "Unknown Course"))
+        begin_time = record.get("courBeginTime", "")
+        if begin_time in library.get(course_dir, {}):
+            records.append(record)
+            seen.add((course_dir, begin_time))
+
+    for course_dir, sessions in library.items():
+        for begin_time in sessions:
+            if (course_dir, begin_time) in seen:
+                continue
+            records.append(
+                {
+                    "id": f"local-{course_dir}-{safe_name(begin_time)}",
+                    "subjName": course_dir,
+                    "courBeginTime": begin_time,
+                    "clroName": "Local",
+                    "teacNames": [],
+                    "courPlayCount": 0,
+                }
+            )
+    return records
+
+
+class _Inotify:
+    """Minimal ctypes binding of Linux inotify; raises OSError if unavailable."""
+
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+        except (AttributeError, TypeError) as e:
+            raise OSError(f"inotify unavailable: {e}") from e
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {path}")
+        return wd
+
+    def read(self, timeout):
+        """Return [(wd, mask, name)] of pending events, waiting up to timeout."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LocalIndex:
+    """
+    In-memory view of the videos under download_dir.
+
+    A background thread scans the directory once, then keeps the view
+    current with inotify (or by polling directory mtimes where inotify is
+    not available). Lookups are plain dict reads with no filesystem access.
+    on_change(course_dir) is called from that thread after a course
+    directory changed, with None after the initial scan or a full rescan.
+    """
+
+    def __init__(self, download_dir, on_change=None):
+        self.download_dir = download_dir
+        self.on_change = on_change
+        self.courses = {}
+        self.ready = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def angles(self, course_name, begin_time):
+        """{angle label: size} of the downloaded files of one recording."""
+        sessions = self.courses.get(safe_name(course_name))
+        if not sessions:
+            return {}
+        return sessions.get(begin_time, {})
+
+    def rescan(self, course_dir):
+        """Re-read one course directory (a name under download_dir)."""
+        path = os.path.join(self.download_dir, course_dir)
+        sessions = scan_course_dir(path) if os.path.isdir(path) else {}
+        if sessions:
+            self.courses[course_dir] = sessions
+        else:
+            self.courses.pop(course_dir, None)
+        self._changed(course_dir)
+
+    def _changed(self, course_dir):
+        if self.on_change:
+            self.on_change(course_dir)
+
+    def _course_dirs(self):
+        try:
+            return [
+                entry.name
+                for entry in os.scandir(self.download_dir)
+                if entry.is_dir() and not entry.name.startswith(".")
+            ]
+        except OSError:
+            return []
+
+    def _full_scan(self):
+        courses = {}
+        for course_dir in self._course_dirs():
+            sessions = scan_course_dir(os.path.join(self.download_dir, course_dir))
+            if sessions:
+                courses[course_dir] = sessions
+        self.courses = courses
+        self.ready = True
+        self._changed(None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        try:
+            inotify = _Inotify()
+        except OSError:
+            inotify = None
+        if inotify is None:
+            self._full_scan()
+            self._poll()
+            return
+        try:
+            self._watch(inotify)
+        finally:
+            inotify.close()
+
+    def _watch(self, inotify):
+        # Watches go in before the scan so nothing written meanwhile is missed
+        watches = {}
+        try:
+            os.makedirs(self.download_dir, exist_ok=True)
+            root_wd = inotify.add_watch(self.download_dir, ROOT_EVENTS)
+        except OSError:
+            self._full_scan()
+            self._poll()
+            return
+        for course_dir in self._course_dirs():
+            self._add_course_watch(inotify, watches, course_dir)
+        self._full_scan()
+
+        while not self._stop.is_set():
+            events = inotify.read(1.0)
+            if not events:
+                continue
+            # Collect the rest of a burst (e.g. aria2 finishing a file)
+            self._stop.wait(EVENT_SETTLE_SECONDS)
+            events += inotify.read(0)
+
+            dirty = set()
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    dirty = None
+                    break
+                if wd == root_wd:
+                    if mask & IN_ISDIR and not name.startswith("."):
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            self._add_course_watch(inotify, watches, name)
+                        dirty.add(name)
+                elif wd in watches and not mask & IN_IGNORED:
+                    dirty.add(watches[wd])
+
+            if dirty is None:
+                self._full_scan()
+                continue
+            for course_dir in dirty:
+                self.rescan(course_dir)
+
+    def _add_course_watch(self, inotify, watches, course_dir):
+        path = os.path.join(self.download_dir, course_dir)
+        try:
+            watches[inotify.add_watch(path, COURSE_DIR_EVENTS)] = course_dir
+        except OSError:
+            pass
+
+    def _poll(self):
+        def mtimes():
+            result = {}
+            for course_dir in self._course_dirs():
+                try:
+                    path = os.path.join(self.download_dir, course_dir)
+                    result[course_dir] = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+            return result
+
+        seen = mtimes()
+        while not self._stop.wait(POLL_SECONDS):
+            current = mtimes()
+            for course_dir in set(seen) | set(current):
+                if seen.get(course_dir) != current.get(course_dir):
+                    self.rescan(course_dir)
+            seen = current
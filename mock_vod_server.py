@@ -0,0 +1,339 @@
+"""
+Local stand-in for the VOD API, for trying sync_cluster.py without the
+real server.
+
+MockVodServer answers the curriculum, subject_vod_list and course_vod_urls
+endpoints for a made-up set of courses; the video URLs it hands out point
+at synthetic MP4s it serves itself, with Range support.
+
+    python mock_vod_server.py --port 8791
+    python mock_vod_server.py --cluster --workers 2
+
+--cluster starts the server, a coordinator and the workers as separate
+processes against it in a scratch download_dir, then checks that every
+file arrived with its full size. --kill-after stops the first worker
+part-way, so its jobs must be taken over when their lease runs out.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+
+from bench_downloaders import SyntheticServer
+from download_queue import DONE
+from vod_api import (
+    CURRICULUM_API_PATH,
+    DETAIL_API_PATH,
+    SUBJECT_VOD_LIST_API_PATH,
+    safe_name,
+)
+
+DEFAULT_FILE_SIZE = 4 * 1024**2
+
+# Short leases so the jobs of a killed worker are taken over quickly
+LEASE_SECONDS = 6
+
+SYNC_CLUSTER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sync_cluster.py"
+)
+
+
+def make_records(courses, recordings):
+    """Curriculum records of courses x recordings, one day apart, newest today."""
+    today = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    records = []
+    for c in range(courses):
+        for r in range(recordings):
+            begin = today - timedelta(days=r, hours=-2 * c)
+            records.append(
+                {
+                    "id": f"{c + 1}{r + 1:03d}",
+                    "subjName": f"Mock Course {c + 1}",
+                    "subjId": f"subj{c + 1}",
+                    "teclId": f"tecl{c + 1}",
+                    "courBeginTime": begin.strftime("%Y-%m-%d %H:%M:%S"),
+                    "courEndTime": (begin + timedelta(minutes=95)).strftime(
+                        "%Y-%m-%d %H:%M:%S"
+                    ),
+                    "clroName": f"Room {c + 1}",
+                    "teacNames": [f"Teacher {c + 1}"],
+                    "courPlayCount": 0,
+                    "vodDeleteStatus": 0,
+                }
+            )
+    return records
+
+
+def _page(records, params, default_size):
+    index = int(params.get("page.pageIndex", ["1"])[0])
+    size = int(params.get("page.pageSize", [str(default_size)])[0])
+    return records[(index - 1) * size : index * size]
+
+
+class MockVodServer(SyntheticServer):
+    """SyntheticServer that also answers the VOD API endpoints."""
+
+    def __init__(
+        self,
+        courses=2,
+        recordings=3,
+        angles=2,
+        file_size=DEFAULT_FILE_SIZE,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.angles = angles
+        self.file_size = file_size
+        self.records = make_records(courses, recordings)
+        self.requests = 0
+
+    @property
+    def api_base(self):
+        return f"http://{self.host}:{self.port}"
+
+    def video_urls(self, record_id):
+        return [
+            self.url(self.file_size, f"{record_id}_{angle}")
+            for angle in range(self.angles)
+        ]
+
+    def api_response(self, path, params):
+        """JSON payload for an API path, or None if the path is not an endpoint."""
+        if path == CURRICULUM_API_PATH:
+            records = sorted(
+                self.records,
+                key=lambda r: r["courBeginTime"],
+                reverse=params.get("page.orders[0].asc") == ["false"],
+            )
+            return {"code": 0, "data": {"records": _page(records, params, 500)}}
+        if path == SUBJECT_VOD_LIST_API_PATH:
+            tecl_ids = set(params.get("teclIds", [""])[0].split(","))
+            records = [r for r in self.records if r["teclId"] in tecl_ids]
+            return {"code": 0, "data": {"records": _page(records, params, 1000)}}
+        if path == DETAIL_API_PATH:
+            record_id = params.get("courseId", [""])[0]
+            if not any(r["id"] == record_id for r in self.records):
+                return {"code": 0, "data": {"courseVodViewList": []}}
+            videos = [{"url": url} for url in self.video_urls(record_id)]
+            return {"code": 0, "data": {"courseVodViewList": videos}}
+        return None
+
+    async def _respond(self, writer, method, target, headers, keep_alive):
+        path, _, query = target.partition("?")
+        payload = self.api_response(path, parse_qs(query))
+        if payload is None:
+            await super()._respond(writer, method, target, headers, keep_alive)
+            return
+        self.requests += 1
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            (
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: application/json;charset=UTF-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            ).encode("latin-1")
+            + (body if method != "HEAD" else b"")
+        )
+        await writer.drain()
+
+    def expected_files(self):
+        """Paths (relative to download_dir) a full sync should produce."""
+        labels = {0: "Teacher", 1: "Student", 2: "PPT"}
+        return [
+            os.path.join(
+                safe_name(r["subjName"]),
+                f"{safe_name(r['courBeginTime'])}_"
+                f"{labels.get(angle, f'Angle{angle + 1}')}.mp4",
+            )
+            for r in self.records
+            for angle in range(self.angles)
+        ]
+
+
+def write_config(path, server, download_dir, downloader=None):
+    config = {
+        "cookies": "JSESSIONID=mock",
+        "headers": {"User-Agent": "mock_vod_server"},
+        "api_base": server.api_base,
+        "download_dir": download_dir,
+        "downloader": downloader,
+        "days_back": 30,
+        "days_forward": 1,
+        "max_concurrent_downloads": 2,
+        "aria2_autotune": False,
+        "faststart": False,
+        "blob_store": False,
+        "http_cache": False,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return path
+
+
+def run_cluster(server, workers=2, downloader=None, kill_after=None, timeout=300):
+    """
+    Run a coordinator and workers against server; returns an exit code.
+
+    Process output goes to <name>.log in a scratch directory, which is kept
+    (and printed) when the check fails.
+    """
+    scratch = tempfile.mkdtemp(prefix="sync_cluster_")
+    download_dir = os.path.join(scratch, "Downloads")
+    os.makedirs(download_dir)
+    config_path = write_config(
+        os.path.join(scratch, "config.json"), server, download_dir, downloader
+    )
+    db_path = os.path.join(scratch, "sync.db")
+
+    def spawn(name, role, *extra):
+        with open(os.path.join(scratch, f"{name}.log"), "w") as log_file:
+            return subprocess.Popen(
+                [
+                    sys.executable,
+                    SYNC_CLUSTER_SCRIPT,
+                    role,
+                    "--config",
+                    config_path,
+                    "--db",
+                    db_path,
+                    "--lease-seconds",
+                    str(LEASE_SECONDS),
+                    *extra,
+                ],
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+            )
+
+    started = time.monotonic()
+    coordinator = spawn("coordinator", "coordinator")
+    worker_processes = [
+        spawn(f"worker{n + 1}", "worker", "--id", f"worker{n + 1}")
+        for n in range(workers)
+    ]
+    killed = None
+    try:
+        while coordinator.poll() is None or any(
+            p.poll() is None for p in worker_processes
+        ):
+            elapsed = time.monotonic() - started
+            if elapsed > timeout:
+                print(f"Timed out after {timeout}s", file=sys.stderr)
+                return 1
+            if kill_after is not None and killed is None and elapsed >= kill_after:
+                killed = worker_processes[0]
+                killed.kill()
+                print(f"Killed worker1 after {kill_after}s", file=sys.stderr)
+            time.sleep(0.5)
+    finally:
+        for process in [coordinator, *worker_processes]:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+    missing = []
+    for path in server.expected_files():
+        full_path = os.path.join(download_dir, path)
+        size = os.path.getsize(full_path) if os.path.exists(full_path) else None
+        if size != server.file_size:
+            missing.append(f"{path} ({size} of {server.file_size} bytes)")
+    db = sqlite3.connect(db_path)
+    states = dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+    by_worker = dict(
+        db.execute(
+            "SELECT worker, COUNT(*) FROM jobs WHERE state = ? GROUP BY worker",
+            (DONE,),
+        )
+    )
+    db.close()
+
+    print(
+        f"{len(server.expected_files()) - len(missing)}/"
+        f"{len(server.expected_files())} files complete in "
+        f"{time.monotonic() - started:.1f}s; jobs {states}; done by {by_worker}; "
+        f"coordinator exit {coordinator.returncode}",
+        file=sys.stderr,
+    )
+    if missing or coordinator.returncode != 0:
+        for path in missing:
+            print(f"  incomplete: {path}", file=sys.stderr)
+        print(f"Logs and files kept in {scratch}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the HDU VOD API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--courses", type=int, default=2)
+    parser.add_argument("--recordings", type=int, default=3, help="Per course")
+    parser.add_argument("--angles", type=int, default=2, help="Videos per recording")
+    parser.add_argument(
+        "--file-size-kib",
+        type=int,
+        default=DEFAULT_FILE_SIZE // 1024,
+        help="Size of every video",
+    )
+    parser.add_argument(
+        "--rate-limit-kib",
+        type=int,
+        default=None,
+        help="Per-connection rate limit in KiB/s (default: unlimited)",
+    )
+    parser.add_argument(
+        "--cluster",
+        action="store_true",
+        help="Run a coordinator and workers against the server and check the result",
+    )
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument(
+        "--downloader", default=None, help="aria2c, wget or curl (default: auto)"
+    )
+    parser.add_argument(
+        "--kill-after",
+        type=float,
+        default=None,
+        help="With --cluster, kill the first worker after this many seconds",
+    )
+    args = parser.parse_args()
+
+    server = MockVodServer(
+        courses=args.courses,
+        recordings=args.recordings,
+        angles=args.angles,
+        file_size=args.file_size_kib * 1024,
+        host=args.host,
+        port=args.port,
+        rate_limit=args.rate_limit_kib * 1024 if args.rate_limit_kib else None,
+    ).start()
+
+    if args.cluster:
+        try:
+            code = run_cluster(
+                server,
+                workers=args.workers,
+                downloader=args.downloader,
+                kill_after=args.kill_after,
+            )
+        finally:
+            server.stop()
+        sys.exit(code)
+
+    print(f'Serving; set "api_base": "{server.api_base}" in config.json')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,679 @@
+import os
+import struct
+from bisect import bisect_left, bisect_right
+
+import httpx
+
+from blobstore import HashingWriter
+
+# Boxes whose children we need to walk or rebuild
+CONTAINER_BOXES = {"moov", "trak", "mdia", "minf", "stbl", "edts"}
+
+# Merge requested byte spans separated by less than this many bytes into one
+# range request; re-downloading a small gap is cheaper than another round trip.
+RANGE_MERGE_GAP = 256 * 1024
+
+HEADER_PROBE_SIZE = 16
+
+
+class Mp4Error(Exception):
+    pass
+
+
+def read_box_header(data, offset, total_size=None):
+    """Return (size, type, header_length) of the box starting at offset."""
+    if offset + 8 > len(data):
+        raise Mp4Error("Truncated box header")
+    (size,) = struct.unpack_from(">I", data, offset)
+    box_type = data[offset + 4 : offset + 8].decode("latin-1")
+    header_length = 8
+    if size == 1:
+        if offset + 16 > len(data):
+            raise Mp4Error("Truncated large box header")
+        (size,) = struct.unpack_from(">Q", data, offset + 8)
+        header_length = 16
+    elif size == 0:
+        size = (total_size if total_size is not None else len(data)) - offset
+    if size < header_length:
+        raise Mp4Error(f"Invalid size for box '{box_type}'")
+    return size, box_type, header_length
+
+
+def iter_boxes(data, start=0, end=None):
+    """Yield (type, offset, size, header_length) for boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type, header_length = read_box_header(data, offset, end)
+        yield box_type, offset, size, header_length
+        offset += size
+
+
+def child_boxes(box):
+    """Split a container box into a list of (type, raw_bytes) children."""
+    _, _, header_length = read_box_header(box, 0)
+    return [
+        (box_type, box[offset : offset + size])
+        for box_type, offset, size, _ in iter_boxes(box, header_length)
+    ]
+
+
+def find_child(box, box_type):
+    for child_type, child in child_boxes(box):
+        if child_type == box_type:
+            return child
+    return None
+
+
+def require_child(box, box_type):
+    child = find_child(box, box_type)
+    if child is None:
+        raise Mp4Error(f"Missing '{box_type}' box")
+    return child
+
+
+def make_box(box_type, payload):
+    size = 8 + len(payload)
+    if size > 0xFFFFFFFF:
+        return struct.pack(">I4sQ", 1, box_type.encode("latin-1"), size + 8) + payload
+    return struct.pack(">I4s", size, box_type.encode("latin-1")) + payload
+
+
+def make_full_box(box_type, version, flags, payload):
+    return make_box(box_type, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+def _payload(box):
+    _, _, header_length = read_box_header(box, 0)
+    return box[header_length:]
+
+
+def _full_box_body(box):
+    """Return (version, flags, body) for a full box."""
+    payload = _payload(box)
+    (version_flags,) = struct.unpack_from(">I", payload, 0)
+    return version_flags >> 24, version_flags & 0xFFFFFF, payload[4:]
+
+
+def _run_length(values):
+    """Collapse a list into [(count, value), ...] runs."""
+    runs = []
+    for value in values:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+    return runs
+
+
+class Track:
+    """Sample tables of one `trak`, expanded to per-sample lists."""
+
+    def __init__(self, trak):
+        self.trak = trak
+        mdia = require_child(trak, "mdia")
+        minf = require_child(mdia, "minf")
+        stbl = require_child(minf, "stbl")
+
+        version, _, body = _full_box_body(require_child(mdia, "mdhd"))
+        if version == 1:
+            (self.timescale,) = struct.unpack_from(">I", body, 16)
+        else:
+            (self.timescale,) = struct.unpack_from(">I", body, 8)
+
+        _, _, body = _full_box_body(require_child(mdia, "hdlr"))
+        self.handler = body[4:8].decode("latin-1")
+
+        self.stsd = require_child(stbl, "stsd")
+        self.sizes = self._parse_stsz(stbl)
+        self.durations = self._parse_stts(require_child(stbl, "stts"))
+        self.ctts_version, self.composition_offsets = self._parse_ctts(
+            find_child(stbl, "ctts")
+        )
+        stss = find_child(stbl, "stss")
+        self.sync_samples = self._parse_stss(stss) if stss is not None else None
+
+        chunk_offsets = self._parse_chunk_offsets(stbl)
+        stsc = self._parse_stsc(require_child(stbl, "stsc"))
+
+        sample_count = len(self.sizes)
+        self.offsets = []
+        self.chunk_of = []
+        self.description_of = []
+        sample = 0
+        for chunk_index, chunk_offset in enumerate(chunk_offsets):
+            per_chunk, description = self._stsc_lookup(stsc, chunk_index + 1)
+            offset = chunk_offset
+            for _ in range(per_chunk):
+                if sample >= sample_count:
+                    break
+                self.offsets.append(offset)
+                self.chunk_of.append(chunk_index)
+                self.description_of.append(description)
+                offset += self.sizes[sample]
+                sample += 1
+        if sample != sample_count or len(self.durations) != sample_count:
+            raise Mp4Error("Inconsistent sample tables")
+
+        self.decode_times = []
+        elapsed = 0
+        for duration in self.durations:
+            self.decode_times.append(elapsed)
+            elapsed += duration
+        self.duration = elapsed
+
+    @staticmethod
+    def _parse_stsz(stbl):
+        stsz = find_child(stbl, "stsz")
+        if stsz is not None:
+            _, _, body = _full_box_body(stsz)
+            sample_size, count = struct.unpack_from(">II", body, 0)
+            if sample_size:
+                return [sample_size] * count
+            return list(struct.unpack_from(f">{count}I", body, 8))
+
+        stz2 = find_child(stbl, "stz2")
+        if stz2 is None:
+            raise Mp4Error("Missing sample size table")
+        _, _, body = _full_box_body(stz2)
+        field_size = body[3]
+        (count,) = struct.unpack_from(">I", body, 4)
+        raw = body[8:]
+        if field_size == 16:
+            return list(struct.unpack_from(f">{count}H", raw, 0))
+        if field_size == 8:
+            return list(raw[:count])
+        sizes = []
+        for i in range(count):
+            byte = raw[i // 2]
+            sizes.append(byte >> 4 if i % 2 == 0 else byte & 0x0F)
+        return sizes
+
+    @staticmethod
+    def _parse_stts(stts):
+        _, _, body = _full_box_body(stts)
+        (entries,) = struct.unpack_from(">I", body, 0)
+        durations = []
+        for i in range(entries):
+            count, delta = struct.unpack_from(">II", body, 4 + i * 8)
+            durations.extend([delta] * count)
+        return durations
+
+    @staticmethod
+    def _parse_ctts(ctts):
+        if ctts is None:
+            return 0, None
+        version, _, body = _full_box_body(ctts)
+        (entries,) = struct.unpack_from(">I", body, 0)
+        fmt = ">Ii" if version == 1 else ">II"
+        offsets = []
+        for i in range(entries):
+            count, offset = struct.unpack_from(fmt, body, 4 + i * 8)
+            offsets.extend([offset] * count)
+        return version, offsets
+
+    @staticmethod
+    def _parse_stss(stss):
+        _, _, body = _full_box_body(stss)
+        (entries,) = struct.unpack_from(">I", body, 0)
+        # Stored 1-based in the file, kept 0-based here
+        return [n - 1 for n in struct.unpack_from(f">{entries}I", body, 4)]
+
+    @staticmethod
+    def _parse_chunk_offsets(stbl):
+        stco = find_child(stbl, "stco")
+        if stco is not None:
+            _, _, body = _full_box_body(stco)
+            (entries,) = struct.unpack_from(">I", body, 0)
+            return list(struct.unpack_from(f">{entries}I", body, 4))
+        co64 = find_child(stbl, "co64")
+        if co64 is None:
+            raise Mp4Error("Missing chunk offset table")
+        _, _, body = _full_box_body(co64)
+        (entries,) = struct.unpack_from(">I", body, 0)
+        return list(struct.unpack_from(f">{entries}Q", body, 4))
+
+    @staticmethod
+    def _parse_stsc(stsc):
+        _, _, body = _full_box_body(stsc)
+        (entries,) = struct.unpack_from(">I", body, 0)
+        return [struct.unpack_from(">III", body, 4 + i * 12) for i in range(entries)]
+
+    @staticmethod
+    def _stsc_lookup(stsc, chunk_number):
+        per_chunk, description = 0, 1
+        for first_chunk, samples, desc in stsc:
+            if first_chunk > chunk_number:
+                break
+            per_chunk, description = samples, desc
+        return per_chunk, description
+
+    def sample_at_or_after(self, media_time):
+        return bisect_left(self.decode_times, media_time)
+
+    def sync_sample_at_or_before(self, media_time):
+        index = bisect_right(self.decode_times, media_time) - 1
+        index = max(index, 0)
+        if self.sync_samples is None:
+            return index
+        pos = bisect_right(self.sync_samples, index) - 1
+        return self.sync_samples[max(pos, 0)]
+
+
+class ClipPlan:
+    """Which samples of each track go into the clip, grouped into chunks."""
+
+    def __init__(self, tracks, movie_timescale, start, end):
+        self.tracks = tracks
+        self.movie_timescale = movie_timescale
+        self.selection = {}
+
+        # Snap the start to a keyframe of the first video track so the clip
+        # decodes cleanly; all other tracks are cut at the snapped time.
+        reference = next(
+            (t for t in tracks if t.handler == "vide" and t.sync_samples), None
+        )
+        if reference is not None:
+            first = reference.sync_sample_at_or_before(
+                int(start * reference.timescale)
+            )
+            self.actual_start = reference.decode_times[first] / reference.timescale
+        else:
+            self.actual_start = start
+
+        for index, track in enumerate(tracks):
+            if track is reference:
+                first = reference.sync_sample_at_or_before(
+                    int(start * track.timescale)
+                )
+            else:
+                first = track.sample_at_or_after(
+                    int(self.actual_start * track.timescale)
+                )
+            last = track.sample_at_or_after(int(end * track.timescale))
+            if last > first:
+                self.selection[index] = (first, last)
+
+        if not self.selection:
+            raise Mp4Error("Requested range is outside the recording")
+
+        # One output chunk per original chunk touched by the selection. Within
+        # a chunk the selected samples are contiguous, so each output chunk is
+        # a single byte span of the source file.
+        self.chunks = []
+        for index, (first, last) in self.selection.items():
+            track = tracks[index]
+            sample = first
+            while sample < last:
+                chunk = track.chunk_of[sample]
+                begin = sample
+                while sample < last and track.chunk_of[sample] == chunk:
+                    sample += 1
+                span_start = track.offsets[begin]
+                span_end = track.offsets[sample - 1] + track.sizes[sample - 1]
+                self.chunks.append((span_start, span_end, index, begin, sample))
+        self.chunks.sort()
+
+    @property
+    def spans(self):
+        return [(start, end) for start, end, _, _, _ in self.chunks]
+
+    @property
+    def payload_size(self):
+        return sum(end - start for start, end, _, _, _ in self.chunks)
+
+
+def _coalesce_ranges(spans, gap=RANGE_MERGE_GAP):
+    ranges = []
+    for start, end in spans:
+        if ranges and start - ranges[-1][1] <= gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def _patch_duration(box, duration, timescale_first):
+    """Rewrite the duration field of mvhd/mdhd (timescale_first) or tkhd."""
+    version, flags, body = _full_box_body(box)
+    body = bytearray(body)
+    if version == 1:
+        offset = 20 if timescale_first else 24
+        struct.pack_into(">Q", body, offset, duration)
+    else:
+        offset = 12 if timescale_first else 16
+        struct.pack_into(">I", body, offset, min(duration, 0xFFFFFFFF))
+    return make_full_box(read_box_header(box, 0)[1], version, flags, bytes(body))
+
+
+def _build_stbl(track, first, last, chunk_records, chunk_offsets, use_co64):
+    boxes = [track.stsd]
+
+    stts = _run_length(track.durations[first:last])
+    boxes.append(
+        make_full_box(
+            "stts",
+            0,
+            0,
+            struct.pack(">I", len(stts))
+            + b"".join(struct.pack(">II", c, v) for c, v in stts),
+        )
+    )
+
+    if track.composition_offsets is not None:
+        ctts = _run_length(track.composition_offsets[first:last])
+        fmt = ">Ii" if track.ctts_version == 1 else ">II"
+        boxes.append(
+            make_full_box(
+                "ctts",
+                track.ctts_version,
+                0,
+                struct.pack(">I", len(ctts))
+                + b"".join(struct.pack(fmt, c, v) for c, v in ctts),
+            )
+        )
+
+    if track.sync_samples is not None:
+        lo = bisect_left(track.sync_samples, first)
+        hi = bisect_left(track.sync_samples, last)
+        sync = [n - first + 1 for n in track.sync_samples[lo:hi]]
+        boxes.append(
+            make_full_box(
+                "stss",
+                0,
+                0,
+                struct.pack(f">I{len(sync)}I", len(sync), *sync),
+            )
+        )
+
+    stsc = []
+    for chunk_number, (count, description) in enumerate(chunk_records, 1):
+        if not stsc or stsc[-1][1:] != (count, description):
+            stsc.append((chunk_number, count, description))
+    boxes.append(
+        make_full_box(
+            "stsc",
+            0,
+            0,
+            struct.pack(">I", len(stsc))
+            + b"".join(struct.pack(">III", *entry) for entry in stsc),
+        )
+    )
+
+    sizes = track.sizes[first:last]
+    boxes.append(
+        make_full_box(
+            "stsz", 0, 0, struct.pack(f">II{len(sizes)}I", 0, len(sizes), *sizes)
+        )
+    )
+
+    if use_co64:
+        boxes.append(
+            make_full_box(
+                "co64",
+                0,
+                0,
+                struct.pack(f">I{len(chunk_offsets)}Q", len(chunk_offsets), *chunk_offsets),
+            )
+        )
+    else:
+        boxes.append(
+            make_full_box(
+                "stco",
+                0,
+                0,
+                struct.pack(f">I{len(chunk_offsets)}I", len(chunk_offsets), *chunk_offsets),
+            )
+        )
+
+    return make_box("stbl", b"".join(boxes))
+
+
+def _build_trak(track, first, last, chunk_records, chunk_offsets, use_co64, movie_timescale):
+    media_duration = sum(track.durations[first:last])
+    movie_duration = media_duration * movie_timescale // track.timescale
+
+    def rebuild(box):
+        box_type = read_box_header(box, 0)[1]
+        if box_type == "tkhd":
+            return _patch_duration(box, movie_duration, timescale_first=False)
+        if box_type == "mdhd":
+            return _patch_duration(box, media_duration, timescale_first=True)
+        if box_type == "stbl":
+            return _build_stbl(
+                track, first, last, chunk_records, chunk_offsets, use_co64
+            )
+        if box_type == "edts":
+            # Only keep the composition shift of the first sample; any trimming
+            # the source edit list did is meaningless for the clip.
+            media_time = 0
+            if track.composition_offsets is not None:
+                media_time = max(track.composition_offsets[first], 0)
+            elst = make_full_box(
+                "elst",
+                0,
+                0,
+                struct.pack(">IIiHH", 1, movie_duration, media_time, 1, 0),
+            )
+            return make_box("edts", elst)
+        if box_type in CONTAINER_BOXES:
+            return make_box(
+                box_type, b"".join(rebuild(child) for _, child in child_boxes(box))
+            )
+        return box
+
+    return rebuild(track.trak)
+
+
+def build_clip_moov(moov, tracks, plan, data_offset, use_co64):
+    """Build a moov box for the clip whose samples start at data_offset."""
+    chunk_records = {index: [] for index in plan.selection}
+    chunk_offsets = {index: [] for index in plan.selection}
+    position = data_offset
+    for start, end, index, first, last in plan.chunks:
+        track = tracks[index]
+        chunk_records[index].append((last - first, track.description_of[first]))
+        chunk_offsets[index].append(position)
+        position += end - start
+
+    movie_duration = 0
+    children = []
+    track_index = 0
+    for box_type, child in child_boxes(moov):
+        if box_type == "trak":
+            index = track_index
+            track_index += 1
+            if index not in plan.selection:
+                continue
+            first, last = plan.selection[index]
+            track = tracks[index]
+            children.append(
+                _build_trak(
+                    track,
+                    first,
+                    last,
+                    chunk_records[index],
+                    chunk_offsets[index],
+                    use_co64,
+                    plan.movie_timescale,
+                )
+            )
+            duration = sum(track.durations[first:last])
+            movie_duration = max(
+                movie_duration, duration * plan.movie_timescale // track.timescale
+            )
+        elif box_type == "mvex":
+            raise Mp4Error("Fragmented MP4 is not supported for clipping")
+        else:
+            children.append(child)
+
+    for i, child in enumerate(children):
+        if read_box_header(child, 0)[1] == "mvhd":
+            children[i] = _patch_duration(child, movie_duration, timescale_first=True)
+
+    return make_box("moov", b"".join(children))
+
+
+def parse_moov(moov):
+    """Return (movie_timescale, tracks) for a moov box."""
+    try:
+        version, _, body = _full_box_body(require_child(moov, "mvhd"))
+        offset = 16 if version == 1 else 8
+        (movie_timescale,) = struct.unpack_from(">I", body, offset)
+        tracks = [
+            Track(child) for box_type, child in child_boxes(moov) if box_type == "trak"
+        ]
+    except (struct.error, IndexError) as e:
+        # Tables that claim more entries than the box holds
+        raise Mp4Error(f"Truncated or malformed moov: {e}") from e
+    if not tracks:
+        raise Mp4Error("No tracks found")
+    return movie_timescale, tracks
+
+
+async def _get_range(client, url, start, end):
+    """GET bytes [start, end] and return (content, total_size)."""
+    async with client.stream(
+        "GET", url, headers={"Range": f"bytes={start}-{end}"}
+    ) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise Mp4Error("Server does not support HTTP range requests")
+        content = await response.aread()
+    content_range = response.headers.get("Content-Range", "")
+    total = content_range.rsplit("/", 1)[-1]
+    return content, int(total) if total.isdigit() else None
+
+
+async def fetch_header_boxes(client, url):
+    """Walk the top-level boxes with range requests, returning (ftyp, moov)."""
+    ftyp = None
+    moov = None
+    offset = 0
+    total = None
+    while total is None or offset < total:
+        probe, size_hint = await _get_range(
+            client, url, offset, offset + HEADER_PROBE_SIZE - 1
+        )
+        if total is None:
+            total = size_hint
+        if len(probe) < 8:
+            break
+        size, box_type, _ = read_box_header(
+            probe, 0, None if total is None else total - offset
+        )
+        if box_type in ("ftyp", "moov"):
+            box, _ = await _get_range(client, url, offset, offset + size - 1)
+            if box_type == "ftyp":
+                ftyp = box
+            else:
+                moov = box
+        if moov is not None and ftyp is not None:
+            break
+        offset += size
+    if moov is None:
+        raise Mp4Error("No moov box found")
+    return ftyp, moov
+
+
+async def _stream_spans(client, url, spans, out, progress_callback=None):
+    """Download only the given sorted byte spans and write them to out."""
+    total = sum(end - start for start, end in spans)
+    written = 0
+    span_index = 0
+    for range_start, range_end in _coalesce_ranges(spans):
+        position = range_start
+        async with client.stream(
+            "GET", url, headers={"Range": f"bytes={range_start}-{range_end - 1}"}
+        ) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise Mp4Error("Server does not support HTTP range requests")
+            async for data in response.aiter_bytes():
+                data_start = position
+                position += len(data)
+                while span_index < len(spans) and spans[span_index][0] < position:
+                    start, end = spans[span_index]
+                    lo = max(start, data_start)
+                    hi = min(end, position)
+                    if hi > lo:
+                        out.write(data[lo - data_start : hi - data_start])
+                        written += hi - lo
+                    if end <= position:
+                        span_index += 1
+                    else:
+                        break
+                if progress_callback:
+                    progress_callback(written, total)
+        if position < range_end:
+            raise Mp4Error("Connection closed before range was complete")
+    if written != total:
+        raise Mp4Error("Clip data incomplete")
+    return written
+
+
+async def download_clip(
+    url, output_path, start, end, progress_callback=None, hasher=None
+):
+    """
+    Download the [start, end) seconds of a remote MP4 as a standalone MP4.
+
+    Only the moov box and the byte ranges holding the selected samples are
+    fetched. The start is snapped back to the nearest video keyframe. If a
+    hasher is given, it is fed the output bytes as they are written.
+
+    Returns a dict with the actual start time, duration and bytes fetched.
+    """
+    if end <= start:
+        raise Mp4Error("End time must be after start time")
+
+    async with httpx.AsyncClient(verify=False, follow_redirects=True) as client:
+        ftyp, moov = await fetch_header_boxes(client, url)
+        movie_timescale, tracks = parse_moov(moov)
+        plan = ClipPlan(tracks, movie_timescale, start, end)
+
+        if ftyp is None:
+            ftyp = make_box("ftyp", b"isom\x00\x00\x02\x00isomiso2mp41")
+
+        payload_size = plan.payload_size
+        mdat_header = 8 if payload_size + 8 <= 0xFFFFFFFF else 16
+        # Sizes of stco/co64 don't depend on the values, so a first pass with
+        # placeholder offsets tells us where mdat data will begin.
+        draft = build_clip_moov(moov, tracks, plan, 0, use_co64=False)
+        data_offset = len(ftyp) + len(draft) + mdat_header
+        use_co64 = data_offset + payload_size > 0xFFFFFFFF
+        if use_co64:
+            draft = build_clip_moov(moov, tracks, plan, 0, use_co64=True)
+            data_offset = len(ftyp) + len(draft) + mdat_header
+        final_moov = build_clip_moov(moov, tracks, plan, data_offset, use_co64)
+
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        partial_path = f"{output_path}.part"
+        try:
+            with open(partial_path, "wb") as raw:
+                out = HashingWriter(raw, hasher) if hasher is not None else raw
+                out.write(ftyp)
+                out.write(final_moov)
+                if mdat_header == 8:
+                    out.write(struct.pack(">I4s", payload_size + 8, b"mdat"))
+                else:
+                    out.write(struct.pack(">I4sQ", 1, b"mdat", payload_size + 16))
+                await _stream_spans(client, url, plan.spans, out, progress_callback)
+            os.replace(partial_path, output_path)
+        except BaseException:
+            # Failed or cancelled: do not leave a clip that looks resumable
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+    durations = [
+        sum(tracks[i].durations[first:last]) / tracks[i].timescale
+        for i, (first, last) in plan.selection.items()
+    ]
+    return {
+        "start": plan.actual_start,
+        "duration": max(durations),
+        "bytes": payload_size,
+    }
@@ -0,0 +1,46 @@
+import os
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+PLAYLIST_DIRNAME = ".playlists"
+
+
+def _location(path_or_url):
+    if "://" in path_or_url:
+        return path_or_url
+    return Path(path_or_url).resolve().as_uri()
+
+
+def write_m3u(path, entries):
+    """entries: list of (title, path_or_url) in playing order."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        for title, location in entries:
+            # Relative paths would resolve against the playlist directory
+            if "://" not in location:
+                location = os.path.abspath(location)
+            f.write(f"#EXTINF:-1,{title}\n{location}\n")
+
+
+def write_xspf(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<playlist version="1" xmlns="http://xspf.org/ns/0/">\n')
+        f.write("  <trackList>\n")
+        for title, location in entries:
+            f.write("    <track>\n")
+            f.write(f"      <location>{escape(_location(location))}</location>\n")
+            f.write(f"      <title>{escape(title)}</title>\n")
+            f.write("    </track>\n")
+        f.write("  </trackList>\n")
+        f.write("</playlist>\n")
+
+
+def write_playlists(directory, name, entries):
+    """Write <name>.m3u and <name>.xspf; returns (m3u_path, xspf_path)."""
+    os.makedirs(directory, exist_ok=True)
+    m3u_path = os.path.join(directory, f"{name}.m3u")
+    xspf_path = os.path.join(directory, f"{name}.xspf")
+    write_m3u(m3u_path, entries)
+    write_xspf(xspf_path, entries)
+    return m3u_path, xspf_path
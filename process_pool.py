@@ -0,0 +1,47 @@
+import asyncio
+import contextlib
+import multiprocessing
+import sys
+
+
+class ProcessPool:
+    """
+    A multiprocessing pool whose results are awaited from the event loop.
+
+    The pool is started on first use with the spawn method (the TUI has
+    threads running) and terminate() stops running jobs at once.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.pool = None
+
+    async def run(self, func, *args):
+        if self.pool is None:
+            context = multiprocessing.get_context("spawn")
+            # Textual swaps sys.stderr for an object without a file
+            # descriptor, which the resource tracker would try to pass on
+            with contextlib.redirect_stderr(sys.__stderr__):
+                self.pool = context.Pool(self.max_workers)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(setter, value):
+            def settle():
+                if not future.done():
+                    setter(value)
+
+            loop.call_soon_threadsafe(settle)
+
+        self.pool.apply_async(
+            func,
+            args,
+            callback=lambda result: resolve(future.set_result, result),
+            error_callback=lambda error: resolve(future.set_exception, error),
+        )
+        return await future
+
+    def terminate(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
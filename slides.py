@@ -0,0 +1,443 @@
+"""
+Keep only the slides of a PPT-angle recording.
+
+ffmpeg decodes the keyframes of the video as it streams in and hands
+small grayscale frames to Python, which looks for slide changes by frame
+differencing, vectorized with NumPy (in requirements.txt; without it a
+slower loop compares every FALLBACK_PIXEL_STEP-th pixel). A slide is
+kept once it stayed on screen for STABLE_SAMPLES samples; slides shown
+again later are recognised and only get another timestamp. The result is
+a directory of JPEGs plus index.json, or a single PDF with one bookmark
+per slide.
+
+    python slides.py --mode pdf Downloads/        # convert downloaded PPT videos
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import sys
+
+from process_pool import ProcessPool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PPT_MODES = ("video", "slides", "pdf")
+INDEX_FILENAME = "index.json"
+
+# One detection frame per this many seconds of video
+SAMPLE_SECONDS = 1
+FRAME_WIDTH = 160
+FRAME_HEIGHT = 90
+
+# A pixel counts as changed when its gray level moves by more than
+# PIXEL_DELTA; a frame is a different slide when more than CHANGE_RATIO of
+# its pixels changed. A new bullet point on a 160x90 frame is about 1%.
+PIXEL_DELTA = 24
+CHANGE_RATIO = 0.004
+
+# Without NumPy only every this many pixels is compared; with a row width
+# that is not a multiple of it, the sampled columns shift from row to row
+FALLBACK_PIXEL_STEP = 3
+
+# Consecutive similar samples before a frame counts as a slide, so
+# transitions and animations are not kept
+STABLE_SAMPLES = 2
+
+# ffmpeg -q:v for the kept slides (2 best .. 31 worst)
+JPEG_QUALITY = 3
+
+# Lectures processed at the same time; ffmpeg itself uses several threads
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+class SlideError(Exception):
+    pass
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def slides_path(video_path, mode):
+    """Where slides of the recording at video_path (…_PPT.mp4) are kept."""
+    root = os.path.splitext(video_path)[0]
+    if mode == "pdf":
+        return f"{root}.pdf"
+    return f"{root}_slides"
+
+
+def slides_complete(video_path, mode):
+    path = slides_path(video_path, mode)
+    if mode == "pdf":
+        return os.path.exists(path)
+    return os.path.exists(os.path.join(path, INDEX_FILENAME))
+
+
+def format_time(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _input_args(source):
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+    if source.startswith(("http://", "https://")):
+        args += ["-reconnect", "1"]
+    return args
+
+
+def iter_frames(source):
+    """Yield (seconds, frame) for each sample; frame is FRAME_WIDTH x FRAME_HEIGHT gray."""
+    argv = _input_args(source) + [
+        # Keyframes only: slides do not need the frames in between
+        "-skip_frame",
+        "nokey",
+        "-i",
+        source,
+        "-an",
+        "-sn",
+        "-vf",
+        f"fps=1/{SAMPLE_SECONDS},scale={FRAME_WIDTH}:{FRAME_HEIGHT},format=gray",
+        "-f",
+        "rawvideo",
+        "pipe:1",
+    ]
+    frame_size = FRAME_WIDTH * FRAME_HEIGHT
+    process = subprocess.Popen(
+        argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        index = 0
+        while True:
+            frame = process.stdout.read(frame_size)
+            if len(frame) < frame_size:
+                break
+            if numpy is not None:
+                frame = numpy.frombuffer(frame, dtype=numpy.uint8)
+            yield index * SAMPLE_SECONDS, frame
+            index += 1
+        error = process.stderr.read().decode("utf-8", errors="replace").strip()
+        if process.wait() != 0:
+            raise SlideError(f"ffmpeg failed: {error.splitlines()[-1] if error else ''}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def frames_differ(a, b):
+    if numpy is not None:
+        changed = numpy.count_nonzero(
+            numpy.abs(a.astype(numpy.int16) - b) > PIXEL_DELTA
+        )
+        return changed > len(a) * CHANGE_RATIO
+    step = FALLBACK_PIXEL_STEP
+    changed = sum(abs(x - y) > PIXEL_DELTA for x, y in zip(a[::step], b[::step]))
+    return changed > len(a[::step]) * CHANGE_RATIO
+
+
+def detect_slides(frames):
+    """
+    Distinct slides in (seconds, frame) samples, in order of first showing.
+
+    Each slide is {"time": when it was confirmed stable, "shown_at": [start
+    of each showing], "frame": its detection frame}.
+    """
+    slides = []
+    shown = None
+    candidate = None
+    candidate_time = None
+    stable = 0
+    for seconds, frame in frames:
+        if candidate is not None and not frames_differ(candidate, frame):
+            stable += 1
+        else:
+            candidate, candidate_time, stable = frame, seconds, 1
+        if stable != STABLE_SAMPLES:
+            continue
+        if shown is not None and not frames_differ(shown["frame"], candidate):
+            continue
+        shown = next(
+            (s for s in slides if not frames_differ(s["frame"], candidate)), None
+        )
+        if shown is None:
+            shown = {"time": seconds, "shown_at": [], "frame": candidate}
+            slides.append(shown)
+        shown["shown_at"].append(candidate_time)
+    return slides
+
+
+def grab_frame(source, seconds, path):
+    """Write the full-size frame at seconds to path as JPEG."""
+    argv = _input_args(source) + [
+        "-ss",
+        str(seconds),
+        "-i",
+        source,
+        "-frames:v",
+        "1",
+        "-q:v",
+        str(JPEG_QUALITY),
+        "-y",
+        path,
+    ]
+    result = subprocess.run(
+        argv, stdin=subprocess.DEVNULL, capture_output=True, text=True
+    )
+    if result.returncode != 0 or not os.path.exists(path):
+        raise SlideError(f"ffmpeg could not grab {format_time(seconds)}")
+
+
+def jpeg_size(data):
+    """(width, height, components) from a JPEG's frame header."""
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            break
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        (length,) = struct.unpack_from(">H", data, offset + 2)
+        # SOF0..SOF15, except DHT, JPG and DAC which share the range
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack_from(">HH", data, offset + 5)
+            return width, height, data[offset + 9]
+        offset += 2 + length
+    raise SlideError("JPEG without a frame header")
+
+
+def _pdf_string(text):
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({escaped})"
+
+
+def write_pdf(path, pages):
+    """
+    Write a PDF with one page per JPEG; pages is [(jpeg_path, title)].
+
+    The JPEGs are embedded as they are (DCTDecode); each title becomes a
+    bookmark pointing at its page.
+    """
+    colorspaces = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}
+    # 1 catalog, 2 page tree, 3 outline root, then 4 objects per page
+    page_ids = [4 + 4 * i for i in range(len(pages))]
+    offsets = {}
+
+    with open(path, "wb") as f:
+
+        def write_object(number, body, stream=None):
+            offsets[number] = f.tell()
+            f.write(f"{number} 0 obj\n".encode("latin-1"))
+            f.write(body.encode("latin-1"))
+            if stream is not None:
+                f.write(b"\nstream\n")
+                f.write(stream)
+                f.write(b"\nendstream")
+            f.write(b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        write_object(
+            1, "<< /Type /Catalog /Pages 2 0 R /Outlines 3 0 R /PageMode /UseOutlines >>"
+        )
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+        if pages:
+            write_object(
+                3,
+                f"<< /Type /Outlines /First {page_ids[0] + 3} 0 R "
+                f"/Last {page_ids[-1] + 3} 0 R /Count {len(pages)} >>",
+            )
+        else:
+            write_object(3, "<< /Type /Outlines /Count 0 >>")
+
+        for i, (jpeg_path, title) in enumerate(pages):
+            page_id = page_ids[i]
+            with open(jpeg_path, "rb") as image:
+                data = image.read()
+            width, height, components = jpeg_size(data)
+            write_object(
+                page_id,
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+                f"/Resources << /XObject << /Im0 {page_id + 2} 0 R >> >> "
+                f"/Contents {page_id + 1} 0 R >>",
+            )
+            content = f"q {width} 0 0 {height} 0 0 cm /Im0 Do Q".encode("latin-1")
+            write_object(page_id + 1, f"<< /Length {len(content)} >>", content)
+            write_object(
+                page_id + 2,
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace {colorspaces.get(components, '/DeviceRGB')} "
+                f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(data)} >>",
+                data,
+            )
+            links = ""
+            if i > 0:
+                links += f" /Prev {page_ids[i - 1] + 3} 0 R"
+            if i + 1 < len(pages):
+                links += f" /Next {page_ids[i + 1] + 3} 0 R"
+            write_object(
+                page_id + 3,
+                f"<< /Title {_pdf_string(title)} /Parent 3 0 R{links} "
+                f"/Dest [{page_id} 0 R /Fit] >>",
+            )
+
+        xref_offset = f.tell()
+        count = 4 + 4 * len(pages)
+        f.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode("latin-1"))
+        for number in range(1, count):
+            f.write(f"{offsets[number]:010d} 00000 n \n".encode("latin-1"))
+        f.write(
+            f"trailer\n<< /Size {count} /Root 1 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+        )
+
+
+def _output_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+def extract_slides(source, video_path, mode):
+    """
+    Detect the slides of source (URL or file) and keep them next to
+    video_path as `mode` ("slides" or "pdf"). Runs in a pool process.
+
+    Returns {"path", "slides", "bytes"}. Output appears only when complete.
+    """
+    output = slides_path(video_path, mode)
+    work_dir = f"{slides_path(video_path, 'slides')}.tmp"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    try:
+        slides = detect_slides(iter_frames(source))
+        if not slides:
+            raise SlideError("no slides found")
+
+        index = []
+        for number, slide in enumerate(slides, 1):
+            name = f"{number:03d}_{format_time(slide['time']).replace(':', '-')}.jpg"
+            grab_frame(source, slide["time"], os.path.join(work_dir, name))
+            index.append(
+                {
+                    "file": name,
+                    "time": slide["time"],
+                    "shown_at": slide["shown_at"],
+                }
+            )
+
+        if mode == "pdf":
+            temp_path = f"{output}.tmp"
+            write_pdf(
+                temp_path,
+                [
+                    (
+                        os.path.join(work_dir, entry["file"]),
+                        ", ".join(format_time(t) for t in entry["shown_at"]),
+                    )
+                    for entry in index
+                ],
+            )
+            os.replace(temp_path, output)
+            shutil.rmtree(work_dir)
+        else:
+            with open(
+                os.path.join(work_dir, INDEX_FILENAME), "w", encoding="utf-8"
+            ) as f:
+                json.dump(
+                    {"sample_seconds": SAMPLE_SECONDS, "slides": index}, f, indent=2
+                )
+            shutil.rmtree(output, ignore_errors=True)
+            os.replace(work_dir, output)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    return {"path": output, "slides": len(index), "bytes": _output_size(output)}
+
+
+class SlideExtractor(ProcessPool):
+    """Runs extract_slides in a pool of processes, one lecture per process."""
+
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        super().__init__(max_workers)
+
+    @property
+    def available(self):
+        return ffmpeg_available()
+
+    async def extract(self, source, video_path, mode):
+        return await self.run(extract_slides, source, video_path, mode)
+
+
+def find_ppt_videos(paths):
+    """Downloaded PPT-angle videos among paths (files or directories)."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in sorted(files):
+                if name.endswith("_PPT.mp4"):
+                    yield os.path.join(root, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replace downloaded PPT-angle videos with their slides"
+    )
+    parser.add_argument("paths", nargs="+", help="Videos or directories to scan")
+    parser.add_argument("--mode", choices=["slides", "pdf"], default="slides")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--remove-video",
+        action="store_true",
+        help="Delete each video once its slides were written",
+    )
+    args = parser.parse_args()
+
+    if not ffmpeg_available():
+        print("Error: ffmpeg is required for slide extraction.")
+        sys.exit(1)
+
+    videos = [
+        v for v in find_ppt_videos(args.paths) if not slides_complete(v, args.mode)
+    ]
+    print(f"Extracting slides from {len(videos)} videos ({args.jobs} at a time)...")
+    saved = 0
+    failed = 0
+    with multiprocessing.Pool(args.jobs) as pool:
+        results = [
+            (video, pool.apply_async(extract_slides, (video, video, args.mode)))
+            for video in videos
+        ]
+        for video, result in results:
+            try:
+                summary = result.get()
+            except Exception as e:
+                failed += 1
+                print(f"[ERROR] {video}: {e}")
+                continue
+            size = os.path.getsize(video)
+            print(
+                f"{video}: {summary['slides']} slides, "
+                f"{size / 1024**2:.1f} MiB -> {summary['bytes'] / 1024**2:.1f} MiB"
+            )
+            if args.remove_video:
+                os.remove(video)
+                saved += size - summary["bytes"]
+    if args.remove_video:
+        print(f"Saved {saved / 1024**3:.2f} GiB.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
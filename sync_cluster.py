@@ -0,0 +1,753 @@
+"""
+Split a full sync across several worker processes or hosts.
+
+The coordinator enumerates recordings through the curriculum and
+subject-VOD APIs and writes one job per recording/angle into a shared
+SQLite database. Workers lease jobs from it, download them with the
+regular DownloadPool and heartbeat while they run; a job whose lease runs
+out (worker killed, host gone, download stuck) goes back to the queue and
+is picked up by another worker.
+
+    python sync_cluster.py coordinator --db sync.db
+    python sync_cluster.py worker --db sync.db --id box1 --concurrency 4
+
+Every process reads the same config.json. Job paths are stored relative
+to download_dir, so hosts may mount the shared storage at different
+places. Across hosts the database must live on a filesystem with working
+POSIX locks; SQLite over most network filesystems is not safe.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from autotune import TUNING_FILENAME, TuningStore, ensure_tuned
+from download_queue import (
+    ACTIVE,
+    DONE,
+    FAILED,
+    PENDING,
+    entry_key,
+    local_size,
+    remote_size,
+)
+from downloader import DownloaderManager, DownloadPool
+from faststart import FastStartPool
+from host_selector import HostSelector
+from http_cache import HttpCache
+from local_library import is_complete
+import tracing
+from tracing import span
+from vod_api import (
+    VOD_URL_TTL_SECONDS,
+    VodClient,
+    angle_suffix,
+    angle_wanted,
+    filter_downloadable_records,
+    filter_records_by_date,
+    safe_name,
+)
+
+SYNC_DB_FILENAME = ".sync.db"
+
+# A worker must renew its lease within this time or lose the job
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 20
+
+# A running download that has not written a byte for this long is given up
+# by its worker and handed back to the queue
+STALL_SECONDS = 300
+
+# Jobs that failed this many times stay FAILED
+MAX_ATTEMPTS = 5
+
+# Idle workers look for new jobs this often
+CLAIM_INTERVAL_SECONDS = 2
+PROGRESS_INTERVAL_SECONDS = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    record_id TEXT NOT NULL,
+    angle TEXT NOT NULL,
+    course TEXT,
+    path TEXT NOT NULL,
+    url TEXT,
+    url_fetched_at REAL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    bytes_done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    heartbeat REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def log(msg, severity="information"):
+    print(f"{time.strftime('%H:%M:%S')} [{severity.upper()}] {msg}", flush=True)
+
+
+class WorkQueue:
+    """
+    Download jobs in a SQLite database shared by coordinator and workers.
+
+    Claims run inside BEGIN IMMEDIATE so two workers never lease the same
+    job. A job is leased to one worker until lease_expires; heartbeats push
+    the lease forward, and an expired lease makes the job claimable again.
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _transaction(self):
+        return _Immediate(self.db)
+
+    def set_meta(self, name, value):
+        self.db.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value)
+        )
+
+    def get_meta(self, name):
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE name = ?", (name,)
+        ).fetchone()
+        return row["value"] if row else None
+
+    def add(self, jobs):
+        """
+        Insert jobs; returns how many were not in the queue yet.
+
+        Known jobs get the newly resolved URL. Finished or failed ones are
+        queued again when the coordinator found their file missing; jobs
+        leased to a worker are left to it.
+        """
+        now = time.time()
+        with self._transaction():
+            before = self.db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            self.db.executemany(
+                """
+                INSERT INTO jobs (key, record_id, angle, course, path, url,
+                                  url_fetched_at, state, updated_at)
+                VALUES (:key, :record_id, :angle, :course, :path, :url,
+                        :url_fetched_at, :state, :now)
+                ON CONFLICT (key) DO UPDATE SET
+                    url = excluded.url,
+                    url_fetched_at = excluded.url_fetched_at,
+                    state = CASE WHEN jobs.state = :active THEN jobs.state
+                                 ELSE excluded.state END,
+                    attempts = CASE WHEN jobs.state = :active THEN jobs.attempts
+                                    WHEN excluded.state = :pending
+                                     AND jobs.state != :pending THEN 0
+                                    ELSE jobs.attempts END
+                """,
+                [
+                    {**job, "now": now, "active": ACTIVE, "pending": PENDING}
+                    for job in jobs
+                ],
+            )
+            after = self.db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            return after - before
+
+    def states(self):
+        """{key: state} of every job."""
+        return {
+            row["key"]: row["state"]
+            for row in self.db.execute("SELECT key, state FROM jobs")
+        }
+
+    def claim(self, worker_id):
+        """Lease the next pending or abandoned job to worker_id, or None."""
+        now = time.time()
+        with self._transaction():
+            while True:
+                row = self.db.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE state = ?
+                       OR (state = ? AND lease_expires < ?)
+                    ORDER BY attempts, key
+                    LIMIT 1
+                    """,
+                    (PENDING, ACTIVE, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["state"] == PENDING:
+                    break
+                if row["attempts"] < MAX_ATTEMPTS:
+                    log(
+                        f"Reassigning {row['key']} from {row['worker']} "
+                        f"to {worker_id}",
+                        severity="warning",
+                    )
+                    break
+                self.db.execute(
+                    """
+                    UPDATE jobs SET state = ?, error = ?, lease_expires = NULL,
+                                    updated_at = ?
+                    WHERE key = ?
+                    """,
+                    (FAILED, "lease expired", now, row["key"]),
+                )
+            self.db.execute(
+                """
+                UPDATE jobs
+                SET state = ?, worker = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE key = ?
+                """,
+                (ACTIVE, worker_id, now + self.lease_seconds, now, row["key"]),
+            )
+            return dict(row)
+
+    def heartbeat(self, worker_id, progress):
+        """
+        Record that worker_id is alive and extend the leases of its jobs.
+
+        progress maps job key -> bytes on disk; only those jobs are renewed,
+        so a job the worker dropped without reporting expires on its own.
+        """
+        now = time.time()
+        with self._transaction():
+            self.db.execute(
+                """
+                INSERT INTO workers (id, host, pid, heartbeat) VALUES (?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    host = excluded.host, pid = excluded.pid,
+                    heartbeat = excluded.heartbeat
+                """,
+                (worker_id, socket.gethostname(), os.getpid(), now),
+            )
+            self.db.executemany(
+                """
+                UPDATE jobs SET lease_expires = ?, bytes_done = ?, updated_at = ?
+                WHERE key = ? AND worker = ? AND state = ?
+                """,
+                [
+                    (now + self.lease_seconds, size, now, key, worker_id, ACTIVE)
+                    for key, size in progress.items()
+                ],
+            )
+
+    def update_url(self, key, worker_id, url):
+        self.db.execute(
+            """
+            UPDATE jobs SET url = ?, url_fetched_at = ?
+            WHERE key = ? AND worker = ? AND state = ?
+            """,
+            (url, time.time(), key, worker_id, ACTIVE),
+        )
+
+    def finish(self, key, worker_id, error=None):
+        """
+        Mark a leased job done, or failed with error.
+
+        Failed jobs go back to PENDING until they have used MAX_ATTEMPTS.
+        Reports from a worker whose lease was already handed on are ignored.
+        """
+        now = time.time()
+        with self._transaction():
+            row = self.db.execute(
+                "SELECT attempts, worker, state FROM jobs WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row["worker"] != worker_id or row["state"] != ACTIVE:
+                return False
+            if error is None:
+                state = DONE
+            elif row["attempts"] >= MAX_ATTEMPTS:
+                state = FAILED
+            else:
+                state = PENDING
+            self.db.execute(
+                """
+                UPDATE jobs
+                SET state = ?, error = ?, lease_expires = NULL, updated_at = ?
+                WHERE key = ?
+                """,
+                (state, error, now, key),
+            )
+            return True
+
+    def counts(self):
+        """{state: number of jobs}; leased jobs past their lease count as stalled."""
+        now = time.time()
+        counts = defaultdict(int)
+        for row in self.db.execute(
+            """
+            SELECT CASE WHEN state = ? AND lease_expires < ? THEN 'stalled'
+                        ELSE state END AS state,
+                   COUNT(*) AS n
+            FROM jobs GROUP BY 1
+            """,
+            (ACTIVE, now),
+        ):
+            counts[row["state"]] = row["n"]
+        return counts
+
+    def live_workers(self):
+        return [
+            dict(row)
+            for row in self.db.execute(
+                "SELECT * FROM workers WHERE heartbeat >= ? ORDER BY id",
+                (time.time() - self.lease_seconds,),
+            )
+        ]
+
+    def drained(self):
+        """True once enumeration is finished and no job is left to run."""
+        if self.get_meta("enumerated") != "1":
+            return False
+        counts = self.counts()
+        return not (counts[PENDING] or counts[ACTIVE] or counts["stalled"])
+
+
+class _Immediate:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def format_counts(counts):
+    return ", ".join(
+        f"{counts[state]} {state}"
+        for state in (PENDING, ACTIVE, "stalled", DONE, FAILED)
+        if counts[state]
+    ) or "empty"
+
+
+class Coordinator:
+    """Enumerate every wanted recording/angle into the work queue."""
+
+    def __init__(
+        self,
+        api,
+        queue,
+        download_dir,
+        download_angles=None,
+        start_date=None,
+        end_date=None,
+        courses=None,
+    ):
+        self.api = api
+        self.queue = queue
+        self.download_dir = download_dir
+        self.download_angles = download_angles
+        self.start_date = start_date
+        self.end_date = end_date
+        self.courses = set(courses or [])
+
+    async def subject_records(self):
+        """All recordings of every course in the curriculum, like batch download."""
+        curriculum = await self.api.fetch_curriculum()
+        subjects = {}
+        for record in curriculum:
+            name = record.get("subjName", "Unknown Course")
+            if self.courses and name not in self.courses:
+                continue
+            key = (record.get("teclId"), record.get("subjId"))
+            subjects.setdefault(key, []).append(record)
+
+        records = []
+        for (tecl_id, subj_id), course_records in subjects.items():
+            if tecl_id and subj_id:
+                subject_records = await self.api.fetch_subject_vod_list(tecl_id)
+                course_records = [
+                    r for r in subject_records if r.get("subjId") == subj_id
+                ]
+            records.extend(course_records)
+
+        if self.start_date and self.end_date:
+            records = filter_records_by_date(records, self.start_date, self.end_date)
+        return filter_downloadable_records(records)
+
+    async def enumerate(self):
+        with span("enumerate_courses"):
+            records = await self.subject_records()
+        log(f"Resolving videos of {len(records)} recordings...")
+        semaphore = asyncio.Semaphore(6)
+
+        async def fetch(record):
+            async with semaphore:
+                try:
+                    return await self.api.fetch_vod_list(str(record.get("id")))
+                except Exception as e:
+                    log(f"Failed to resolve {record.get('id')}: {e}", "warning")
+                    return []
+
+        video_lists = await asyncio.gather(*(fetch(r) for r in records))
+        fetched_at = time.time()
+        stored = self.queue.states()
+        jobs = []
+        # Files on disk that the queue has not seen finish
+        unverified = []
+        for record, video_list in zip(records, video_lists):
+            course = record.get("subjName", "Unknown Course")
+            safe_time = safe_name(record.get("courBeginTime", "UnknownTime"))
+            for v in video_list:
+                if not v.get("url") or not angle_wanted(v, self.download_angles):
+                    continue
+                angle = angle_suffix(v)
+                path = os.path.join(safe_name(course), f"{safe_time}_{angle}.mp4")
+                job = {
+                    "key": entry_key(record.get("id"), angle),
+                    "record_id": str(record.get("id")),
+                    "angle": angle,
+                    "course": course,
+                    "path": path,
+                    "url": v["url"],
+                    "url_fetched_at": fetched_at,
+                    "state": PENDING,
+                }
+                jobs.append(job)
+                if not is_complete(os.path.join(self.download_dir, path)):
+                    continue
+                if stored.get(job["key"]) == DONE:
+                    job["state"] = DONE
+                else:
+                    unverified.append(job)
+
+        # wget and curl write straight to the final path, so a file left by
+        # a killed worker looks complete; only a matching size proves it
+        with span("verify_sizes", files=len(unverified)):
+            await self.verify_sizes(unverified)
+        on_disk = sum(job["state"] == DONE for job in jobs)
+
+        added = self.queue.add(jobs)
+        self.queue.set_meta("enumerated", "1")
+        log(
+            f"Queued {len(jobs)} files ({added} new, {on_disk} already on disk): "
+            f"{format_counts(self.queue.counts())}"
+        )
+
+    async def verify_sizes(self, jobs):
+        """Mark jobs DONE whose file on disk has the size of their URL."""
+        semaphore = asyncio.Semaphore(6)
+
+        async def check(client, job):
+            async with semaphore:
+                total = await remote_size(client, job["url"])
+            try:
+                size = os.path.getsize(os.path.join(self.download_dir, job["path"]))
+            except OSError:
+                return
+            if total is not None and size == total:
+                job["state"] = DONE
+
+        async with httpx.AsyncClient(verify=False, follow_redirects=True) as client:
+            await asyncio.gather(*(check(client, job) for job in jobs))
+
+    async def run(self):
+        self.queue.set_meta("enumerated", "0")
+        try:
+            await self.enumerate()
+        except Exception as e:
+            log(f"Failed to enumerate recordings: {e}", "error")
+            return 1
+        while not self.queue.drained():
+            await asyncio.sleep(PROGRESS_INTERVAL_SECONDS)
+            workers = self.queue.live_workers()
+            log(
+                f"{format_counts(self.queue.counts())} "
+                f"({len(workers)} live workers)"
+            )
+        counts = self.queue.counts()
+        log(f"Sync finished: {format_counts(counts)}")
+        return 0 if not counts[FAILED] else 1
+
+
+class Worker:
+    """Lease jobs from the queue and download them with a DownloadPool."""
+
+    def __init__(
+        self,
+        api,
+        queue,
+        downloader_manager,
+        download_dir,
+        worker_id,
+        concurrency=3,
+        faststart_pool=None,
+    ):
+        self.api = api
+        self.queue = queue
+        self.downloader_manager = downloader_manager
+        self.download_dir = download_dir
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.pool = DownloadPool(
+            downloader_manager, max_concurrent=concurrency, on_event=self.on_event
+        )
+        # key -> [output path, bytes on disk, time the size last grew]
+        self.running = {}
+        # key -> output path, downloaded and being remuxed for fast start
+        self.remuxing = {}
+        self.faststart_pool = faststart_pool
+        self.finished = 0
+
+    def on_event(self, event):
+        if event.kind != "finished":
+            return
+        job = self.running.pop(event.key, None)
+        if job is None:
+            return
+        if event.returncode == 0:
+            if self.faststart_pool is None:
+                self.complete(event.key)
+                return
+            # The job stays leased until the rewritten file is in place
+            self.remuxing[event.key] = job[0]
+            asyncio.ensure_future(self.remux(event.key, job[0]))
+        else:
+            self.queue.finish(
+                event.key, self.worker_id, f"exit code {event.returncode}"
+            )
+            log(f"{event.key} failed (exit code {event.returncode})", "error")
+
+    def complete(self, key):
+        self.finished += 1
+        self.queue.finish(key, self.worker_id)
+        log(f"Finished {key}")
+
+    async def remux(self, key, path):
+        try:
+            with span("faststart", key=key):
+                await self.faststart_pool.remux(path)
+        except Exception as e:
+            log(f"Could not remux {key} for fast start: {e}", "warning")
+        finally:
+            del self.remuxing[key]
+        self.complete(key)
+
+    async def fresh_url(self, job):
+        """The stored URL while its auth key is valid, else a newly resolved one."""
+        fetched_at = job.get("url_fetched_at") or 0
+        if job["url"] and job["attempts"] == 0 and (
+            time.time() - fetched_at < VOD_URL_TTL_SECONDS
+        ):
+            return job["url"]
+        for v in await self.api.fetch_vod_list(job["record_id"]):
+            if v.get("url") and angle_suffix(v) == job["angle"]:
+                self.queue.update_url(job["key"], self.worker_id, v["url"])
+                return v["url"]
+        return None
+
+    async def start(self, job):
+        path = os.path.join(self.download_dir, job["path"])
+        try:
+            with span("resolve_url", key=job["key"]):
+                url = await self.fresh_url(job)
+        except Exception as e:
+            self.queue.finish(job["key"], self.worker_id, f"resolve failed: {e}")
+            return
+        if not url:
+            self.queue.finish(job["key"], self.worker_id, "no video URL")
+            return
+        if self.downloader_manager.tuning is not None and self.pool.tool == "aria2c":
+            await ensure_tuned(self.downloader_manager.tuning, url, notify=log)
+        log(f"Downloading {job['key']} -> {job['path']}")
+        self.running[job["key"]] = [path, 0, time.monotonic()]
+        self.pool.submit(
+            job["key"], url, os.path.dirname(path), os.path.basename(path)
+        )
+
+    def check_progress(self):
+        """Bytes on disk per running job; stuck downloads are cancelled."""
+        now = time.monotonic()
+        progress = {}
+        for key, job in list(self.running.items()):
+            path, last_size, grew_at = job
+            size = 0
+            for candidate in (path, f"{path}.part"):
+                try:
+                    size = max(size, os.path.getsize(candidate))
+                except OSError:
+                    continue
+            if size > last_size:
+                job[1], job[2] = size, now
+            elif now - grew_at > STALL_SECONDS:
+                log(f"{key} stalled, handing it back", "warning")
+                self.pool.cancel(key)
+                continue
+            progress[key] = size
+        for key, path in self.remuxing.items():
+            # The remux may be replacing the file right now
+            progress[key] = local_size(path)
+        return progress
+
+    async def run(self):
+        if not self.pool.available:
+            log("No command-line downloader (aria2c, wget or curl) found", "error")
+            return 1
+        self.queue.heartbeat(self.worker_id, {})
+        log(
+            f"Worker {self.worker_id} started "
+            f"({self.pool.tool}, {self.concurrency} slots)"
+        )
+        # Several heartbeats per lease, so one slow write does not lose it
+        interval = min(HEARTBEAT_SECONDS, self.queue.lease_seconds / 3)
+        next_heartbeat = time.monotonic() + interval
+        try:
+            while True:
+                while len(self.running) < self.concurrency:
+                    job = self.queue.claim(self.worker_id)
+                    if job is None:
+                        break
+                    await self.start(job)
+
+                if not self.running and not self.remuxing and self.queue.drained():
+                    break
+
+                if time.monotonic() >= next_heartbeat:
+                    self.queue.heartbeat(self.worker_id, self.check_progress())
+                    next_heartbeat = time.monotonic() + interval
+                await asyncio.sleep(CLAIM_INTERVAL_SECONDS)
+        finally:
+            await self.pool.shutdown()
+            if self.faststart_pool is not None:
+                self.faststart_pool.terminate()
+        log(f"Worker {self.worker_id} done, {self.finished} files downloaded")
+        return 0
+
+
+def main():
+    from course_tui import load_config
+
+    parser = argparse.ArgumentParser(description="Distributed HDU course sync")
+    parser.add_argument("role", choices=["coordinator", "worker"])
+    parser.add_argument(
+        "--config",
+        default="config.json",
+        help="Path to configuration file (default: config.json)",
+    )
+    parser.add_argument(
+        "--db",
+        default=None,
+        help=f"Shared work queue (default: <download_dir>/{SYNC_DB_FILENAME})",
+    )
+    parser.add_argument(
+        "--id",
+        default=f"{socket.gethostname()}-{os.getpid()}",
+        help="Worker name shown in leases (default: host-pid)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Downloads per worker (default: max_concurrent_downloads)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Record spans (FILE.json: Chrome trace format, otherwise JSON lines)",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=LEASE_SECONDS,
+        help="Seconds before a silent worker's jobs are reassigned "
+        f"(default: {LEASE_SECONDS})",
+    )
+    parser.add_argument(
+        "--course",
+        action="append",
+        default=[],
+        help="Only sync this course (subjName); may be repeated",
+    )
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+
+    if args.trace:
+        tracing.configure(args.trace)
+    os.makedirs(config.download_dir, exist_ok=True)
+    queue = WorkQueue(
+        args.db or os.path.join(config.download_dir, SYNC_DB_FILENAME),
+        lease_seconds=args.lease_seconds,
+    )
+    api = VodClient(
+        config.cookies,
+        config.headers,
+        api_base=config.api_base,
+        host_selector=(
+            HostSelector(config.video_mirrors) if config.video_mirrors else None
+        ),
+        http_cache=HttpCache(config.http_cache) if config.http_cache else None,
+    )
+
+    if args.role == "coordinator":
+        role = Coordinator(
+            api,
+            queue,
+            config.download_dir,
+            download_angles=config.download_angles,
+            start_date=config.start_date,
+            end_date=config.end_date,
+            courses=args.course,
+        )
+    else:
+        tuning = (
+            TuningStore.load(os.path.join(config.download_dir, TUNING_FILENAME))
+            if config.aria2_autotune
+            else None
+        )
+        role = Worker(
+            api,
+            queue,
+            DownloaderManager(
+                preferred_downloader=config.downloader,
+                aria2_args=config.aria2_args,
+                tuning=tuning,
+            ),
+            config.download_dir,
+            args.id,
+            concurrency=args.concurrency or config.max_concurrent_downloads,
+            faststart_pool=FastStartPool() if config.faststart else None,
+        )
+
+    try:
+        sys.exit(asyncio.run(role.run()))
+    except KeyboardInterrupt:
+        sys.exit(130)
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Lightweight span tracing for loads, batches and downloads.
+
+    with span("fetch_vod_list", course_id=course_id) as s:
+        ...
+        s.set(videos=len(video_list))
+
+Spans are no-ops until configure(path) is called. The parent of a span is
+whatever span was open when it started, carried in a context variable, so
+the link survives asyncio tasks and asyncio.to_thread. A path ending in
+.json gets the Chrome trace event format (chrome://tracing, Perfetto,
+speedscope); anything else gets one JSON object per line.
+"""
+
+import asyncio
+import atexit
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_tracer = None
+
+
+class _NullSpan:
+    id = None
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.id = next(tracer.ids)
+        parent = _current_span.get()
+        self.parent_id = parent.id if parent else None
+        self.lane = tracer.lane()
+        self.start = None
+        self._token = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _current_span.reset(self._token)
+        if exc_type is asyncio.CancelledError:
+            self.args["cancelled"] = True
+        elif exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer.write(self, end)
+        return False
+
+
+class Tracer:
+    def __init__(self, path):
+        self.path = path
+        self.chrome = path.endswith(".json")
+        self.ids = itertools.count(1)
+        self.pid = os.getpid()
+        # perf_counter for durations, anchored to wall time once
+        self.origin = time.time() - time.perf_counter()
+        self.lanes = {}
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "w", encoding="utf-8")
+        if self.chrome:
+            # The format allows a missing closing bracket, so the file stays
+            # loadable if the process dies before close()
+            self.file.write("[\n")
+
+    def lane(self):
+        """
+        Small integer per asyncio task (or thread) for the viewer's rows;
+        concurrent work in one row would be drawn as bogus nesting.
+        """
+        try:
+            owner = id(asyncio.current_task())
+        except RuntimeError:
+            owner = threading.get_ident()
+        with self.lock:
+            return self.lanes.setdefault(owner, len(self.lanes) + 1)
+
+    def write(self, span, end):
+        if self.chrome:
+            event = {
+                "name": span.name,
+                "ph": "X",
+                "ts": round((self.origin + span.start) * 1e6),
+                "dur": round((end - span.start) * 1e6),
+                "pid": self.pid,
+                "tid": span.lane,
+                "args": {
+                    "span_id": span.id,
+                    "parent_id": span.parent_id,
+                    **span.args,
+                },
+            }
+        else:
+            event = {
+                "id": span.id,
+                "parent": span.parent_id,
+                "name": span.name,
+                "start": round(self.origin + span.start, 6),
+                "duration": round(end - span.start, 6),
+                "lane": span.lane,
+                "args": span.args,
+            }
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line + (",\n" if self.chrome else "\n"))
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            if self.chrome:
+                name = {"name": "hdu-course-tui"}
+                meta = {"name": "process_name", "ph": "M", "pid": self.pid}
+                self.file.write(json.dumps({**meta, "args": name}) + "\n]\n")
+            self.file.close()
+
+
+def configure(path):
+    """Start writing spans to path; closed automatically at exit."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(path)
+    atexit.register(_tracer.close)
+    return _tracer
+
+
+def span(name, **args):
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, args)
+
+
+def traced(name, *arg_names):
+    """
+    Run an async function inside span(name); arg_names are parameters of
+    the function to record as span args.
+    """
+
+    def decorate(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return await func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            span_args = {
+                n: bound.arguments[n] for n in arg_names if n in bound.arguments
+            }
+            with span(name, **span_args):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,239 @@
+"""
+A table widget that draws only the rows in view.
+
+Rows come from a source: len(source) is the row count and source[index]
+returns the cells of one row as strings, the last one being the row key.
+The widget keeps no per-row state, so memory use and redraw cost stay the
+same whether it shows 30 recordings or the whole catalog. LazyRows turns
+a list of records into such a source, building each row when it is
+first drawn.
+"""
+
+from rich.cells import cell_len, set_cell_size
+from rich.segment import Segment
+from textual.binding import Binding
+from textual.geometry import Size
+from textual.message import Message
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+# Rows measured up front to size the columns; a wider cell scrolled into
+# view later widens its column
+WIDTH_SAMPLE_ROWS = 200
+
+# Rows kept built by LazyRows, a few screens of scrolling back and forth
+LAZY_ROW_CACHE_SIZE = 512
+
+COLUMN_GAP = 2
+
+
+class LazyRows:
+    """Table rows of a list of items, built with make_row on first use."""
+
+    def __init__(self, items, make_row, cache_size=LAZY_ROW_CACHE_SIZE):
+        self.items = items
+        self.make_row = make_row
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        row = self.cache.get(index)
+        if row is None:
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            row = self.cache[index] = tuple(self.make_row(self.items[index]))
+        return row
+
+
+class VirtualTable(ScrollView, can_focus=True):
+    """Row-cursor table over a lazily read row source."""
+
+    BINDINGS = [
+        Binding("up", "cursor_up", "Up", show=False),
+        Binding("down", "cursor_down", "Down", show=False),
+        Binding("pageup", "page_up", "Page Up", show=False),
+        Binding("pagedown", "page_down", "Page Down", show=False),
+        Binding("home", "first_row", "First", show=False),
+        Binding("end", "last_row", "Last", show=False),
+        Binding("enter", "select_cursor", "Select", show=False),
+    ]
+
+    COMPONENT_CLASSES = {"virtual-table--header", "virtual-table--cursor"}
+
+    DEFAULT_CSS = """
+    VirtualTable {
+        background: $surface;
+        color: $foreground;
+        &:focus {
+            background-tint: $foreground 5%;
+            & > .virtual-table--cursor {
+                background: $block-cursor-background;
+                color: $block-cursor-foreground;
+                text-style: $block-cursor-text-style;
+            }
+        }
+        & > .virtual-table--header {
+            text-style: bold;
+            background: $panel;
+            color: $foreground;
+        }
+        & > .virtual-table--cursor {
+            background: $block-cursor-blurred-background;
+            color: $block-cursor-blurred-foreground;
+            text-style: $block-cursor-blurred-text-style;
+        }
+    }
+    """
+
+    class RowSelected(Message):
+        """Enter (or a click) on the cursor row."""
+
+        def __init__(self, table, index, key):
+            super().__init__()
+            self.table = table
+            self.index = index
+            self.key = key
+
+        @property
+        def control(self):
+            return self.table
+
+    def __init__(self, *columns, name=None, id=None, classes=None):
+        super().__init__(name=name, id=id, classes=classes)
+        self.columns = columns
+        self.widths = [cell_len(label) for label in columns]
+        self.source = ()
+        self.cursor_row = None
+
+    @property
+    def row_count(self):
+        return len(self.source)
+
+    @property
+    def cursor_key(self):
+        """Key of the row under the cursor, or None for an empty table."""
+        if self.cursor_row is None or self.cursor_row >= len(self.source):
+            return None
+        return self.source[self.cursor_row][-1]
+
+    def set_rows(self, source, columns=None, keep_cursor=False):
+        """
+        Show source, from its first row unless keep_cursor leaves the
+        cursor and scroll position where they were.
+        """
+        if columns is not None:
+            self.columns = columns
+        self.source = source
+        self.widths = [cell_len(label) for label in self.columns]
+        count = len(source)
+        step = max(1, count // WIDTH_SAMPLE_ROWS)
+        for index in range(0, count, step):
+            self._fit(source[index])
+        self._update_virtual_size()
+        if keep_cursor and self.cursor_row is not None and count:
+            self.cursor_row = min(self.cursor_row, count - 1)
+        else:
+            self.cursor_row = 0 if count else None
+            self.scroll_to(0, 0, animate=False)
+        self.refresh()
+
+    def clear(self):
+        self.set_rows(())
+
+    def _fit(self, row):
+        """Widen columns for row; True if any column grew."""
+        grew = False
+        for i, cell in enumerate(row[: len(self.widths)]):
+            width = cell_len(cell)
+            if width > self.widths[i]:
+                self.widths[i] = width
+                grew = True
+        return grew
+
+    def _update_virtual_size(self):
+        width = sum(self.widths) + COLUMN_GAP * (len(self.widths) - 1) + 1
+        # One line for the header, which stays on top while scrolling
+        self.virtual_size = Size(width, len(self.source) + 1)
+
+    def _format(self, cells):
+        gap = " " * COLUMN_GAP
+        return " " + gap.join(
+            set_cell_size(cell, width) for cell, width in zip(cells, self.widths)
+        )
+
+    def render_line(self, y):
+        width = self.size.width
+        base_style = self.rich_style
+        if y == 0:
+            style = base_style + self.get_component_rich_style("virtual-table--header")
+            text = self._format(self.columns)
+        else:
+            index = self.scroll_offset.y + y - 1
+            if index >= len(self.source):
+                return Strip.blank(width, base_style)
+            row = self.source[index]
+            if self._fit(row):
+                self._update_virtual_size()
+                self.call_later(self.refresh)
+            style = base_style
+            if index == self.cursor_row:
+                style += self.get_component_rich_style("virtual-table--cursor")
+            text = self._format(row)
+        scroll_x = self.scroll_offset.x
+        return Strip([Segment(text, style)]).crop_extend(
+            scroll_x, scroll_x + width, style
+        )
+
+    def move_cursor(self, index):
+        if not self.source:
+            return
+        index = max(0, min(index, len(self.source) - 1))
+        if index == self.cursor_row:
+            return
+        self.cursor_row = index
+        # Rows start one line below the header
+        visible = max(1, self.size.height - 1)
+        top = self.scroll_offset.y
+        if index < top:
+            self.scroll_to(y=index, animate=False)
+        elif index >= top + visible:
+            self.scroll_to(y=index - visible + 1, animate=False)
+        self.refresh()
+
+    def action_cursor_down(self):
+        self.move_cursor((self.cursor_row or 0) + 1)
+
+    def action_cursor_up(self):
+        self.move_cursor((self.cursor_row or 0) - 1)
+
+    def action_page_down(self):
+        self.move_cursor((self.cursor_row or 0) + max(1, self.size.height - 1))
+
+    def action_page_up(self):
+        self.move_cursor((self.cursor_row or 0) - max(1, self.size.height - 1))
+
+    def action_first_row(self):
+        self.move_cursor(0)
+
+    def action_last_row(self):
+        self.move_cursor(len(self.source) - 1)
+
+    def action_select_cursor(self):
+        key = self.cursor_key
+        if key is not None:
+            self.post_message(self.RowSelected(self, self.cursor_row, key))
+
+    def on_click(self, event):
+        offset = event.get_content_offset(self)
+        if offset is None or offset.y < 1:
+            return
+        index = self.scroll_offset.y + offset.y - 1
+        if index >= len(self.source):
+            return
+        if index == self.cursor_row:
+            self.action_select_cursor()
+        else:
+            self.move_cursor(index)
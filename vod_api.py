@@ -0,0 +1,363 @@
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+import httpx
+
+from http_cache import DIGEST_HEADER, CachingTransport
+from tracing import span, traced
+
+# Endpoints
+API_BASE = "https://course.hdu.edu.cn"
+CURRICULUM_API_PATH = "/jy-application-vod-he-hdu/v1/myself/curriculum"
+DETAIL_API_PATH = "/jy-application-vod-he-hdu/v1/course_vod_urls"
+SUBJECT_VOD_LIST_API_PATH = "/jy-application-vod-he-hdu/v1/subject_vod_list"
+
+CURRICULUM_API_URL = API_BASE + CURRICULUM_API_PATH
+DETAIL_API_URL = API_BASE + DETAIL_API_PATH
+SUBJECT_VOD_LIST_API_URL = API_BASE + SUBJECT_VOD_LIST_API_PATH
+
+CURRICULUM_PAGE_SIZE = 500  # 1000 is the documented maximum
+SUBJECT_VOD_PAGE_SIZE = 1000
+
+# Video URLs carry auth keys that expire; reuse them only this long
+VOD_URL_TTL_SECONDS = 20 * 60
+
+# Parsed response bodies kept by content digest, so an unchanged page is
+# not parsed again; enough for every curriculum page plus some detail calls
+PARSED_CACHE_ENTRIES = 64
+
+# Connections to API hosts open at once through a SharedTransport, for all
+# accounts together
+MAX_API_CONNECTIONS = 16
+
+
+def angle_label(angle_index):
+    angle_map = {0: "Teacher", 1: "Student", 2: "PPT"}
+    if isinstance(angle_index, int):
+        return angle_map.get(angle_index, f"Angle{angle_index + 1}")
+    return "Angle"
+
+
+def angle_suffix(video_item, default_index=None):
+    angle_index = video_item.get("_angle_index")
+    if angle_index is None:
+        angle_index = default_index
+    return angle_label(angle_index)
+
+
+def angle_wanted(video_item, download_angles):
+    """Whether a video angle passes the configured download_angles filter."""
+    if not download_angles:
+        return True
+    suffix = angle_suffix(video_item)
+    return suffix.lower() in [a.lower() for a in download_angles]
+
+
+def is_downloadable_record(record):
+    return record.get("vodDeleteStatus", 0) == 0
+
+
+def filter_downloadable_records(records):
+    return [r for r in records if is_downloadable_record(r)]
+
+
+def safe_name(text):
+    return "".join([c if c.isalnum() else "_" for c in text])
+
+
+def request_key(url, params=None):
+    """Endpoint plus params in a canonical order, for matching identical calls."""
+    items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    return (url, urlencode(items))
+
+
+def filter_records_by_date(records, start_date, end_date):
+    """Keep records whose courBeginTime date lies in [start_date, end_date]."""
+    filtered_records = []
+    for record in records:
+        # courBeginTime format is typically "YYYY-MM-DD HH:MM:SS"
+        begin_time = record.get("courBeginTime", "")
+        if not begin_time:
+            continue
+        rec_date = begin_time.split(" ")[0]
+        if start_date <= rec_date <= end_date:
+            filtered_records.append(record)
+    return filtered_records
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    Connection pool reused by the short-lived clients of VodClient, also
+    across accounts: cookies travel with each request, not the connection.
+    Clients closing it leave it open; close() does.
+    """
+
+    def __init__(self, max_connections=MAX_API_CONNECTIONS):
+        self.transport = httpx.AsyncHTTPTransport(
+            verify=False, limits=httpx.Limits(max_connections=max_connections)
+        )
+
+    async def handle_async_request(self, request):
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+    async def close(self):
+        await self.transport.aclose()
+
+
+class VodClient:
+    """
+    Thin async wrapper around the HDU VOD endpoints.
+
+    api_base replaces the scheme and host of every endpoint, e.g. to go
+    through a shared vod_proxy.py instance. host_selector (a
+    host_selector.HostSelector) moves video URLs to their fastest mirror.
+    http_cache (an http_cache.HttpCache) makes repeated GETs conditional.
+    transport (a SharedTransport) lets several clients share connections.
+
+    Identical calls made while one is still running share its request and
+    its parsed result; callers must treat returned records as read-only.
+    """
+
+    def __init__(
+        self,
+        cookies,
+        headers,
+        api_base=None,
+        host_selector=None,
+        http_cache=None,
+        transport=None,
+    ):
+        self.cookies = cookies
+        self.headers = headers
+        self.host_selector = host_selector
+        self.http_cache = http_cache
+        self.transport = transport
+        base = (api_base or API_BASE).rstrip("/")
+        self.curriculum_url = base + CURRICULUM_API_PATH
+        self.detail_url = base + DETAIL_API_PATH
+        self.subject_vod_list_url = base + SUBJECT_VOD_LIST_API_PATH
+        self.in_flight = {}
+        self.stats = {"requests": 0, "coalesced": 0, "parse_skipped": 0}
+        self.parsed = OrderedDict()
+
+    def _singleflight(self, key, factory):
+        """
+        Await factory() unless a call with the same key is already running,
+        in which case wait for that one instead.
+
+        Each waiter is shielded, so a cancelled caller (e.g. a superseded
+        worker) does not cancel the request for the others.
+        """
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["requests"] += 1
+            task = asyncio.ensure_future(factory())
+            self.in_flight[key] = task
+
+            def done(t):
+                self.in_flight.pop(key, None)
+                # Mark the error as retrieved if every waiter was cancelled
+                t.cancelled() or t.exception()
+
+            task.add_done_callback(done)
+        return asyncio.shield(task)
+
+    def _client(self):
+        transport = self.transport
+        if self.http_cache is not None:
+            transport = CachingTransport(self.http_cache, transport)
+        return httpx.AsyncClient(
+            cookies=self.cookies,
+            headers=self.headers,
+            verify=False,
+            transport=transport,
+        )
+
+    async def _json(self, response):
+        """
+        Parse a response body off the event loop, or reuse the result for a
+        body already parsed (same content digest from the HTTP cache).
+        """
+        digest = response.headers.get(DIGEST_HEADER)
+        if digest is not None and digest in self.parsed:
+            self.parsed.move_to_end(digest)
+            self.stats["parse_skipped"] += 1
+            return self.parsed[digest]
+        data = await asyncio.to_thread(response.json)
+        if digest is not None:
+            self.parsed[digest] = data
+            while len(self.parsed) > PARSED_CACHE_ENTRIES:
+                self.parsed.popitem(last=False)
+        return data
+
+    async def _fetch_curriculum_page(self, client, page_index, extra_params=None):
+        params = {
+            "page.pageIndex": page_index,
+            "page.pageSize": CURRICULUM_PAGE_SIZE,
+            **(extra_params or {}),
+        }
+
+        with span("curriculum_page", page=page_index) as trace:
+            response = await client.get(self.curriculum_url, params=params)
+            response.raise_for_status()
+            # Large pages; parse off the event loop to keep the UI responsive
+            data = await self._json(response)
+            records = data.get("data", {}).get("records", [])
+            trace.set(records=len(records))
+        return records
+
+    async def fetch_curriculum(self, on_page=None, on_records=None):
+        """
+        Fetch every curriculum page; on_page(page_index) is called before and
+        `await on_records(page_index, records)` after each page.
+
+        A caller that joins a fetch already running gets no callbacks.
+        """
+        return await self._singleflight(
+            request_key(self.curriculum_url),
+            lambda: self._fetch_curriculum(on_page, on_records),
+        )
+
+    @traced("fetch_curriculum")
+    async def _fetch_curriculum(self, on_page, on_records):
+        all_records = []
+        page_index = 1
+
+        async with self._client() as client:
+            while True:
+                if on_page:
+                    on_page(page_index)
+
+                new_records = await self._fetch_curriculum_page(client, page_index)
+                if not new_records:
+                    break
+
+                all_records.extend(new_records)
+                if on_records:
+                    await on_records(page_index, new_records)
+
+                # If we got fewer records than requested, we've reached the last page
+                if len(new_records) < CURRICULUM_PAGE_SIZE:
+                    break
+
+                page_index += 1
+
+        return all_records
+
+    async def fetch_curriculum_since(self, mark, on_page=None):
+        """
+        Fetch curriculum records newest-first, stopping at the first page that
+        reaches below mark (a courBeginTime string).
+
+        Returns the records with courBeginTime >= mark, or None if the server
+        did not honour the requested ordering.
+        """
+        return await self._singleflight(
+            request_key(self.curriculum_url, {"since": mark}),
+            lambda: self._fetch_curriculum_since(mark, on_page),
+        )
+
+    @traced("fetch_curriculum_since", "mark")
+    async def _fetch_curriculum_since(self, mark, on_page):
+        order = {
+            "page.orders[0].asc": "false",
+            "page.orders[0].field": "courBeginTime",
+        }
+        records = []
+        previous = None
+        page_index = 1
+
+        async with self._client() as client:
+            while True:
+                if on_page:
+                    on_page(page_index)
+
+                new_records = await self._fetch_curriculum_page(
+                    client, page_index, order
+                )
+                if not new_records:
+                    break
+
+                for record in new_records:
+                    begin_time = record.get("courBeginTime", "")
+                    if previous is not None and begin_time > previous:
+                        return None
+                    previous = begin_time
+                    if begin_time >= mark:
+                        records.append(record)
+
+                if previous < mark or len(new_records) < CURRICULUM_PAGE_SIZE:
+                    break
+
+                page_index += 1
+
+        return records
+
+    async def fetch_subject_vod_list(self, tecl_id):
+        return await self._singleflight(
+            request_key(self.subject_vod_list_url, {"teclIds": tecl_id}),
+            lambda: self._fetch_subject_vod_list(tecl_id),
+        )
+
+    @traced("fetch_subject_vod_list", "tecl_id")
+    async def _fetch_subject_vod_list(self, tecl_id):
+        all_records = []
+        page_index = 1
+        page_size = SUBJECT_VOD_PAGE_SIZE
+        params_base = {
+            "page.pageSize": page_size,
+            "page.orders[0].asc": "true",
+            "page.orders[0].field": "courBeginTime",
+        }
+
+        async with self._client() as client:
+            while True:
+                params = {
+                    **params_base,
+                    "page.pageIndex": page_index,
+                    "teclIds": str(tecl_id),
+                }
+                response = await client.get(self.subject_vod_list_url, params=params)
+                response.raise_for_status()
+                data = await self._json(response)
+                records = data.get("data", {}).get("records", [])
+                if not records:
+                    break
+                all_records.extend(records)
+                if len(records) < page_size:
+                    break
+                page_index += 1
+
+        return all_records
+
+    async def fetch_vod_list(self, course_id):
+        """Return the courseVodViewList of a recording, tagged with _angle_index."""
+        params = {"courseId": course_id}
+        return await self._singleflight(
+            request_key(self.detail_url, params),
+            lambda: self._fetch_vod_list(params),
+        )
+
+    async def _fetch_vod_list(self, params):
+        with span("fetch_vod_list", course_id=params["courseId"]) as trace:
+            async with self._client() as client:
+                response = await client.get(self.detail_url, params=params)
+                response.raise_for_status()
+                data = await self._json(response)
+
+            # Copies, as a parsed body may be shared with earlier calls
+            video_list = [
+                dict(v) for v in data.get("data", {}).get("courseVodViewList", []) or []
+            ]
+            for i, v in enumerate(video_list):
+                v["_angle_index"] = i
+                if self.host_selector and v.get("url"):
+                    v["url"] = await self.host_selector.choose(v["url"])
+            trace.set(videos=len(video_list))
+        return video_list
@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import httpx
+
+from vod_api import (
+    API_BASE,
+    CURRICULUM_API_PATH,
+    DETAIL_API_PATH,
+    SUBJECT_VOD_LIST_API_PATH,
+)
+
+# (fresh_seconds, stale_seconds) per endpoint. A fresh entry is served as is;
+# a stale one is served while a background request revalidates it. Video
+# URLs carry expiring auth keys, so they are never served stale.
+CACHE_POLICY = {
+    CURRICULUM_API_PATH: (60, 600),
+    SUBJECT_VOD_LIST_API_PATH: (60, 600),
+    DETAIL_API_PATH: (30, 0),
+}
+
+MAX_CACHE_ENTRIES = 5000
+
+# "code" values of a successful API payload; anything else is an error
+# such as an expired session, which must reach the next request unchanged
+SUCCESS_CODES = {0, 200, "0", "200"}
+
+# Request headers that are not passed upstream
+HOP_BY_HOP_HEADERS = {
+    "host",
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "transfer-encoding",
+    "upgrade",
+    "te",
+    "trailer",
+    "accept-encoding",
+    "content-length",
+}
+
+
+def is_success_payload(body):
+    """
+    Whether body is an API payload with data in it. Expired sessions and
+    auth errors come back with status 200 too, as an error payload or a
+    login page.
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return False
+    if not isinstance(payload, dict) or not isinstance(payload.get("data"), dict):
+        return False
+    if payload.get("success") is False:
+        return False
+    return payload.get("code", 0) in SUCCESS_CODES
+
+
+class CacheEntry:
+    def __init__(self, status, content_type, body):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.fetched_at = time.monotonic()
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class VodProxy:
+    """
+    Caching reverse proxy for the VOD API endpoints.
+
+    Responses are cached per cookie identity, identical concurrent requests
+    share one upstream call, and stale entries are revalidated in the
+    background while the cached body is returned.
+    """
+
+    def __init__(self, upstream=API_BASE):
+        self.upstream = upstream.rstrip("/")
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.client = None
+        self.stats = {"hit": 0, "stale": 0, "miss": 0, "coalesced": 0}
+
+    @staticmethod
+    def cache_key(path, query, cookie):
+        identity = hashlib.sha256(cookie.encode("utf-8")).hexdigest()
+        params = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+        return (identity, path, params)
+
+    async def _fetch_upstream(self, key, path, query, headers):
+        response = await self.client.get(
+            f"{self.upstream}{path}", params=query, headers=headers
+        )
+        entry = CacheEntry(
+            response.status_code,
+            response.headers.get("content-type", "application/json"),
+            response.content,
+        )
+        # Parsed off the loop; curriculum pages are large
+        if response.status_code == 200 and await asyncio.to_thread(
+            is_success_payload, response.content
+        ):
+            self.cache[key] = entry
+            self.cache.move_to_end(key)
+            while len(self.cache) > MAX_CACHE_ENTRIES:
+                self.cache.popitem(last=False)
+        return entry
+
+    def _fetch_coalesced(self, key, path, query, headers):
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return task
+        task = asyncio.ensure_future(self._fetch_upstream(key, path, query, headers))
+        self.in_flight[key] = task
+        task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return task
+
+    async def get(self, path, query, headers):
+        """Return (CacheEntry, cache_status) for a GET request."""
+        key = self.cache_key(path, query, headers.get("cookie", ""))
+        fresh_seconds, stale_seconds = CACHE_POLICY[path]
+        entry = self.cache.get(key)
+
+        if entry is not None:
+            age = entry.age()
+            if age < fresh_seconds:
+                self.stats["hit"] += 1
+                return entry, "HIT"
+            if age < fresh_seconds + stale_seconds:
+                self.stats["stale"] += 1
+                task = self._fetch_coalesced(key, path, query, headers)
+                # Errors of a background refresh are ignored; the next
+                # request after the stale window will surface them.
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                return entry, "STALE"
+
+        self.stats["miss"] += 1
+        try:
+            return await self._fetch_coalesced(key, path, query, headers), "MISS"
+        except httpx.HTTPError:
+            if entry is not None:
+                return entry, "STALE-ERROR"
+            raise
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, method, target, headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, method, target, headers, keep_alive):
+        parts = urlsplit(target)
+        cache_status = "BYPASS"
+        if method != "GET":
+            status, content_type, body = 405, "text/plain", b"Method not allowed"
+        elif parts.path not in CACHE_POLICY:
+            status, content_type, body = 404, "text/plain", b"Unknown endpoint"
+        else:
+            upstream_headers = {
+                name: value
+                for name, value in headers.items()
+                if name not in HOP_BY_HOP_HEADERS
+            }
+            try:
+                entry, cache_status = await self.get(
+                    parts.path, parts.query, upstream_headers
+                )
+                status, content_type, body = (
+                    entry.status,
+                    entry.content_type,
+                    entry.body,
+                )
+            except httpx.HTTPError as e:
+                status, content_type, body = 502, "text/plain", str(e).encode()
+
+        reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}.get(
+            status, "Proxy"
+        )
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"X-Cache: {cache_status}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        async with httpx.AsyncClient(verify=False, timeout=30) as client:
+            self.client = client
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"VOD proxy listening on http://{host}:{port} -> {self.upstream}")
+            async with server:
+                await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared caching proxy for the HDU VOD API")
+    parser.add_argument("--host", default="127.0.0.1", help="Listen address")
+    parser.add_argument("--port", type=int, default=8790, help="Listen port")
+    parser.add_argument(
+        "--upstream", default=API_BASE, help=f"Upstream base URL (default: {API_BASE})"
+    )
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(VodProxy(args.upstream).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
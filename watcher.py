@@ -0,0 +1,477 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+from accounts import account_file
+from autotune import ensure_tuned
+from download_queue import (
+    ACTIVE,
+    DONE,
+    PENDING,
+    QUEUE_DIRNAME,
+    DownloadQueue,
+    make_entry,
+)
+from downloader import DownloadPool
+from faststart import FastStartPool
+from local_library import is_complete
+from slides import SlideExtractor, slides_complete
+from vod_api import (
+    angle_suffix,
+    angle_wanted,
+    filter_records_by_date,
+    is_downloadable_record,
+    safe_name,
+)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+
+# Used when a record has no courEndTime
+DEFAULT_CLASS_MINUTES = 95
+
+# How long after class ends a recording is usually published
+DEFAULT_PROCESSING_DELAY_MINUTES = 30
+
+# Follow-up polls when a recording is not published at its due time
+RETRY_MINUTES = [15, 30, 60, 120, 240, 480]
+
+# Classes that ended longer ago than this are left to the batch download
+GIVE_UP_HOURS = 48
+
+CURRICULUM_REFRESH_HOURS = 12
+MAX_SLEEP_SECONDS = 3600
+
+STATE_FILENAME = ".watch_state.json"
+
+# Journal of watch downloads, under the download queue directory. Kept
+# apart from the TUI's queue, which would otherwise resume them itself.
+WATCH_QUEUE_DIRNAME = "watch"
+
+
+def parse_record_time(value):
+    try:
+        return datetime.strptime(value, TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def class_end_time(record):
+    end = parse_record_time(record.get("courEndTime"))
+    if end:
+        return end
+    begin = parse_record_time(record.get("courBeginTime"))
+    if begin:
+        return begin + timedelta(minutes=DEFAULT_CLASS_MINUTES)
+    return None
+
+
+class CourseWatcher:
+    """
+    Poll for new recordings around the time each class should be published.
+
+    The curriculum already lists upcoming class slots, so instead of polling
+    on a fixed interval each slot is checked once at its end time plus the
+    processing delay, and then with backoff until its videos appear. A
+    class only counts as done once every download started for it has
+    exited successfully; a failed one puts the class back on the schedule.
+
+    Watchers of several accounts can share one download_pool,
+    download_queue, slide_extractor and faststart_pool; account names the
+    watch state file and prefixes messages. Downloads are journaled in
+    download_queue, so a file cut off by a crash is not taken as complete.
+
+    days_back / days_forward, when given, replace start_date / end_date
+    with a window around the current day, so a long-running watcher keeps
+    picking up new classes.
+    """
+
+    def __init__(
+        self,
+        api,
+        downloader_manager,
+        download_dir,
+        download_angles=None,
+        start_date=None,
+        end_date=None,
+        processing_delay_minutes=DEFAULT_PROCESSING_DELAY_MINUTES,
+        notify_callback=None,
+        max_concurrent_downloads=3,
+        ppt_mode="video",
+        faststart=True,
+        account=None,
+        download_pool=None,
+        slide_extractor=None,
+        faststart_pool=None,
+        days_back=None,
+        days_forward=None,
+        download_queue=None,
+    ):
+        self.api = api
+        self.account = account
+        self.downloader_manager = downloader_manager
+        self.download_pool = download_pool or DownloadPool(
+            downloader_manager, max_concurrent=max_concurrent_downloads
+        )
+        self.download_dir = download_dir
+        self.download_queue = download_queue or DownloadQueue(
+            os.path.join(download_dir, QUEUE_DIRNAME, WATCH_QUEUE_DIRNAME)
+        )
+        self.download_angles = download_angles
+        self.start_date = start_date
+        self.end_date = end_date
+        self.days_back = days_back
+        self.days_forward = days_forward
+        self.processing_delay = timedelta(minutes=processing_delay_minutes)
+        self.notify_callback = notify_callback
+        self.ppt_mode = ppt_mode
+        self.slide_extractor = slide_extractor or SlideExtractor()
+        self.faststart_pool = faststart_pool
+        if faststart_pool is None and faststart:
+            self.faststart_pool = FastStartPool()
+        # Slide extractions and remuxes running in the background
+        self.tasks = set()
+        # Download key -> (record id, output path, journal key)
+        self.download_paths = {}
+        # Slide extractions in progress, by path
+        self.started = set()
+        # Downloads handed to a terminal, which report nothing back
+        self.terminal_paths = set()
+        # Record id -> {"record", "attempts", "paths"} of classes whose
+        # downloads are still running
+        self.in_progress = {}
+        self.state_path = os.path.join(
+            download_dir, account_file(STATE_FILENAME, account)
+        )
+        self.done = set()
+        self.pending = {}
+        self._load_state()
+
+    def notify(self, msg, severity="information"):
+        if self.account:
+            msg = f"[{self.account}] {msg}"
+        if self.notify_callback:
+            self.notify_callback(msg, severity=severity)
+        else:
+            stamp = datetime.now().strftime(TIME_FORMAT)
+            print(f"{stamp} [{severity.upper()}] {msg}", flush=True)
+
+    def on_download_event(self, event):
+        if event.kind != "finished":
+            return
+        record_id, path, entry_key = self.download_paths.pop(
+            event.key, (None, None, None)
+        )
+        if event.returncode == 0:
+            self.download_queue.update(
+                entry_key,
+                state=DONE,
+                bytes_done=event.bytes_done,
+                total_bytes=event.total_bytes,
+            )
+            self.notify(f"Finished {event.key}")
+            if path and self.faststart_pool:
+                self.spawn(self.remux(path))
+        else:
+            self.download_queue.update(
+                entry_key, state=PENDING, bytes_done=event.bytes_done
+            )
+            self.notify(
+                f"Download of {event.key} failed (exit code {event.returncode})",
+                severity="error",
+            )
+        if path:
+            self.path_finished(record_id, path, event.returncode == 0)
+
+    def path_finished(self, record_id, path, ok):
+        """Mark the record done once all its paths succeeded; retry on failure."""
+        waiting = self.in_progress.get(record_id)
+        if waiting is None:
+            return
+        if not ok:
+            del self.in_progress[record_id]
+            self.retry(record_id, waiting["record"], waiting["attempts"])
+            return
+        waiting["paths"].discard(path)
+        if not waiting["paths"]:
+            del self.in_progress[record_id]
+            self.finish(record_id)
+
+    def finish(self, record_id):
+        self.done.add(record_id)
+        self._save_state()
+
+    def retry(self, record_id, record, attempts, detail=""):
+        """Poll the record again after the next backoff step, or give up."""
+        attempts += 1
+        if attempts > len(RETRY_MINUTES):
+            self.notify(
+                f"Giving up on {record.get('subjName')} "
+                f"{record.get('courBeginTime')}{detail}",
+                severity="warning",
+            )
+            return
+        self.pending[record_id] = {
+            "record": record,
+            "due": datetime.now() + timedelta(minutes=RETRY_MINUTES[attempts - 1]),
+            "attempts": attempts,
+        }
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def remux(self, path):
+        try:
+            result = await self.faststart_pool.remux(path)
+            if result["moved"]:
+                self.download_queue.record_size(path, os.path.getsize(path))
+        except Exception as e:
+            self.notify(
+                f"Could not remux {os.path.basename(path)} for fast start: {e}",
+                severity="warning",
+            )
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.done = set(json.load(f).get("done", []))
+        except (OSError, ValueError):
+            self.notify("Ignoring unreadable watch state file", severity="warning")
+
+    def _save_state(self):
+        os.makedirs(self.download_dir, exist_ok=True)
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"done": sorted(self.done)}, f)
+        os.replace(temp_path, self.state_path)
+
+    def date_range(self):
+        """(start_date, end_date) to watch, either end None if unbounded."""
+        now = datetime.now()
+        start_date, end_date = self.start_date, self.end_date
+        if self.days_back is not None:
+            start_date = (now - timedelta(days=self.days_back)).strftime(DATE_FORMAT)
+        if self.days_forward is not None:
+            end_date = (now + timedelta(days=self.days_forward)).strftime(DATE_FORMAT)
+        return start_date, end_date
+
+    async def refresh_schedule(self):
+        """Reload the curriculum and schedule a poll for each unseen class."""
+        records = await self.api.fetch_curriculum()
+        start_date, end_date = self.date_range()
+        if start_date and end_date:
+            records = filter_records_by_date(records, start_date, end_date)
+
+        now = datetime.now()
+        added = 0
+        for record in records:
+            record_id = str(record.get("id"))
+            if record_id in self.done or not is_downloadable_record(record):
+                continue
+            if record_id in self.in_progress:
+                continue
+            end = class_end_time(record)
+            if end is None:
+                continue
+            due = end + self.processing_delay
+            if now - due > timedelta(hours=GIVE_UP_HOURS):
+                continue
+            entry = self.pending.get(record_id)
+            if entry is None:
+                self.pending[record_id] = {
+                    "record": record,
+                    "due": due,
+                    "attempts": 0,
+                }
+                added += 1
+            else:
+                # Keep the retry state, but pick up rescheduled classes
+                entry["record"] = record
+                if entry["attempts"] == 0:
+                    entry["due"] = due
+
+        self.notify(
+            f"Schedule refreshed: {len(self.pending)} classes pending ({added} new)"
+        )
+
+    def _download_items(self, record, video_list):
+        safe_time = safe_name(record.get("courBeginTime", "UnknownTime"))
+        items = []
+        for v in video_list:
+            url = v.get("url")
+            if not url or not angle_wanted(v, self.download_angles):
+                continue
+            angle = angle_suffix(v)
+            items.append((url, f"{safe_time}_{angle}.mp4", angle))
+        return items
+
+    def _missing_angles(self, video_list):
+        """Wanted angles listed by the server without a URL yet."""
+        return sorted(
+            angle_suffix(v)
+            for v in video_list
+            if not v.get("url") and angle_wanted(v, self.download_angles)
+        )
+
+    def _running_paths(self):
+        return {job.output_path for job in self.download_pool.active_jobs()}
+
+    def slide_mode(self, angle):
+        if angle != "PPT" or self.ppt_mode == "video":
+            return None
+        if not self.slide_extractor.available:
+            return None
+        return self.ppt_mode
+
+    async def extract_slides(self, record_id, url, video_path, mode):
+        name = os.path.basename(video_path)
+        self.started.add(video_path)
+        try:
+            result = await self.slide_extractor.extract(url, video_path, mode)
+        except Exception as e:
+            self.notify(f"Slide extraction of {name} failed: {e}", severity="error")
+            self.path_finished(record_id, video_path, False)
+            return
+        finally:
+            self.started.discard(video_path)
+        self.notify(f"Kept {result['slides']} slides of {name}")
+        self.path_finished(record_id, video_path, True)
+
+    async def poll(self, record_id):
+        entry = self.pending[record_id]
+        record = entry["record"]
+        video_list = await self.api.fetch_vod_list(record_id)
+        items = self._download_items(record, video_list)
+        missing = self._missing_angles(video_list)
+
+        waiting = set()
+        if items:
+            waiting = await self.submit_items(record_id, record, items)
+
+        del self.pending[record_id]
+        if not items or missing or waiting & self.terminal_paths:
+            # Poll again until every wanted angle has been published (and
+            # terminal downloads, which report nothing, have finished)
+            detail = f" (no {', '.join(missing)})" if items and missing else ""
+            self.retry(record_id, record, entry["attempts"], detail)
+            return
+        if waiting:
+            self.in_progress[record_id] = {
+                "record": record,
+                "attempts": entry["attempts"],
+                "paths": waiting,
+            }
+            return
+        self.finish(record_id)
+
+    async def submit_items(self, record_id, record, items):
+        """
+        Start the downloads (or slide extractions) of a record's videos.
+
+        Returns the paths that are not complete yet.
+        """
+        if self.download_pool.tool == "aria2c":
+            await ensure_tuned(
+                self.downloader_manager.tuning, items[0][0], notify=self.notify
+            )
+
+        course_name = record.get("subjName", "Unknown Course")
+        destination_dir = os.path.join(self.download_dir, safe_name(course_name))
+        # A record is polled again while angles are missing; skip the work
+        # already under way for the others
+        running = self._running_paths() | self.started
+        unfinished = {e["path"] for e in self.download_queue.unfinished()}
+        expected_sizes = self.download_queue.expected_sizes()
+        waiting = set()
+        for url, filename, angle in items:
+            path = os.path.join(destination_dir, filename)
+            if path in running:
+                waiting.add(path)
+                continue
+            slides = self.slide_mode(angle)
+            if slides:
+                if slides_complete(path, slides):
+                    continue
+                self.notify(f"New recording: {course_name} -> slides of {filename}")
+                self.spawn(self.extract_slides(record_id, url, path, slides))
+                waiting.add(path)
+                continue
+            if path in self.terminal_paths:
+                if not is_complete(path):
+                    waiting.add(path)
+                continue
+            # Partial files (aria2 control file, .part, a download that
+            # failed or was cut off) are downloaded again
+            if is_complete(path, unfinished, expected_sizes):
+                continue
+            self.notify(f"New recording: {course_name} -> {filename}")
+            waiting.add(path)
+            if self.download_pool.available:
+                # Keyed by path, as the pool may be shared with other accounts
+                key = os.path.relpath(path, self.download_dir)
+                entry = make_entry(
+                    record_id, angle, url, path, course_name, account=self.account
+                )
+                self.download_queue.add([entry])
+                self.download_queue.update(entry["key"], state=ACTIVE)
+                self.download_pool.submit(
+                    key,
+                    url,
+                    destination_dir,
+                    filename,
+                    on_event=self.on_download_event,
+                )
+                self.download_paths[key] = (record_id, path, entry["key"])
+                continue
+            self.downloader_manager.download_video(
+                video_url=url,
+                destination_dir=destination_dir,
+                output_filename=filename,
+                notify_callback=self.notify_callback,
+            )
+            # Runs in a terminal we cannot follow; do not start it twice
+            self.terminal_paths.add(path)
+        return waiting
+
+    async def run(self):
+        next_refresh = datetime.now()
+        while True:
+            now = datetime.now()
+            if now >= next_refresh:
+                try:
+                    await self.refresh_schedule()
+                except Exception as e:
+                    self.notify(f"Failed to load curriculum: {e}", severity="error")
+                next_refresh = now + timedelta(hours=CURRICULUM_REFRESH_HOURS)
+
+            due = [
+                record_id
+                for record_id, entry in self.pending.items()
+                if entry["due"] <= now
+            ]
+            for record_id in due:
+                try:
+                    await self.poll(record_id)
+                except Exception as e:
+                    self.notify(f"Failed to poll {record_id}: {e}", severity="error")
+                    entry = self.pending.get(record_id)
+                    if entry is not None:
+                        entry["due"] = datetime.now() + timedelta(
+                            minutes=RETRY_MINUTES[0]
+                        )
+
+            wake = min(
+                [entry["due"] for entry in self.pending.values()] + [next_refresh]
+            )
+            delay = (wake - datetime.now()).total_seconds()
+            await asyncio.sleep(min(max(delay, 1), MAX_SLEEP_SECONDS))
+
+
+async def run_watchers(watchers):
+    """Run the watchers of several accounts side by side."""
+    await asyncio.gather(*(watcher.run() for watcher in watchers))